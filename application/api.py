@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, status
 
-from .apps.authentication.dependencies import valid_authentication_header
 from .apps.authentication.dependencies import oauth2_scheme
 
 from .apps.authentication.routes import protected_router as protected_auth_router
 from .apps.authentication.routes import public_router as public_auth_router
 from .apps.public.routes import router as public_router
+from .common.ratelimit import RateLimit
+from .config import settings
 
 
 """-- API ROUTES --------------------------------------------------------------
@@ -18,8 +19,11 @@ They will be executed in order of their appearance.
 # Dependencies used in ALL routers
 DEPENDENCIES: list = []
 
-# Dependencies used for ALL protected routes
-auth_dependencies: list = [Depends(valid_authentication_header), Depends(oauth2_scheme)]
+# Dependencies used for ALL protected routes, authenticates the request once (see `BearerAuthentication`)
+auth_dependencies: list = [Depends(oauth2_scheme)]
+
+# Dependencies used for ALL public routes
+public_dependencies: list = [Depends(RateLimit("public", settings.RATE_LIMIT_PUBLIC))]
 
 # Default responses used by ALL routes
 default_responses: dict = {
@@ -37,7 +41,7 @@ protected.include_router(protected_auth_router)
 
 # ! public routing - be aware: these routes are OPENLY AVAILABLE to the Internet
 public = APIRouter(
-    dependencies=DEPENDENCIES,
+    dependencies=DEPENDENCIES + public_dependencies,
     **defaults
 )
 
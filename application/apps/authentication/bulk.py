@@ -0,0 +1,252 @@
+"""
+Bulk import and export of users (CSV or JSON lines).
+
+    report = import_users(session, read_rows(file, "csv"), executor=executor)
+    for line in export_users(session, "jsonl"):
+        ...
+
+The import works in chunks, one transaction per chunk:
+validate the rows, look up the existing emails (batched IN queries),
+hash the passwords in parallel (pass a ProcessPoolExecutor to use all cores, or the shared `hashing_executor`)
+and insert the chunk with one executemany.
+Invalid rows and existing emails are reported per row, they never abort the import.
+"""
+import csv
+import io
+import json
+from concurrent.futures import Executor
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from .cryptography import PasswordHashingExecutor, generate_uuid, hash_password, pwd_context
+from .models import User, UserCreate
+from .scopes import scope_registry
+
+
+FORMATS = ("csv", "jsonl")
+# the columns of the import and export (the export adds `hashed_password` on request)
+COLUMNS = ("email", "name", "password", "scopes", "disabled", "superuser")
+EXPORT_COLUMNS = ("uid", "email", "name", "scopes", "disabled", "superuser")
+# sqlite allows 999 parameters per statement
+IN_QUERY_BATCH_SIZE = 500
+
+Row = Tuple[int, dict]  # (line number, values)
+HashingExecutor = Union[Executor, PasswordHashingExecutor]
+
+
+class ImportReport:
+    """Progress and result of an import."""
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, email: Optional[str], message: str):
+        self.errors.append({"line": line, "email": email, "error": message})
+
+    def dict(self) -> dict:
+        return {
+            "processed": self.processed, "created": self.created, "failed": len(self.errors), "errors": self.errors,
+        }
+
+
+def guess_format(filename: str) -> str:
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+
+# -- import -------------------------------------------------------------------
+def text_lines(file: BinaryIO, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    The decoded lines of a binary file, with their line endings (like newline="", as the csv module wants it).
+    Uploads are SpooledTemporaryFiles, which can't be wrapped in a TextIOWrapper before python 3.11.
+    """
+    for line in file:
+        yield line.decode(encoding)
+
+
+def read_rows(file: Iterable[str], format: str) -> Iterator[Row]:
+    """
+    Stream the rows of a text file, line by line.
+
+    csv: a header with (some of) the COLUMNS, empty cells are omitted.
+    jsonl: one json object per line.
+    Rows that can't be parsed are yielded as {"__error__": message}.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ("", None)}
+    elif format == "jsonl":
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = {"__error__": f"Invalid json: {error}"}
+            if not isinstance(row, dict):
+                row = {"__error__": "Expected a json object"}
+            yield number, row
+    else:
+        raise ValueError(f"Unknown format {format}, use one of {FORMATS}")
+
+
+def chunked(rows: Iterable[Row], size: int) -> Iterator[List[Row]]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def existing_emails(session: Session, emails: List[str]) -> set:
+    """The emails that exist already, looked up in batches."""
+    found = set()
+    for offset in range(0, len(emails), IN_QUERY_BATCH_SIZE):
+        batch = emails[offset:offset + IN_QUERY_BATCH_SIZE]
+        found.update(session.exec(select(User.email).where(User.email.in_(batch))))
+    return found
+
+
+def validate_row(row: dict) -> dict:
+    """
+    Validate a row like `UserCreate`, return the values to insert, without the password hash yet.
+
+    Instead of `password`, a row may contain an existing bcrypt `hashed_password` (e.g. from an export).
+    """
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    hashed_password = row.pop("hashed_password", None)
+    if hashed_password is not None:
+        if not pwd_context.identify(hashed_password):
+            raise ValueError("hashed_password is not a supported password hash")
+        row["password"] = ""  # not hashed again
+    user = UserCreate(**row)
+    values = user.dict()
+    values["scope_mask"] = scope_registry.mask(user.scopes)  # inserted without the ORM's flush events
+    values["password"] = hashed_password or user.password
+    values["hashed"] = hashed_password is not None
+    return values
+
+
+def hash_passwords(passwords: List[str], executor: Optional[HashingExecutor]) -> List[str]:
+    if executor is None or len(passwords) < 2:
+        return [hash_password(password) for password in passwords]
+    return list(executor.map(hash_password, passwords, chunksize=max(1, len(passwords) // 32)))
+
+
+def import_chunk(session: Session, chunk: List[Row], report: ImportReport, executor: Optional[HashingExecutor]):
+    valid: Dict[str, Tuple[int, dict]] = {}
+    for line, row in chunk:
+        email = row.get("email")
+        try:
+            values = validate_row(dict(row))
+        except (ValidationError, ValueError, TypeError) as error:
+            report.error(line, email, str(error))
+            continue
+        if values["email"] in valid:
+            report.error(line, values["email"], "Duplicated email in the import")
+            continue
+        valid[values["email"]] = (line, values)
+
+    for email in existing_emails(session, list(valid)):
+        line, _ = valid.pop(email)
+        report.error(line, email, f"User with email {email} already exists")
+
+    rows = [values for _, values in valid.values()]
+    plain = [values for values in rows if not values["hashed"]]
+    for values, hashed in zip(plain, hash_passwords([values["password"] for values in plain], executor)):
+        values["password"] = hashed
+    for values in rows:
+        del values["hashed"]
+        values["uid"] = generate_uuid()
+
+    if rows:
+        try:
+            session.execute(User.__table__.insert(), rows)
+            session.commit()
+        except IntegrityError:
+            # created concurrently, since the lookup: retry the chunk without those
+            session.rollback()
+            for email in existing_emails(session, list(valid)):
+                line, _ = valid.pop(email)
+                report.error(line, email, f"User with email {email} already exists")
+            rows = [values for _, values in valid.values()]
+            if rows:
+                session.execute(User.__table__.insert(), rows)
+                session.commit()
+    report.created += len(rows)
+    report.processed += len(chunk)
+
+
+def import_users(
+    session: Session,
+    rows: Iterable[Row],
+    chunk_size: int = 1000,
+    executor: Optional[HashingExecutor] = None,
+    progress: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    """
+    Import the rows (see `read_rows`), one transaction per chunk.
+
+    executor: hashes the passwords, use a ProcessPoolExecutor to hash on all cores,
+    or the `hashing_executor` of the requests (see `PasswordHashingExecutor.map`).
+    progress: called with the report after every chunk.
+    """
+    report = ImportReport()
+    for chunk in chunked(rows, chunk_size):
+        import_chunk(session, chunk, report, executor)
+        if progress is not None:
+            progress(report)
+    return report
+
+
+# -- export -------------------------------------------------------------------
+def iterate_users(session: Session, chunk_size: int = 1000) -> Iterator[dict]:
+    """
+    All users as dicts, ordered by email, loaded chunk by chunk (keyset pagination on the unique email index).
+    """
+    table = User.__table__
+    last_email = None
+    while True:
+        statement = table.select().order_by(table.c.email).limit(chunk_size)
+        if last_email is not None:
+            statement = statement.where(table.c.email > last_email)
+        rows = session.execute(statement).mappings().all()
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+        last_email = rows[-1]["email"]
+
+
+def export_users(
+    session: Session, format: str, chunk_size: int = 1000, hashed_passwords: bool = False
+) -> Iterator[str]:
+    """
+    Stream the users as lines of csv or json (hashed_passwords: include them, to import them elsewhere).
+    """
+    columns = EXPORT_COLUMNS + (("hashed_password",) if hashed_passwords else ())
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format}, use one of {FORMATS}")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore", lineterminator="\n")
+
+    def csv_line(row: Optional[dict] = None) -> str:
+        writer.writerow(row) if row is not None else writer.writeheader()
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    if format == "csv":
+        yield csv_line()
+    for user in iterate_users(session, chunk_size=chunk_size):
+        user["hashed_password"] = user["password"]
+        if format == "jsonl":
+            yield json.dumps({column: user[column] for column in columns}) + "\n"
+        else:
+            yield csv_line(user)
@@ -0,0 +1,186 @@
+"""
+Verified-token cache for `dependencies.BearerAuthentication`.
+
+Clients call the protected routes many times with the same token. A cache hit skips
+the jwt decoding, the payload validation and the user lookup in the database.
+
+The entries live in the cache tier (`common.cache`), with the memcached backend they are
+shared by all workers. Every user has a generation in the cache, changing the user bumps it
+and invalidates all cached tokens of the user in all workers at once.
+The `a`-methods keep the memcached round trips off the event loop, a failing memcached is a cache miss.
+"""
+import hashlib
+import secrets
+import time
+from typing import Optional
+
+from sqlalchemy.orm import class_mapper, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.instrumentation import manager_of_class
+
+from ...config import settings
+from ...common.cache import CacheBackend, get_cache, off_the_event_loop
+
+from .models import TokenPayload, User
+
+
+# bump it when the entries change (e.g. a new column of the user), workers of the previous
+# deployment may still share the memcached entries during a rolling restart
+ENTRY_VERSION = 5
+
+# never cached: the password hash would be shared with everyone who can reach the memcached servers
+SNAPSHOT_EXCLUDED = {"password"}
+
+
+def user_snapshot(user: User) -> dict:
+    """
+    The column values of a user, without the password hash.
+    Like the users of stateless tokens, the password is loaded once the user is added to a session.
+    """
+    return {key: getattr(user, key) for key in User.__fields__ if key not in SNAPSHOT_EXCLUDED}
+
+
+def user_from_snapshot(snapshot: dict) -> User:
+    """
+    Rebuild a detached user from a snapshot, the way the ORM loads rows:
+    without validation (and without hashing the password again).
+    Adding it to a session makes it persistent without another query.
+    """
+    class_mapper(User)  # configures the mappers, if no query did yet
+    user = manager_of_class(User).new_instance()
+    for key, value in snapshot.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return user
+
+
+class CachedToken:
+    __slots__ = ("payload", "snapshot")
+
+    def __init__(self, payload: TokenPayload, snapshot: dict):
+        self.payload = payload
+        self.snapshot = snapshot
+
+    @property
+    def user(self) -> User:
+        """A fresh user instance per request, so changes never leak into the cache."""
+        return user_from_snapshot(self.snapshot)
+
+
+class TokenCache:
+    """
+    Cache of verified tokens, keyed by the token's hash.
+
+    Entries expire after `ttl` seconds, but never later than the token's `exp`.
+    Changes to a user invalidate all cached tokens of that user (see `crud`).
+    """
+
+    def __init__(self, ttl: int, backend: Optional[CacheBackend] = None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._backend = backend
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = get_cache()
+        return self._backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return f"token:{ENTRY_VERSION}:" + hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def generation_key(email: str) -> str:
+        return f"token-generation:{email}"
+
+    def generation(self, email: str) -> Optional[int]:
+        """
+        The user's current generation, read it before loading the user and pass it to `set`.
+        """
+        if not self.enabled:
+            return None
+        key = self.generation_key(email)
+        generation = self.backend.get(key)
+        if generation is None:
+            # random start, a restarted memcached must not hand out a generation again
+            self.backend.add(key, secrets.randbelow(2 ** 31), ttl=0)
+            generation = self.backend.get(key)
+        return generation
+
+    def get(self, token: str) -> Optional[CachedToken]:
+        if not self.enabled:
+            return None
+        entry = self.backend.get(self.key(token))
+        if entry is None or entry["expires_at"] <= time.time() or (
+            self.backend.get(self.generation_key(entry["email"])) != entry["generation"]
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # validated before caching
+        payload = TokenPayload.construct(
+            email=entry["email"], scopes=entry["scopes"], scope_mask=entry["scope_mask"],
+            token_id=entry["token_id"], issued_at=entry["issued_at"],
+        )
+        return CachedToken(payload=payload, snapshot=entry["user"])
+
+    def set(self, token: str, payload: TokenPayload, user: User, exp: float, generation: Optional[int]):
+        """
+        Cache a verified token with the user it belongs to.
+
+        Pass the `generation` read before the user was loaded: if the user has been changed
+        meanwhile, the entry is never served.
+        """
+        if not self.enabled or generation is None:
+            return
+        ttl = min(self.ttl, int(exp - time.time()))
+        if ttl <= 0:
+            return
+        entry = {
+            "email": payload.email,
+            "scopes": payload.scopes,
+            "scope_mask": payload.scope_mask,
+            "token_id": payload.token_id,
+            "issued_at": payload.issued_at,
+            "user": user_snapshot(user),
+            "expires_at": exp,
+            "generation": generation,
+        }
+        self.backend.set(self.key(token), entry, ttl=ttl)
+
+    def invalidate_user(self, email: str):
+        """Drop all cached tokens of the user."""
+        if self.enabled:
+            self.backend.incr(self.generation_key(email))
+
+    async def ageneration(self, email: str) -> Optional[int]:
+        return await off_the_event_loop(self.backend, self.generation, email) if self.enabled else None
+
+    async def aget(self, token: str) -> Optional[CachedToken]:
+        return await off_the_event_loop(self.backend, self.get, token) if self.enabled else None
+
+    async def aset(self, token: str, payload: TokenPayload, user: User, exp: float, generation: Optional[int]):
+        if self.enabled and generation is not None:
+            await off_the_event_loop(self.backend, self.set, token, payload, user, exp, generation)
+
+    async def ainvalidate_user(self, email: str):
+        if self.enabled:
+            await off_the_event_loop(self.backend, self.invalidate_user, email)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache(ttl=settings.TOKEN_CACHE_TTL)
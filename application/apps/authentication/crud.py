@@ -1,18 +1,53 @@
 import uuid
-from typing import List
+from itertools import islice
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
 from sqlmodel import select, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi.concurrency import run_in_threadpool
 
 from pydantic import EmailStr
 from pydantic.error_wrappers import ValidationError
 
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.exc import NoResultFound, IntegrityError
 from sqlalchemy.orm.exc import ObjectDeletedError
 
+from ...database.dependencies import AnySession
+from ...common.timing import timed, phase
+from ...common.pagination import StartsWith, next_cursor
+
 from .models import User, UserCreate, UserUpdate
-from .exceptions import bypass_email_validation_error
-from .cryptography import hash_password
+from .exceptions import bypass_email_validation_error, email_does_exist_error
+from .cryptography import hash_password, ahash_password, HashedPassword
+from .cache import token_cache
+from .revocation import revocation_list
+
+
+def revoke_tokens(session: AnySession, user: User):
+    """
+    Revoke the user's tokens issued until now, committed with the user: the token version is incremented
+    (rejects the refresh tokens) and the user's email added to the revoked tokens (rejects all, see `revocation`).
+    A new password and changes of the user's rights revoke them, other changes reach the tokens at the next refresh.
+    """
+    user.token_version = (user.token_version or 0) + 1
+    revocation_list.revoke_subject(session, user.email)
 
 
+# the user's rights: the cached users of other workers (with CACHE_BACKEND=memory) keep the old values,
+# only the revocations reach all workers (after up to REVOCATION_REFRESH_SECONDS)
+REVOKING_FIELDS = ("password", "disabled", "scopes", "superuser")
+
+
+def apply_update(session: AnySession, db_user: User, user: UserUpdate):
+    """Set the given fields, the tokens are revoked if the user's password or rights change."""
+    revoke = False
+    for key, value in user.dict(exclude_none=True).items():
+        revoke = revoke or (key in REVOKING_FIELDS and (key == "password" or getattr(db_user, key) != value))
+        setattr(db_user, key, value)
+    if revoke:
+        revoke_tokens(session, db_user)
+
+
+@timed("db")
 def get_user_by_email(session: Session, email: EmailStr) -> User | None:
     """
     Get user by email.
@@ -26,6 +61,16 @@ def get_user_by_email(session: Session, email: EmailStr) -> User | None:
     return user
 
 
+@timed("db")
+def email_exists(session: Session, email: EmailStr) -> bool:
+    """
+    Check if a user with this email exists (a single lookup on the unique email index).
+    """
+    statement = select(User.uid).where(User.email == email).limit(1)
+    return session.exec(statement).first() is not None
+
+
+@timed("db")
 def get_user_by_uid(session: Session, uid: str) -> User | None:
     """
     Get user by uuid.
@@ -39,6 +84,7 @@ def get_user_by_uid(session: Session, uid: str) -> User | None:
     return user
 
 
+@timed("db")
 def get_users(session: Session) -> List[User]:
     """
     Get all users.
@@ -48,6 +94,47 @@ def get_users(session: Session) -> List[User]:
     return list(users)
 
 
+USER_PAGE_ORDERS = ("email", "uid")
+
+
+def users_page_statement(limit: int, after: Any = None, order: str = "email", q: Optional[str] = None):
+    """
+    One page of users, ordered by the (unique) email or uid, starting after the last key of the previous page.
+    q: only emails starting with it, a range on the email index in sqlite (see `common.pagination.StartsWith`).
+    One row more than the limit is selected, to know if there is a next page.
+    """
+    if order not in USER_PAGE_ORDERS:
+        raise ValueError(f"Unknown order {order}, use one of {USER_PAGE_ORDERS}")
+    column = getattr(User, order)
+    statement = select(User).order_by(column).limit(limit + 1)
+    if after is not None:
+        statement = statement.where(column > after)
+    if q:
+        statement = statement.where(StartsWith(User.email, q))
+    return statement
+
+
+@timed("db")
+def get_users_page(
+    session: Session, limit: int, after: Any = None, order: str = "email", q: Optional[str] = None
+) -> Tuple[List[User], Optional[str]]:
+    """
+    Get a page of users (keyset pagination) and the cursor of the next page, None on the last page.
+    """
+    users = session.exec(users_page_statement(limit=limit, after=after, order=order, q=q))
+    return next_cursor(list(users), limit=limit, order=order)
+
+
+def iterate_users(session: Session, yield_per: int = 1000) -> Iterator[User]:
+    """
+    Iterate over all users, ordered by email, fetching `yield_per` rows at a time instead of loading them all.
+    See `common.responses.StreamingJSONResponse`.
+    """
+    statement = select(User).order_by(User.email).execution_options(yield_per=yield_per)
+    yield from session.exec(statement)
+
+
+@timed("db")
 def update_user(session: Session, user: UserUpdate) -> User:
     """
     Update user.
@@ -57,12 +144,12 @@ def update_user(session: Session, user: UserUpdate) -> User:
         raise NoResultFound(f"User with email {user.email} does not exist")
 
     # update
-    for key, value in user.dict(exclude_none=True).items():
-        setattr(db_user, key, value)
+    apply_update(session, db_user, user)
 
     # commit
     session.add(db_user)
     session.commit()
+    token_cache.invalidate_user(user.email)
     session.refresh(db_user)
     return db_user
 
@@ -72,23 +159,48 @@ def update_user_password(session: Session, user: User, new_password: str) -> Use
     """
     # Hash the new-password before update
     hashed = hash_password(new_password)
+    revoke_tokens(session, user)
+    return update_user_password_hash(session=session, user=user, hashed_password=hashed)
+
+@timed("db")
+def update_user_password_hash(session: Session, user: User, hashed_password: str) -> User:
+    """
+    Update user password with an already hashed password.
+    """
     # Update the password
-    user.password = hashed
+    user.password = hashed_password
     session.add(user)
     # Commit the session
     session.commit()
+    token_cache.invalidate_user(user.email)
     session.refresh(user)
     return user
 
 def create_user(session: Session, user: UserCreate) -> User:
     """
     Create a new user.
+
+    The email's uniqueness is enforced by the unique index on `user.email`.
+    A violation is raised as ValidationError for the email field (see `bypass_email_validation_error`).
     """
     db_user = User.from_orm(user)
-    session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
-    return db_user
+    return insert_user(session=session, user=db_user)
+
+@timed("db")
+def insert_user(session: Session, user: User) -> User:
+    """
+    Insert a validated user (with a hashed password) into the database.
+    """
+    session.add(user)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        if not email_exists(session=session, email=user.email):
+            raise
+        raise email_does_exist_error(email=user.email, model=User)
+    session.refresh(user)
+    return user
 
 def get_or_create_user(session: Session, user: UserCreate) -> User:
     """
@@ -99,17 +211,205 @@ def get_or_create_user(session: Session, user: UserCreate) -> User:
     except ValidationError as e:
         bypass_email_validation_error(e)
         user = get_user_by_email(session=session, email=user.email)
+    return user
 
+@timed("db")
 def delete_user(session: Session, user: User) -> bool:
     """
     Delete user.
 
     returns True if user was deleted, False if user was not found.
     """
+    email = user.email
     try:
         session.delete(user)
+        revocation_list.revoke_subject(session, email)
         session.commit()
     except ObjectDeletedError:
         session.rollback()
         return False
+    token_cache.invalidate_user(email)
+    return True
+
+
+# -- async CRUD ---------------------------------------------------------------
+# Awaiting an AsyncSession, or running the blocking functions above in the threadpool,
+# so the database calls never block the event loop.
+
+@timed("db")
+async def aget_user_by_email(session: AnySession, email: EmailStr) -> User | None:
+    """
+    Get user by email.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(get_user_by_email, session=session, email=email)
+    statement = select(User).where(User.email == email)
+    users = await session.exec(statement)
+    try:
+        user = users.one()
+    except NoResultFound:
+        return None
+    return user
+
+
+@timed("db")
+async def aemail_exists(session: AnySession, email: EmailStr) -> bool:
+    """
+    Check if a user with this email exists.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(email_exists, session=session, email=email)
+    statement = select(User.uid).where(User.email == email).limit(1)
+    return (await session.exec(statement)).first() is not None
+
+
+@timed("db")
+async def aget_user_by_uid(session: AnySession, uid: str) -> User | None:
+    """
+    Get user by uuid.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(get_user_by_uid, session=session, uid=uid)
+    statement = select(User).where(User.uid == uid)
+    users = await session.exec(statement)
+    try:
+        user = users.one()
+    except NoResultFound:
+        return None
+    return user
+
+
+@timed("db")
+async def aget_users(session: AnySession) -> List[User]:
+    """
+    Get all users.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(get_users, session=session)
+    statement = select(User)
+    users = await session.exec(statement)
+    return list(users)
+
+
+async def aiterate_users(session: AnySession, yield_per: int = 1000) -> AsyncIterator[User]:
+    """
+    Iterate over all users, ordered by email, streaming `yield_per` rows at a time.
+    """
+    if not isinstance(session, AsyncSession):
+        users = iterate_users(session, yield_per=yield_per)
+        while chunk := await run_in_threadpool(list, islice(users, yield_per)):
+            for user in chunk:
+                yield user
+        return
+    statement = select(User).order_by(User.email).execution_options(yield_per=yield_per)
+    async for user in await session.stream_scalars(statement):
+        yield user
+
+
+@timed("db")
+async def aget_users_page(
+    session: AnySession, limit: int, after: Any = None, order: str = "email", q: Optional[str] = None
+) -> Tuple[List[User], Optional[str]]:
+    """
+    Get a page of users (keyset pagination) and the cursor of the next page, None on the last page.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(get_users_page, session=session, limit=limit, after=after, order=order, q=q)
+    users = await session.exec(users_page_statement(limit=limit, after=after, order=order, q=q))
+    return next_cursor(list(users), limit=limit, order=order)
+
+
+@timed("db")
+async def aupdate_user(session: AnySession, user: UserUpdate) -> User:
+    """
+    Update user.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(update_user, session=session, user=user)
+    db_user = await aget_user_by_email(session=session, email=user.email)
+    if db_user is None:
+        raise NoResultFound(f"User with email {user.email} does not exist")
+
+    # update
+    apply_update(session, db_user, user)
+
+    # commit
+    session.add(db_user)
+    await session.commit()
+    await token_cache.ainvalidate_user(user.email)
+    await session.refresh(db_user)
+    return db_user
+
+
+async def aupdate_user_password(session: AnySession, user: User, new_password: str) -> User:
+    """
+    Update user password, hashed in the password hashing executor.
+    """
+    hashed = await ahash_password(new_password)
+    revoke_tokens(session, user)
+    return await aupdate_user_password_hash(session=session, user=user, hashed_password=hashed)
+
+
+@timed("db")
+async def aupdate_user_password_hash(session: AnySession, user: User, hashed_password: str) -> User:
+    """
+    Update user password with an already hashed password.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(
+            update_user_password_hash, session=session, user=user, hashed_password=hashed_password
+        )
+    user.password = hashed_password
+    session.add(user)
+    await session.commit()
+    await token_cache.ainvalidate_user(user.email)
+    await session.refresh(user)
+    return user
+
+
+async def acreate_user(session: AnySession, user: UserCreate) -> User:
+    """
+    Create a new user.
+
+    Raises a ValidationError for the email field on duplicated emails, see `create_user`.
+    The email is looked up before hashing the password, also because a rollback expires
+    all objects of an AsyncSession, which could not be refreshed lazily afterwards.
+    """
+    if await aemail_exists(session=session, email=user.email):
+        raise email_does_exist_error(email=user.email, model=User)
+    hashed = HashedPassword(await ahash_password(user.password))
+    db_user = User.from_orm(user, update={"password": hashed})
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(insert_user, session=session, user=db_user)
+    with phase("db"):
+        session.add(db_user)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            if not await aemail_exists(session=session, email=user.email):
+                raise
+            raise email_does_exist_error(email=user.email, model=User)
+        await session.refresh(db_user)
+    return db_user
+
+
+@timed("db")
+async def adelete_user(session: AnySession, user: User) -> bool:
+    """
+    Delete user.
+
+    returns True if user was deleted, False if user was not found.
+    """
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(delete_user, session=session, user=user)
+    email = user.email
+    try:
+        await session.delete(user)
+        revocation_list.revoke_subject(session, email)
+        await session.commit()
+    except ObjectDeletedError:
+        await session.rollback()
+        return False
+    await token_cache.ainvalidate_user(email)
     return True
@@ -1,41 +1,137 @@
+import asyncio
+import base64
+import binascii
+import calendar
+import hashlib
+import hmac
+import json
 import secrets
+import threading
+import time
 import uuid
 import logging
 
-from typing import Optional
+from collections import deque
+from typing import Optional, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
 from datetime import datetime, timedelta
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
 from passlib.context import CryptContext
 from passlib.exc import UnknownHashError
 
-from jose import jwt
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+from jose import JWTError, jwk
+from jose import jwt as jose_jwt
 
 from ...config import settings
+from ...common.metrics import password_hashing_timer
+
+from .exceptions import InvalidToken, PasswordHashingUnavailable
 
 
 log = logging.getLogger('application')
 
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    bcrypt__default_rounds=13,
-    deprecated="auto",
-)
+# cost profiles, pick one with settings.PASSWORD_HASHING_PROFILE, `cc calibrate-hashing` measures them on the host
+# bcrypt: rounds (log2 of the iterations)
+# argon2 (argon2id): rounds (time cost), memory_cost (KiB), parallelism, the minimum follows the OWASP recommendation,
+# one lane per hash: the hashing executor already runs a hash per core
+PASSWORD_HASHING_PROFILES: Dict[str, Dict[str, dict]] = {
+    "minimum": {
+        "bcrypt": {"rounds": 10},
+        "argon2": {"rounds": 2, "memory_cost": 19_456, "parallelism": 1},
+    },
+    "moderate": {
+        "bcrypt": {"rounds": 12},
+        "argon2": {"rounds": 3, "memory_cost": 65_536, "parallelism": 1},
+    },
+    "strong": {
+        "bcrypt": {"rounds": 13},
+        "argon2": {"rounds": 4, "memory_cost": 131_072, "parallelism": 1},
+    },
+}
+PASSWORD_HASHING_SCHEMES = ("bcrypt", "argon2")
+
+
+def password_hashing_parameters(scheme: str, profile: str, **overrides) -> dict:
+    """The profile's parameters of the scheme, overridden by the given ones that are not None."""
+    if scheme not in PASSWORD_HASHING_SCHEMES:
+        raise ValueError(f"Unknown password hashing scheme: {scheme}")
+    if profile not in PASSWORD_HASHING_PROFILES:
+        raise ValueError(f"Unknown password hashing profile: {profile}")
+    parameters = dict(PASSWORD_HASHING_PROFILES[profile][scheme])
+    parameters.update((key, value) for key, value in overrides.items() if value is not None and key in parameters)
+    return parameters
+
+
+def password_hashing_options(scheme: str, profile: str, **overrides) -> dict:
+    """
+    CryptContext options hashing with the scheme's parameters.
+
+    Hashes of the other scheme, or with other rounds or memory cost (higher or lower), need an update:
+    they are rehashed on the next successful login (see `verify_and_update_password`).
+    """
+    options = {
+        "schemes": [scheme] + [other for other in PASSWORD_HASHING_SCHEMES if other != scheme],
+        "deprecated": "auto",
+    }
+    for key, value in password_hashing_parameters(scheme, profile, **overrides).items():
+        if key == "rounds":
+            for bound in ("default_rounds", "min_rounds", "max_rounds"):
+                options[f"{scheme}__{bound}"] = value
+        else:
+            options[f"{scheme}__{key}"] = value
+    return options
+
+
+def configured_password_hashing_options() -> dict:
+    bcrypt = settings.PASSWORD_HASHING_SCHEME == "bcrypt"
+    return password_hashing_options(
+        settings.PASSWORD_HASHING_SCHEME,
+        settings.PASSWORD_HASHING_PROFILE,
+        rounds=settings.PASSWORD_BCRYPT_ROUNDS if bcrypt else settings.PASSWORD_ARGON2_TIME_COST,
+        memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+        parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+    )
+
+
+# use `pwd_context.load(password_hashing_options(...))` to change it in place
+pwd_context = CryptContext(**configured_password_hashing_options())
+# fail at startup, if the configured scheme's library (e.g. argon2-cffi) is missing
+pwd_context.handler().get_backend()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
-        verified = pwd_context.verify(plain_password, hashed_password)
+        with password_hashing_timer("verify"):
+            verified = pwd_context.verify(plain_password, hashed_password)
     except UnknownHashError:
         log.exception("Password in the database is not a valid hash.")
         verified = False
     return verified
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify the password, return whether it matches and a new hash, if the hash needs an update
+    (another scheme or other costs than configured), else None.
+    """
+    try:
+        with password_hashing_timer("verify"):
+            return pwd_context.verify_and_update(plain_password, hashed_password)
+    except UnknownHashError:
+        log.exception("Password in the database is not a valid hash.")
+        return False, None
+
+
 def dummy_verify():
     """
     Helper that is called when user wasn’t found, in order to simulate time it would take to hash a password.
     Protection against timing attacks.
     """
-    return pwd_context.dummy_verify()
+    with password_hashing_timer("verify"):
+        return pwd_context.dummy_verify()
 
 
 def hash_password(password: str) -> str:
@@ -44,7 +140,161 @@ def hash_password(password: str) -> str:
     
     Uses salt_chars=passlib.utils.binary.HASH64_CHARS.
     """
-    return pwd_context.hash(password)
+    with password_hashing_timer("hash"):
+        return pwd_context.hash(password)
+
+
+# the bulk jobs wait this long for a slot, when the requests saturate the hashing executor
+SATURATED_RETRY_SECONDS = 0.05
+
+
+class PasswordHashingExecutor:
+    """
+    Bounded worker pool, running the costly password hashing off the event loop.
+
+    kind: "thread" (bcrypt releases the GIL) or "process".
+    max_pending: jobs running or waiting for a worker, before new ones are rejected
+    with PasswordHashingUnavailable (answered with a 503), instead of queueing up latency.
+    """
+
+    def __init__(self, workers: int, kind: str = "thread", max_pending: int = 32):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hashing executor: {kind}")
+        self.workers = workers
+        self.kind = kind
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        """The pool is started on first use."""
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hashing")
+        return self._executor
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, function: Callable, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise PasswordHashingUnavailable(f"{self.pending} password hashing jobs pending")
+            self.pending += 1
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        # released when the job is done, even if the awaiting request got cancelled
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, function: Callable, *args):
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+    def map(self, function: Callable, items: Iterable, chunksize: int = 1) -> Iterator:
+        """
+        Like `Executor.map`, for bulk jobs from a thread (the user import), one job per item.
+
+        At most `workers` of them are pending at once, the rest of max_pending is left to the requests.
+        When the requests saturate the pool, the bulk jobs wait for a slot instead of being rejected.
+        `chunksize` is accepted for the signature of `Executor.map`, and ignored.
+        """
+        window = max(1, min(self.workers, self.max_pending // 2))
+        futures: Deque[Future] = deque()
+        for item in items:
+            if len(futures) >= window:
+                yield futures.popleft().result()
+            while True:
+                try:
+                    futures.append(self.submit(function, item))
+                    break
+                except PasswordHashingUnavailable:
+                    if futures:
+                        yield futures.popleft().result()
+                    else:
+                        time.sleep(SATURATED_RETRY_SECONDS)
+        while futures:
+            yield futures.popleft().result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_executor = PasswordHashingExecutor(
+    workers=settings.PASSWORD_HASHING_WORKERS,
+    kind=settings.PASSWORD_HASHING_EXECUTOR,
+    max_pending=settings.PASSWORD_HASHING_MAX_PENDING,
+)
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password in the hashing executor."""
+    return await hashing_executor.run(verify_password, plain_password, hashed_password)
+
+
+async def averify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password in the hashing executor."""
+    return await hashing_executor.run(verify_and_update_password, plain_password, hashed_password)
+
+
+async def adummy_verify():
+    """dummy_verify in the hashing executor."""
+    return await hashing_executor.run(dummy_verify)
+
+
+async def ahash_password(password: str) -> str:
+    """hash_password in the hashing executor."""
+    return await hashing_executor.run(hash_password, password)
+
+
+def measure_password_hashing(scheme: str, parameters: dict, samples: int = 3) -> float:
+    """The median seconds to hash a password with the parameters."""
+    context = CryptContext(**password_hashing_options(scheme, "minimum", **parameters))
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash(secrets.token_urlsafe(16))
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2]
+
+
+def calibrate_password_hashing(scheme: str, target: float, samples: int = 3) -> List[Tuple[dict, float]]:
+    """
+    Measure the scheme's costs on this host, from cheap to expensive, until a hash takes twice the target (seconds).
+    bcrypt: rounds 8-16, argon2: time costs 1-10 with the memory costs of the profiles.
+    """
+    if scheme == "bcrypt":
+        candidates = [{"rounds": rounds} for rounds in range(8, 17)]
+    elif scheme == "argon2":
+        memory_costs = sorted({profile["argon2"]["memory_cost"] for profile in PASSWORD_HASHING_PROFILES.values()})
+        candidates = [
+            {"rounds": rounds, "memory_cost": memory_cost, "parallelism": 1}
+            for memory_cost in memory_costs for rounds in range(1, 11)
+        ]
+    else:
+        raise ValueError(f"Unknown password hashing scheme: {scheme}")
+
+    results = []
+    too_slow_memory_cost = None
+    for parameters in candidates:
+        if parameters.get("memory_cost", 0) == too_slow_memory_cost:
+            continue  # more rounds with the same memory cost only get slower
+        duration = measure_password_hashing(scheme, parameters, samples=samples)
+        results.append((parameters, duration))
+        if duration > 2 * target:
+            if scheme == "bcrypt":
+                break
+            too_slow_memory_cost = parameters["memory_cost"]
+    return results
 
 
 def compare_hashed_passwords(hashed_password: str, another_hashed_password: str) -> bool:
@@ -52,9 +302,242 @@ def compare_hashed_passwords(hashed_password: str, another_hashed_password: str)
     return secrets.compare_digest(hashed_password, another_hashed_password)
 
 
+# -- json web tokens ----------------------------------------------------------
+# HMAC with the SECRET_KEY, or asymmetric with JWT_PRIVATE_KEY (signing) and JWT_PUBLIC_KEY (verifying)
+TOKEN_ALGORITHMS = {
+    "HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512,
+    "RS256": None, "ES256": None, "EdDSA": None,
+}
+NUMERIC_DATE_CLAIMS = ("exp", "nbf", "iat")
+
+
+def b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def numeric_dates(claims: dict) -> dict:
+    """datetimes of the registered claims as seconds since the epoch (naive datetimes are utc)."""
+    return {
+        key: (
+            calendar.timegm(value.utctimetuple())
+            if key in NUMERIC_DATE_CLAIMS and isinstance(value, datetime) else value
+        )
+        for key, value in claims.items()
+    }
+
+
+def validate_claims(claims: dict, leeway: float = 0):
+    """One pass over the registered claims: `exp` is required and must lie ahead, `nbf` behind."""
+    if not isinstance(claims, dict):
+        raise InvalidToken("The claims are not an object.")
+    now = time.time()
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)) or isinstance(exp, bool):
+        raise InvalidToken("The exp claim is missing or not a number.")
+    if exp <= now - leeway:
+        raise InvalidToken("The token has expired.")
+    nbf = claims.get("nbf")
+    if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now + leeway):
+        raise InvalidToken("The token is not valid yet.")
+
+
+def load_token_keys(algorithm: str, secret_key: str, private_key: Optional[str], public_key: Optional[str]):
+    """
+    The (signing, verifying) keys, parsed once: bytes for HMAC, else `cryptography` key objects from PEM.
+    The verifying key is derived from the private key, unless given.
+    Without a private key, tokens can only be verified.
+    """
+    if algorithm not in TOKEN_ALGORITHMS:
+        raise ValueError(f"Unsupported jwt algorithm: {algorithm}")
+    if algorithm.startswith("HS"):
+        return secret_key.encode(), secret_key.encode()
+    if private_key is None and public_key is None:
+        raise ValueError(f"{algorithm} needs JWT_PRIVATE_KEY or JWT_PUBLIC_KEY")
+    signing = serialization.load_pem_private_key(private_key.encode(), password=None) if private_key else None
+    verifying = serialization.load_pem_public_key(public_key.encode()) if public_key else signing.public_key()
+    expected = {"RS256": rsa.RSAPublicKey, "ES256": ec.EllipticCurvePublicKey, "EdDSA": ed25519.Ed25519PublicKey}
+    if not isinstance(verifying, expected[algorithm]):
+        raise ValueError(f"The jwt keys don't fit {algorithm}")
+    if algorithm == "ES256" and verifying.curve.name != "secp256r1":
+        raise ValueError(f"The jwt keys don't fit {algorithm}")
+    return signing, verifying
+
+
+class TokenCodec:
+    """
+    Signs claims into json web tokens and verifies them, with one algorithm and keys parsed once.
+
+    `decode` returns the claims, it raises InvalidToken for bad signatures, other algorithms,
+    expired tokens (`exp` is required) or tokens not valid yet (`nbf`).
+    """
+    name = ""
+
+    def __init__(
+        self, algorithm: str, secret_key: str, private_key: str = None, public_key: str = None, leeway: float = 0
+    ):
+        self.algorithm = algorithm
+        self.leeway = leeway
+        self.signing_key, self.verifying_key = load_token_keys(algorithm, secret_key, private_key, public_key)
+
+    def encode(self, claims: dict) -> str:
+        raise NotImplementedError
+
+    def decode(self, token: str) -> dict:
+        raise NotImplementedError
+
+
+class NativeTokenCodec(TokenCodec):
+    """
+    hmac (stdlib) or `cryptography` directly, for the one configured algorithm: the header is serialized once,
+    and tokens carrying exactly that header skip parsing it.
+    """
+    name = "native"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._header = b64encode(json.dumps({"alg": self.algorithm, "typ": "JWT"}, separators=(",", ":")).encode())
+        digest = TOKEN_ALGORITHMS[self.algorithm]
+        self._hmac = hmac.new(self.signing_key, digestmod=digest) if digest else None
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        if self._hmac is not None:
+            mac = self._hmac.copy()
+            mac.update(signing_input)
+            return mac.digest()
+        if self.signing_key is None:
+            raise ValueError("Tokens can't be signed without JWT_PRIVATE_KEY")
+        if self.algorithm == "ES256":
+            r, s = decode_dss_signature(self.signing_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+            return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        if self.algorithm == "RS256":
+            return self.signing_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        return self.signing_key.sign(signing_input)
+
+    def _verify(self, signing_input: bytes, signature: bytes) -> bool:
+        if self._hmac is not None:
+            return hmac.compare_digest(self._sign(signing_input), signature)
+        try:
+            if self.algorithm == "ES256":
+                if len(signature) != 64:
+                    return False
+                r, s = int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big")
+                der = encode_dss_signature(r, s)
+                self.verifying_key.verify(der, signing_input, ec.ECDSA(hashes.SHA256()))
+            elif self.algorithm == "RS256":
+                self.verifying_key.verify(signature, signing_input, padding.PKCS1v15(), hashes.SHA256())
+            else:
+                self.verifying_key.verify(signature, signing_input)
+        except InvalidSignature:
+            return False
+        return True
+
+    def encode(self, claims: dict) -> str:
+        payload = json.dumps(numeric_dates(claims), separators=(",", ":")).encode()
+        signing_input = self._header + b"." + b64encode(payload)
+        return (signing_input + b"." + b64encode(self._sign(signing_input))).decode()
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, _, signature = token.encode().rpartition(b".")
+            header, _, payload = signing_input.partition(b".")
+            if header != self._header:
+                # another library's serialization of the header
+                fields = json.loads(b64decode(header))
+                if fields.get("alg") != self.algorithm or "crit" in fields:
+                    raise InvalidToken("The token's algorithm is not allowed.")
+            if not payload or not self._verify(signing_input, b64decode(signature)):
+                raise InvalidToken("Signature verification failed.")
+            claims = json.loads(b64decode(payload))
+        except InvalidToken:
+            raise
+        except (ValueError, TypeError, AttributeError, binascii.Error) as error:
+            raise InvalidToken("The token is malformed.") from error
+        validate_claims(claims, self.leeway)
+        return claims
+
+
+class JoseTokenCodec(TokenCodec):
+    """python-jose with keys constructed once, it supports no EdDSA."""
+    name = "jose"
+
+    def __init__(
+        self, algorithm: str, secret_key: str, private_key: str = None, public_key: str = None, leeway: float = 0
+    ):
+        super().__init__(algorithm, secret_key, private_key, public_key, leeway)
+        if algorithm == "EdDSA":
+            raise ValueError("python-jose does not support EdDSA, use the native jwt backend")
+        if algorithm.startswith("HS"):
+            self._signing = self._verifying = jwk.construct(secret_key, algorithm)
+        else:
+            self._signing = jwk.construct(private_key, algorithm) if private_key else None
+            self._verifying = jwk.construct(public_key, algorithm) if public_key else self._signing.public_key()
+        self._algorithms = [algorithm]
+        self._options = {"require_exp": True, "leeway": leeway}
+
+    def encode(self, claims: dict) -> str:
+        if self._signing is None:
+            raise ValueError("Tokens can't be signed without JWT_PRIVATE_KEY")
+        return jose_jwt.encode(claims, self._signing, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return jose_jwt.decode(token, self._verifying, algorithms=self._algorithms, options=self._options)
+        except JWTError as error:
+            raise InvalidToken(str(error)) from error
+
+
+class PyJWTTokenCodec(TokenCodec):
+    """PyJWT (the pyjwt extra), with the parsed key objects."""
+    name = "pyjwt"
+
+    def __init__(self, *args, **kwargs):
+        import jwt as pyjwt  # lazy import, optional dependency
+        super().__init__(*args, **kwargs)
+        self._pyjwt = pyjwt
+        self._decoder = pyjwt.PyJWT(options={"require": ["exp"]})
+        self._algorithms = [self.algorithm]
+
+    def encode(self, claims: dict) -> str:
+        if self.signing_key is None:
+            raise ValueError("Tokens can't be signed without JWT_PRIVATE_KEY")
+        return self._pyjwt.encode(claims, self.signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self._decoder.decode(token, self.verifying_key, algorithms=self._algorithms, leeway=self.leeway)
+        except self._pyjwt.PyJWTError as error:
+            raise InvalidToken(str(error)) from error
+
+
+TOKEN_CODECS = {codec.name: codec for codec in (NativeTokenCodec, JoseTokenCodec, PyJWTTokenCodec)}
+
+
+def create_token_codec(backend: str = None, algorithm: str = None, **keys) -> TokenCodec:
+    """The codec of the backend with the configured algorithm and keys, the settings' by default."""
+    backend = backend or settings.JWT_BACKEND
+    if backend not in TOKEN_CODECS:
+        raise ValueError(f"Unknown jwt backend: {backend}")
+    options = dict(
+        secret_key=settings.SECRET_KEY,
+        private_key=settings.JWT_PRIVATE_KEY,
+        public_key=settings.JWT_PUBLIC_KEY,
+        leeway=settings.JWT_LEEWAY,
+    )
+    options.update(keys)
+    return TOKEN_CODECS[backend](algorithm or settings.JWT_ALGORITHM, **options)
+
+
+token_codec = create_token_codec()
+
+
 def create_access_token(subject: dict, expires_delta: Optional[timedelta] = None):
     """
     Create a JSON Web Token from subject (username .. ).
+    Every token gets an id (`jti`) and the time it was issued at (`iat`, in ms), to be revoked, see `revocation`.
     """
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -62,9 +545,9 @@ def create_access_token(subject: dict, expires_delta: Optional[timedelta] = None
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode: dict = subject.copy()
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": round(time.time(), 3), "jti": secrets.token_urlsafe(12)})
 
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = token_codec.encode(to_encode)
     return encoded_jwt
 
 
@@ -113,7 +596,11 @@ class HashedPassword(str):
     def validate(cls, plaintext_password: str):
         """
         Hash the plaintext password.
+
+        HashedPassword instances have been hashed already (e.g. by `ahash_password`) and pass unchanged.
         """
+        if isinstance(plaintext_password, HashedPassword):
+            return plaintext_password
         if not isinstance(plaintext_password, str):
             raise TypeError("Can only hash passwords from strings")
         hashed_password = hash_password(password=plaintext_password)
@@ -1,37 +1,44 @@
+import logging
 import uuid
+from datetime import timedelta
+from typing import Dict, Tuple
 
-from jose import JWTError, jwt
-from fastapi import status, HTTPException, Depends, Security, Header
-from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+from fastapi import status, HTTPException, Depends, Security, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm, SecurityScopes
 from pydantic import ValidationError, EmailStr
+from sqlalchemy.exc import SQLAlchemyError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ...config import settings
-from ...database.dependencies import ActiveSession
+from ...database.dependencies import AnySession, session_scope
+from ...common.timing import timed, phase
+from ...common.ratelimit import RateLimit
 
-from .cryptography import verify_password
-from .models import TokenPayload, User
+from .cryptography import verify_and_update_password, averify_and_update_password, adummy_verify, token_codec
+from .cryptography import create_access_token, JWTAccessToken
+from .exceptions import InvalidToken
+from .models import TokenPayload, User, VerifiedTokenPayload
+from .scopes import scope_registry
+from .cache import token_cache, user_from_snapshot
+from .revocation import revocation_list
 from . import crud
 
 
-oauth2_scheme = OAuth2PasswordBearer(
-    tokenUrl="api/token",
-    scopes={  # required scopes/permissions for the user to access the API
-        "users/whoami": "Read information about the current user."
-    },
-)
+log = logging.getLogger('application')
 
+login_ip_rate_limit = RateLimit("login-ip", settings.RATE_LIMIT_LOGIN_IP)
+login_username_rate_limit = RateLimit("login-username", settings.RATE_LIMIT_LOGIN_USERNAME)
 
-async def valid_authentication_header(authorization: str = Header(...)):
+
+async def limit_login_attempts(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """
-    Check if the authorization header is valid.
-    Valid headers look like this:
-        {"Authorization": "Bearer THETOKEN"}
+    Reject login attempts over the limits per client ip and per username with 429,
+    before the user is looked up and any password is verified.
     """
-    if authorization is None:
-        raise HTTPException(status_code=400, detail="No authorization header provided")
-    if not "bearer" in authorization.lower():
-        raise HTTPException(status_code=401, detail="Invalid authorization header provided")
+    await login_ip_rate_limit(request)
+    await login_username_rate_limit.acheck(form_data.username.lower())
 
 
 def get_user_from_db_by_email(session: Session, email: EmailStr) -> User | None:
@@ -39,6 +46,11 @@ def get_user_from_db_by_email(session: Session, email: EmailStr) -> User | None:
     return user
 
 
+async def aget_user_from_db_by_email(session: AnySession, email: EmailStr) -> User | None:
+    user = await crud.aget_user_by_email(session, email)
+    return user
+
+
 def authenticate_user(session: Session, username: str, password: str) -> User | None | bool:
     """
     Authenticate user by username and password with the database.
@@ -50,69 +62,300 @@ def authenticate_user(session: Session, username: str, password: str) -> User |
     user = get_user_from_db_by_email(session=session, email=username)
     if user is None:
         return None
-    if not verify_password(plain_password=password, hashed_password=user.password):
+    verified, new_hash = verify_and_update_password(plain_password=password, hashed_password=user.password)
+    if not verified:
         return False
+    if new_hash is not None:
+        rehash_password(session=session, user=user, hashed_password=new_hash)
     return user
 
 
-async def get_current_user(
-    security_scopes: SecurityScopes,
-    token: str = Depends(oauth2_scheme),
-    session: Session = ActiveSession,
-):
+def rehash_password(session: Session, user: User, hashed_password: str):
+    """Store the password's hash with the configured costs, a failure must not fail the login."""
+    try:
+        crud.update_user_password_hash(session=session, user=user, hashed_password=hashed_password)
+    except SQLAlchemyError:
+        session.rollback()
+        log.exception(f"Rehashing the password of {user.email} failed.")
+
+
+@timed("auth")
+async def aauthenticate_user(session: AnySession, username: str, password: str) -> User | None | bool:
     """
-    Authenticate user by token.
+    Authenticate user by username and password with the database, without blocking the event loop.
+    The passwords are verified in the password hashing executor.
 
-    raise HTTPException if token is invalid.
-    raise HTTPException if token is expired.
-    raise HTTPException if scopes are not valid.
+    Returns like `authenticate_user`.
+    """
+    user = await aget_user_from_db_by_email(session=session, email=username)
+    if user is None:
+        # take the same time as a verification, protects against user enumeration by timing
+        await adummy_verify()
+        return None
+    verified, new_hash = await averify_and_update_password(plain_password=password, hashed_password=user.password)
+    if not verified:
+        return False
+    if new_hash is not None:
+        await arehash_password(session=session, user=user, hashed_password=new_hash)
+    return user
 
-    return user if token is valid.
+
+async def arehash_password(session: AnySession, user: User, hashed_password: str):
+    """rehash_password, without blocking the event loop."""
+    try:
+        await crud.aupdate_user_password_hash(session=session, user=user, hashed_password=hashed_password)
+    except SQLAlchemyError:
+        if isinstance(session, AsyncSession):
+            await session.rollback()
+        else:
+            await run_in_threadpool(session.rollback)
+        log.exception(f"Rehashing the password of {user.email} failed.")
+
+
+# claims of the access tokens in stateless mode, besides sub, scopes and scm
+STATELESS_CLAIMS = ("uid", "name", "dis", "su", "ver")
+REFRESH_TOKEN = "refresh"  # the `typ` claim of refresh tokens, access tokens have none
+
+
+def access_token_claims(user: User) -> dict:
+    """
+    The claims of the user's access tokens. The scopes have been compiled into the user's scope_mask,
+    "scopes" lists them for the clients. In stateless mode the token carries all a protected route needs.
     """
-    www_authenticate = f'Bearer scope="{security_scopes.scope_str}"' if security_scopes.scopes else "Bearer"
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials.",
-        headers={"WWW-Authenticate": www_authenticate},
+    claims = {
+        "sub": user.email,
+        "scopes": scope_registry.names(user.scope_mask),
+        "scm": user.scope_mask,
+        "ver": user.token_version or 0,
+    }
+    if settings.AUTH_STATELESS:
+        claims.update(uid=user.uid, name=user.name, dis=user.disabled, su=user.superuser)
+    return claims
+
+
+def issue_tokens(user: User, refresh_token: JWTAccessToken | None = None) -> dict:
+    """
+    The token response for the user: an access token, in stateless mode a short-lived one and a refresh token
+    (a new one, unless the `refresh_token` that is being redeemed is passed).
+    """
+    if not settings.AUTH_STATELESS:
+        access_token = create_access_token(
+            subject=access_token_claims(user),
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        )
+        return {"access_token": access_token, "token_type": "bearer"}
+
+    access_token = create_access_token(
+        subject=access_token_claims(user),
+        expires_delta=timedelta(minutes=settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES),
     )
+    if refresh_token is None:
+        refresh_token = create_access_token(
+            subject={"sub": user.email, "uid": user.uid, "ver": user.token_version or 0, "typ": REFRESH_TOKEN},
+            expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+        )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+def user_from_claims(payload: dict) -> User | None:
+    """
+    The user of a stateless access token, detached and built from the claims without a query,
+    None if the token lacks claims (e.g. issued before the stateless mode).
+    Attributes that aren't claims (the password) are loaded once the user is added to a session.
+    """
+    if not all(claim in payload for claim in STATELESS_CLAIMS):
+        return None
+    return user_from_snapshot({
+        "uid": payload["uid"],
+        "email": payload["sub"],
+        "name": payload["name"],
+        "scopes": ",".join(payload.get("scopes", [])),
+        "scope_mask": payload.get("scm"),
+        "disabled": payload["dis"],
+        "superuser": payload["su"],
+        "token_version": payload["ver"],
+    })
+
+
+async def aauthenticate_refresh_token(session: AnySession, refresh_token: str) -> User | None:
+    """
+    The user of a refresh token, None if the token is invalid, expired or revoked (see `crud.revoke_tokens`),
+    or if the user has been deleted or disabled meanwhile.
+    """
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-    except JWTError:
-        raise credentials_exception
+        payload = token_codec.decode(refresh_token)
+    except InvalidToken:
+        return None
+    if payload.get("typ") != REFRESH_TOKEN or "uid" not in payload:
+        return None
+    if await revocation_list.ais_revoked(
+        session, subject=payload.get("sub"), jti=payload.get("jti"), issued_at=payload.get("iat"),
+    ):
+        return None
+    user = await crud.aget_user_by_uid(session=session, uid=payload["uid"])
+    if user is None or user.disabled or payload.get("ver") != (user.token_version or 0):
+        return None
+    return user
 
-    email: str = payload.get("sub")
-    if email is None:
-        raise credentials_exception
 
-    token_scopes = payload.get("scopes", [])
+class Principal:
+    """The authenticated user of a request, with the verified payload of its token."""
+    __slots__ = ("user", "payload", "token")
 
-    try: # validate the token payload
-        token_payload = TokenPayload(scopes=token_scopes, email=email)
-    except ValidationError:
-        raise credentials_exception
+    def __init__(self, user: User, payload: TokenPayload, token: str):
+        self.user = user
+        self.payload = payload
+        self.token = token
 
-    user = get_user_from_db_by_email(session=session, email=token_payload.email)
-    if user is None:
-        raise credentials_exception
 
-    for scope in security_scopes.scopes:
-        if scope not in token_payload.scopes:
+class BearerAuthentication(OAuth2PasswordBearer):
+    """
+    Authenticates the requests of the protected routes in a single pass.
+
+    The protected router depends on it (see `api.py`): it parses the Authorization header, verifies the token
+    (or takes it from the token cache), checks the revocations and that the user is active, once per request,
+    and keeps the `Principal` in `request.state`. `get_current_user` only checks the route's scopes against
+    the principal's mask.
+    It is the OAuth2PasswordBearer scheme to OpenAPI, with the same name and flows.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("scheme_name", OAuth2PasswordBearer.__name__)
+        super().__init__(*args, **kwargs)
+
+    async def __call__(self, request: Request) -> Principal:
+        """
+        raise HTTPException if the header is missing or not a bearer token.
+        raise HTTPException if token is invalid, expired or revoked.
+        raise HTTPException if the user is inactive.
+
+        return the principal if token is valid.
+        """
+        principal = getattr(request.state, "principal", None)
+        if principal is None:
+            principal = request.state.principal = await self.authenticate(request)
+        return principal
+
+    async def authenticate(self, request: Request) -> Principal:
+        authorization = request.headers.get("Authorization")
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            if authorization and "bearer" not in authorization.lower():
+                raise HTTPException(status_code=401, detail="Invalid authorization header provided")
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Insufficient privilege.",
-                headers={"WWW-Authenticate": www_authenticate},
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
             )
 
-    return user
+        with phase("auth"):
+            principal = await self.verify(token)
+        if principal is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials.",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if principal.user.disabled:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is inactive.")
+        return principal
+
+    async def verify(self, token: str, session: AnySession | None = None) -> Principal | None:
+        """
+        The principal of the token, None if the token is invalid, expired or revoked.
+        Without a `session`, the rare queries (a token cache miss, a token in the revocations' filter)
+        run in a session of their own, the user is detached then, like the users of the token cache.
+        """
+        # stateless tokens are verified faster than a cache lookup
+        cached = None if settings.AUTH_STATELESS else await token_cache.aget(token)
+        if cached is not None:
+            token_payload, user = cached.payload, cached.user
+        else:
+            try:
+                payload = token_codec.decode(token)
+            except InvalidToken:
+                return None
+
+            email: str = payload.get("sub")
+            if email is None or payload.get("typ") == REFRESH_TOKEN:
+                return None
+
+            try: # validate the token payload
+                token_payload = VerifiedTokenPayload(
+                    email=email,
+                    scopes=payload.get("scopes", []),
+                    scope_mask=payload.get("scm"),
+                    token_version=payload.get("ver"),
+                    token_id=payload.get("jti"),
+                    issued_at=payload.get("iat"),
+                )
+            except ValidationError:
+                return None
+
+            user = user_from_claims(payload) if settings.AUTH_STATELESS else None
+            if user is None:
+                generation = await token_cache.ageneration(token_payload.email)
+                if session is None:
+                    async with session_scope() as own_session:
+                        user = await aget_user_from_db_by_email(session=own_session, email=token_payload.email)
+                else:
+                    user = await aget_user_from_db_by_email(session=session, email=token_payload.email)
+                if user is None:
+                    return None
+                # tokens issued before the version was introduced have none
+                if token_payload.token_version not in (None, user.token_version or 0):
+                    return None
+                await token_cache.aset(
+                    token, payload=token_payload, user=user, exp=payload["exp"], generation=generation,
+                )
+
+        if await revocation_list.ais_revoked(
+            session, subject=token_payload.email, jti=token_payload.token_id, issued_at=token_payload.issued_at,
+        ):
+            return None
+        return Principal(user=user, payload=token_payload, token=token)
+
+
+oauth2_scheme = BearerAuthentication(
+    tokenUrl="api/token",
+    scopes={  # required scopes/permissions for the user to access the API
+        "users/whoami": "Read information about the current user."
+    },
+)
+
+
+# the required scope mask and the WWW-Authenticate header, per set of scopes (a route)
+compiled_scopes: Dict[Tuple[str, ...], Tuple[int, dict]] = {}
+
+
+async def get_current_user(security_scopes: SecurityScopes, principal: Principal = Depends(oauth2_scheme)) -> User:
+    """
+    The user authenticated by `oauth2_scheme`, if the token grants the scopes.
+
+    raise HTTPException if scopes are not valid.
+    """
+    key = tuple(security_scopes.scopes)
+    compiled = compiled_scopes.get(key)
+    if compiled is None:
+        www_authenticate = f'Bearer scope="{security_scopes.scope_str}"' if key else "Bearer"
+        compiled = compiled_scopes[key] = (scope_registry.required(key), {"WWW-Authenticate": www_authenticate})
+    required, headers = compiled
+
+    if not scope_registry.grants(principal.payload.scope_mask, required):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Insufficient privilege.", headers=headers,
+        )
+    return principal.user
+
+
+AuthenticatedUser = Security(get_current_user, scopes=["users/whoami"])
 
 
-async def get_current_active_user(current_user: User = Security(get_current_user, scopes=["users/whoami"])):
+async def get_current_superuser(current_user: User = AuthenticatedUser):
     """
-    If the user in the token is active, the dependency will return the user.
+    If the active user in the token is a superuser, the dependency will return the user.
     """
-    if current_user.disabled:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is inactive.")
+    if not current_user.superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Superuser privileges required.")
     return current_user
 
 
-AuthenticatedUser = Depends(get_current_active_user)
+SuperUser = Depends(get_current_superuser)
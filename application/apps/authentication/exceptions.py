@@ -1,4 +1,4 @@
-from pydantic.error_wrappers import ValidationError
+from pydantic.error_wrappers import ValidationError, ErrorWrapper
 
 
 class EmailDoesExist(ValueError):
@@ -8,6 +8,29 @@ class EmailDoesExist(ValueError):
     pass
 
 
+class InvalidToken(ValueError):
+    """
+    The access token's signature, algorithm or claims are invalid, see `cryptography.TokenCodec`.
+    """
+    pass
+
+
+class PasswordHashingUnavailable(Exception):
+    """
+    The password hashing executor is saturated.
+    """
+    pass
+
+
+def email_does_exist_error(email: str, model) -> ValidationError:
+    """
+    Wrap the unique constraint violation for the email field in a ValidationError,
+    so callers can handle it like any other validation error of the model.
+    """
+    error = EmailDoesExist(f"User with email {email} already exists")
+    return ValidationError([ErrorWrapper(error, loc="email")], model)
+
+
 def bypass_email_validation_error(error: ValidationError):
     """
     If the ValidationError is raised for the email field ONLY (because of the unique constraint violation)
@@ -1,14 +1,12 @@
 import uuid
 from typing import List, Optional
 from pydantic import EmailStr, BaseModel
+from sqlalchemy import event
 from sqlmodel import Field, SQLModel, Relationship
-from pydantic import validator
-
-from ...config import settings
-from ...config import validators
+from pydantic import validator, root_validator
 
 from .cryptography import HashedPassword, JWTAccessToken, generate_uuid
-from .exceptions import EmailDoesExist
+from .scopes import scope_registry
 
 
 class Token(SQLModel):
@@ -17,6 +15,7 @@ class Token(SQLModel):
     """
     access_token: JWTAccessToken
     token_type: str
+    refresh_token: Optional[JWTAccessToken] = None  # stateless mode only, see `settings.AUTH_STATELESS`
 
     @validator("token_type")
     @classmethod
@@ -33,14 +32,28 @@ class TokenPayload(SQLModel):
     """
     email: EmailStr
     scopes: List[str] = []
+    scope_mask: Optional[int] = None  # the `scm` claim
+    token_version: Optional[int] = None  # the `ver` claim
+    token_id: Optional[str] = None  # the `jti` claim
+    issued_at: Optional[float] = None  # the `iat` claim
 
-    @validator("scopes")
+    @root_validator(skip_on_failure=True)
     @classmethod
-    def validate_scopes(cls, scopes):
-        """Validate if the scope is valid."""
-        if not all([scope in settings.VALID_SCOPES for scope in scopes]):
-            raise ValueError(f'Scopes {scopes} not in VALID_SCOPES')
-        return scopes
+    def validate_scope_mask(cls, values):
+        """Validate the scope mask, tokens issued without one get it compiled from their scopes."""
+        if values.get("scope_mask") is None:
+            values["scope_mask"] = scope_registry.mask(values["scopes"])
+        elif not scope_registry.is_valid(values["scope_mask"]):
+            raise ValueError(f'Scope mask {values["scope_mask"]} has scopes not in VALID_SCOPES')
+        return values
+
+
+class VerifiedTokenPayload(TokenPayload):
+    """
+    The payload of a token whose signature has been verified: we issued it, to a user with a validated email.
+    Validating the email again would be most of the payload's validation.
+    """
+    email: str
 
 
 class NewPassword(SQLModel):
@@ -58,7 +71,7 @@ class UserBase(SQLModel):
     SQLModels have orm_mode = True by default.
     """
     email: EmailStr = Field(default=None)
-    name: Optional[str] = Field(default=None)
+    name: Optional[str] = Field(default=None, index=False)
 
 
 class User(UserBase, table=True):
@@ -67,42 +80,55 @@ class User(UserBase, table=True):
     
     uid > str: (UUID4), auto-generated uuid (as str repr).
     password > Str, will be hashed upon creation. Never save the password in plaintext. ;-)
-    scopes > Comma seperated list of routes allowed for this user. Example: "users/whoami"
+    scopes > Comma seperated list of routes allowed for this user. Example: "users/whoami" or "users/*"
+    scope_mask > The scopes compiled to bits (see `scopes.scope_registry`), set from `scopes` on every flush.
     disabled > Boolean, if the user has been activated or blocked.
     superuser > Boolean, if the user is a superuser.
+    token_version > Incremented when the user's tokens must not be accepted anymore (a new password),
+        see `crud.revoke_tokens`. Tokens carry the version they were issued with as `ver` claim.
 
+    The email is guarded by a unique index on database level, see `crud.create_user`.
+    Only the email (unique) and the uid (primary key) are indexed, the lookups use nothing else,
+    see `database.query_plans`. SQLModel indexes every other column, unless told otherwise.
     """
-    uid: Optional[str] = Field(default_factory=generate_uuid, primary_key=True, index=True)
-    password: Optional[HashedPassword]
-    scopes: Optional[str] = "unauthorized"
-    disabled: Optional[bool] = True
-    superuser: Optional[bool] = False
-
-    @validator("email")  # TODO: validate through unique constraint on database level
-    @classmethod
-    def validate_email_is_unique(cls, email):
-        """Validate if the email is unique."""
-        # lazy imports
-        from . import crud
-        from ...database.dependencies import get_session
-        # generate a new sesison
-        session = next(get_session())
-        existing_users = crud.get_users(session)
-        existing_emails = [u.email for u in existing_users]
-        if email in existing_emails:
-            raise EmailDoesExist(f"User with email {email} already exists")
-        return email
+    email: EmailStr = Field(default=None, index=True, sa_column_kwargs={"unique": True})
+    uid: Optional[str] = Field(default_factory=generate_uuid, primary_key=True, index=False)
+    password: Optional[HashedPassword] = Field(default=None, index=False)
+    scopes: Optional[str] = Field(default="unauthorized", index=False)
+    scope_mask: Optional[int] = Field(default=0, index=False)
+    disabled: Optional[bool] = Field(default=True, index=False)
+    superuser: Optional[bool] = Field(default=False, index=False)
+    token_version: Optional[int] = Field(default=0, index=False, sa_column_kwargs={"server_default": "0"})
 
     @validator("scopes")
     @classmethod
     def validate_scopes(cls, value):
         """Validate if the scope is valid."""
-        scopes = validators.dissassemble_comma_seperated_lists_of_strings(value)
-        if not all([scope in settings.VALID_SCOPES for scope in scopes if scopes]):
-            raise ValueError(f'Scope {value} not in VALID_SCOPES')
+        scope_registry.mask(value)
         return value
 
 
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def compile_scope_mask(mapper, connection, user: User):
+    """Keep the mask in line with the scopes, however they were changed."""
+    user.scope_mask = scope_registry.mask(user.scopes)
+
+
+class RevokedToken(SQLModel, table=True):
+    """
+    A revoked token (`jti`), or all tokens of a `subject` (the email) issued until `revoked_at`.
+
+    Rows are kept until `expires_at`, when the tokens they revoke have expired anyway, see `revocation`.
+    `revoked_at` is indexed for the workers' incremental refresh, `expires_at` for the purge.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True, index=False, nullable=False)
+    jti: Optional[str] = Field(default=None, index=True)
+    subject: Optional[str] = Field(default=None, index=False)
+    revoked_at: float = Field(index=True)
+    expires_at: float = Field(index=True)
+
+
 # -- User CRUD Models----------------------------------------------------------
 class UserCreate(UserBase):
     """
@@ -138,6 +164,14 @@ class UserRead(UserBase):
     pass
 
 
+class UserPage(SQLModel):
+    """
+    A page of users, pass `next_cursor` as `cursor` to get the next one (None on the last page).
+    """
+    items: List[UserRead]
+    next_cursor: Optional[str] = None
+
+
 class UserUpdate(SQLModel):
     """
     Update a User's fields.
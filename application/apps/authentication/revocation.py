@@ -0,0 +1,276 @@
+"""
+Revoked tokens, checked by `dependencies.BearerAuthentication` without a query for tokens that aren't revoked.
+
+The revocations are rows of the `revokedtoken` table: single tokens by their `jti` (a logout)
+and all tokens of a subject issued until a point in time (a new password, a deleted user).
+Every worker keeps them in memory: the subjects in a dict, the token ids in a bloom filter.
+A token that isn't revoked costs a dict lookup and the filter's hashes, only revoked tokens
+and the filter's rare false positives are looked up in the database.
+
+A background task per worker (see `main.startup_event`) loads the rows revoked by other workers
+every REVOCATION_REFRESH_SECONDS, and every REVOCATION_PURGE_SECONDS deletes the expired rows
+and rebuilds the filter. Revocations take effect in the worker that revoked them once its session commits,
+in the other workers after their next refresh.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ...config import settings
+from ...common.timing import timed
+from ...database.dependencies import AnySession, create_session, session_scope
+
+from .models import RevokedToken
+
+
+log = logging.getLogger('application')
+
+# the revocations added to a session, remembered when it commits (`Session.info` key)
+PENDING_REVOCATIONS = "pending_revocations"
+
+# rows are re-read this long after their revoked_at, when they were committed late or by a worker with a skewed clock
+REFRESH_OVERLAP = 60
+
+
+class BloomFilter:
+    """
+    A set of strings in a bit array, `key in filter` answers "maybe" or "certainly not".
+
+    Sized for `capacity` keys at the `error_rate` of false positives, more keys raise the rate.
+    The bit positions of a key are derived from a single blake2b digest (double hashing).
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+@timed("db")
+def revoked_token_exists(session: Session, jti: str) -> bool:
+    statement = select(RevokedToken.id).where(RevokedToken.jti == jti).limit(1)
+    return session.exec(statement).first() is not None
+
+
+@timed("db")
+async def arevoked_token_exists(session: AnySession, jti: str) -> bool:
+    if not isinstance(session, AsyncSession):
+        return await run_in_threadpool(revoked_token_exists, session=session, jti=jti)
+    statement = select(RevokedToken.id).where(RevokedToken.jti == jti).limit(1)
+    return (await session.exec(statement)).first() is not None
+
+
+class RevocationList:
+    """
+    The revocations in the worker's memory, see the module's docstring.
+
+    Revoking adds the row to the caller's session, committed with the caller's changes, it takes effect then.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        refresh_interval: float = 5,
+        purge_interval: float = 3600,
+        capacity: int = 100_000,
+        error_rate: float = 0.001,
+    ):
+        self.enabled = enabled
+        self.refresh_interval = refresh_interval
+        self.purge_interval = purge_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        self.subjects: Dict[str, float] = {}  # subject -> revoked_at
+        self.watermark = 0.0  # the latest revoked_at loaded
+        self.next_purge = 0.0
+        self._lock = threading.Lock()
+        self._reloading: Optional[List[Tuple[Optional[str], Optional[str], float]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # -- checks, on every request --------------------------------------------
+    def subject_revoked(self, subject: str, issued_at: Optional[float]) -> bool:
+        """True, if the subject's tokens issued until then (or without `iat`) are revoked."""
+        revoked_at = self.subjects.get(subject)
+        return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+    async def ais_revoked(
+        self, session: Optional[AnySession], subject: str, jti: Optional[str], issued_at: Optional[float],
+    ) -> bool:
+        """Checked in memory, only a token in the filter is looked up, in a session of its own without `session`."""
+        if not self.enabled:
+            return False
+        if self.subject_revoked(subject, issued_at):
+            return True
+        if jti is None or not self.filter.count or jti not in self.filter:
+            return False
+        # revoked, or a false positive of the filter
+        if session is None:
+            async with session_scope() as session:
+                return await arevoked_token_exists(session=session, jti=jti)
+        return await arevoked_token_exists(session=session, jti=jti)
+
+    # -- revoking ------------------------------------------------------------
+    def revoke_token(self, session: AnySession, jti: str, expires_at: float):
+        """Revoke a single token until it expires."""
+        if not self.enabled:
+            return
+        entry = RevokedToken(jti=jti, revoked_at=round(time.time(), 3), expires_at=expires_at)
+        self.add(session, entry)
+
+    def revoke_subject(self, session: AnySession, subject: str):
+        """Revoke all tokens of the subject issued until now, the rows expire with the longest-lived tokens."""
+        if not self.enabled:
+            return
+        revoked_at = round(time.time(), 3)
+        lifetime = max(settings.ACCESS_TOKEN_EXPIRE_MINUTES, settings.REFRESH_TOKEN_EXPIRE_MINUTES) * 60
+        entry = RevokedToken(
+            subject=subject, revoked_at=revoked_at, expires_at=revoked_at + lifetime + settings.JWT_LEEWAY,
+        )
+        self.add(session, entry)
+
+    @staticmethod
+    def add(session: AnySession, entry: RevokedToken):
+        """Add the row to the session, the worker remembers it once the session commits (see `remember_committed`)."""
+        session.add(entry)
+        info = session.sync_session.info if isinstance(session, AsyncSession) else session.info
+        info.setdefault(PENDING_REVOCATIONS, []).append((entry.jti, entry.subject, entry.revoked_at))
+
+    async def arevoke_tokens(self, session: AnySession, payloads: List[dict]):
+        """Revoke the tokens of the (verified) payloads and commit."""
+        for payload in payloads:
+            self.revoke_token(session, jti=payload["jti"], expires_at=payload["exp"] + settings.JWT_LEEWAY)
+        if isinstance(session, AsyncSession):
+            await session.commit()
+        else:
+            await run_in_threadpool(session.commit)
+
+    def remember(self, jti: Optional[str], subject: Optional[str], revoked_at: float):
+        """Add a revocation to the worker's memory, from the committing thread or the refreshing one."""
+        with self._lock:
+            self._remember(self.filter, self.subjects, jti, subject, revoked_at)
+            if self._reloading is not None:
+                self._reloading.append((jti, subject, revoked_at))
+
+    @staticmethod
+    def _remember(
+        bloom: BloomFilter, subjects: Dict[str, float], jti: Optional[str], subject: Optional[str], revoked_at: float,
+    ):
+        # the refreshs read rows again, they must not count twice
+        if jti is not None and jti not in bloom:
+            bloom.add(jti)
+        if subject is not None and revoked_at > subjects.get(subject, 0):
+            subjects[subject] = revoked_at
+
+    # -- loading -------------------------------------------------------------
+    def refresh(self, session: Session):
+        """Load the rows revoked since the last refresh, purge and rebuild when it is time."""
+        now = time.time()
+        if now >= self.next_purge or self.filter.count > self.filter.capacity:
+            self.purge(session, now)
+            self.reload(session)
+            self.next_purge = now + self.purge_interval
+            return
+        statement = select(RevokedToken).where(RevokedToken.revoked_at > self.watermark - REFRESH_OVERLAP)
+        for entry in session.exec(statement):
+            self.remember(entry.jti, entry.subject, entry.revoked_at)
+            self.watermark = max(self.watermark, entry.revoked_at)
+
+    def reload(self, session: Session):
+        """
+        Rebuild the filter and the subjects from all rows, sized for twice as many.
+        The requests are checked against the previous ones until the new ones replace them, complete.
+        """
+        with self._lock:
+            self._reloading = []
+        entries = list(session.exec(select(RevokedToken)))
+        bloom = BloomFilter(max(self.capacity, 2 * len(entries)), self.error_rate)
+        subjects: Dict[str, float] = {}
+        for entry in entries:
+            self._remember(bloom, subjects, entry.jti, entry.subject, entry.revoked_at)
+        watermark = max((entry.revoked_at for entry in entries), default=0.0)
+        with self._lock:
+            # committed meanwhile, maybe after the rows were read
+            for jti, subject, revoked_at in self._reloading:
+                self._remember(bloom, subjects, jti, subject, revoked_at)
+            self._reloading = None
+            self.filter, self.subjects, self.watermark = bloom, subjects, watermark
+
+    @staticmethod
+    def purge(session: Session, now: Optional[float] = None) -> int:
+        """Delete the rows of the expired tokens, returns their number."""
+        result = session.execute(delete(RevokedToken).where(RevokedToken.expires_at < (now or time.time())))
+        session.commit()
+        return result.rowcount
+
+    # -- background refresh ---------------------------------------------------
+    def refresh_in_new_session(self):
+        with create_session() as session:
+            self.refresh(session)
+
+    async def keep_refreshed(self):
+        while True:
+            try:
+                await run_in_threadpool(self.refresh_in_new_session)
+            except SQLAlchemyError:
+                log.exception("Refreshing the revoked tokens failed.")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Load the revocations and keep them refreshed, in the running event loop."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.keep_refreshed())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+revocation_list = RevocationList(
+    enabled=settings.REVOCATION_ENABLED,
+    refresh_interval=settings.REVOCATION_REFRESH_SECONDS,
+    purge_interval=settings.REVOCATION_PURGE_SECONDS,
+    capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+)
+
+
+@event.listens_for(Session, "after_commit")
+def remember_committed(session: Session):
+    for revocation in session.info.pop(PENDING_REVOCATIONS, ()):
+        revocation_list.remember(*revocation)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back(session: Session):
+    session.info.pop(PENDING_REVOCATIONS, None)
@@ -1,18 +1,27 @@
-from datetime import timedelta
+import logging
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, File, Form, UploadFile, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-
 from sqlmodel import Session
 
-from ...config import settings, validators
-from ...database.dependencies import ActiveSession
+from ...database.dependencies import RequestSession, AnySession, ActiveSession
+from ...common.dependencies import PageQueryParams
+from ...common.responses import StreamingJSONResponse
+
+from .dependencies import AuthenticatedUser, SuperUser, aauthenticate_user, aauthenticate_refresh_token
+from .dependencies import issue_tokens, limit_login_attempts, oauth2_scheme, Principal
+from .cryptography import hashing_executor, token_codec
+from .exceptions import InvalidToken
+from .revocation import revocation_list
 
-from .dependencies import AuthenticatedUser, authenticate_user
-from .cryptography import create_access_token, JWTAccessToken
+from .models import User, Token, UserRead, UserPage, NewPassword
+from . import crud, bulk
 
-from .models import User, Token, UserRead, NewPassword
-from . import crud
+
+log = logging.getLogger('application')
 
 
 protected_router = APIRouter(
@@ -32,26 +41,119 @@ async def display_authenticated_user(current_user: User = AuthenticatedUser):
 
 
 @protected_router.patch("/whoami/password", tags=["authentication"], response_model=UserRead)
-async def change_password(patch: NewPassword, current_user: User = AuthenticatedUser, session: Session = ActiveSession):
+async def change_password(
+    patch: NewPassword, current_user: User = AuthenticatedUser, session: AnySession = RequestSession
+):
     """Change user's password: send a body with 'password' & 'confirmation'."""
     # Check if the passwords match
     if not patch.password == patch.confirmation:
         raise HTTPException(status_code=409, detail="Passwords do not match")
-    user = crud.update_user_password(session=session, user=current_user, new_password=patch.password)
+    user = await crud.aupdate_user_password(session=session, user=current_user, new_password=patch.password)
     return user
 
 
-@public_router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = ActiveSession):
+@protected_router.get("/users", tags=["users"], response_model=UserPage)
+async def list_users(
+    order: str = Query("email", regex="^(email|uid)$"),
+    params: PageQueryParams = Depends(),
+    current_user: User = SuperUser,
+    session: AnySession = RequestSession,
+):
+    """
+    List the users page by page, superusers only.
+    Pass the `next_cursor` of a page as `cursor` to get the next one, `q` filters the emails by their start.
+    """
+    users, next_cursor = await crud.aget_users_page(
+        session=session, limit=params.limit, after=params.after(order), order=order, q=params.q,
+    )
+    return {"items": users, "next_cursor": next_cursor}
+
+
+@protected_router.get("/users/all", tags=["users"], response_model=List[UserRead])
+async def list_all_users(current_user: User = SuperUser, session: AnySession = RequestSession):
+    """List all users at once, streamed row by row, superusers only."""
+    return StreamingJSONResponse(crud.aiterate_users(session), model=UserRead)
+
+
+@protected_router.post("/users/import", tags=["users"])
+async def import_users(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(1000, gt=0, le=10_000),
+    current_user: User = SuperUser,
+    session: Session = ActiveSession,
+):
+    """
+    Bulk import users from a csv or json-lines file (by the file's suffix), superusers only.
+    Returns the number of created users and the errors per line.
+
+    The passwords are hashed in the requests' hashing executor, a few at a time,
+    import large files with `cc import-users`.
+    """
+    format = bulk.guess_format(file.filename)
+    rows = bulk.read_rows(bulk.text_lines(file.file), format)
+
+    def progress(report: bulk.ImportReport):
+        log.info(f"Importing {file.filename}: {report.processed} processed, {report.created} created")
+
+    def run_import() -> bulk.ImportReport:
+        return bulk.import_users(session, rows, chunk_size=chunk_size, executor=hashing_executor, progress=progress)
+
+    report = await run_in_threadpool(run_import)
+    return report.dict()
+
+
+@protected_router.get("/users/export", tags=["users"])
+async def export_users(
+    format: str = Query("jsonl", regex="^(csv|jsonl)$"),
+    current_user: User = SuperUser,
+    session: Session = ActiveSession,
+):
+    """Stream all users as csv or json lines, superusers only."""
+    return StreamingResponse(
+        bulk.export_users(session, format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
+
+
+@protected_router.post("/token/revoke", tags=["authentication"], status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_tokens(
+    refresh_token: Optional[str] = Form(None),
+    current_user: User = AuthenticatedUser,
+    principal: Principal = Depends(oauth2_scheme),
+    session: AnySession = RequestSession,
+):
+    """
+    Log out: revoke the access token of the request, and the refresh token of the login, if one is sent.
+    """
+    payloads = []
+    for revoked in filter(None, (principal.token, refresh_token)):
+        try:
+            payload = token_codec.decode(revoked)
+        except InvalidToken:
+            continue
+        if payload.get("sub") == current_user.email and "jti" in payload:
+            payloads.append(payload)
+    await revocation_list.arevoke_tokens(session=session, payloads=payloads)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@public_router.post(
+    "/token", response_model=Token, response_model_exclude_none=True, dependencies=[Depends(limit_login_attempts)],
+)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), session: AnySession = RequestSession
+):
     """
     OAuth2 compatible token login, get an access token for future requests.
 
     raises HTTPException(401) if user could not be found.  
     raises HTTPException(401) if user could not be authenticated.  
     raises HTTPException(401) if user disabled.  
+    raises HTTPException(429) if the client or the username exceeded the login attempts.  
     """
     username = form_data.username
-    user = authenticate_user(session=session, username=username, password=form_data.password)
+    user = await aauthenticate_user(session=session, username=username, password=form_data.password)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,15 +173,22 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # scopes have been validated
-    scopes: list = validators.dissassemble_comma_seperated_lists_of_strings(user.scopes)
+    return issue_tokens(user)
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token: JWTAccessToken = create_access_token(
-        subject={
-            "sub": user.email,
-            "scopes": scopes,
-        },
-        expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+
+@public_router.post("/token/refresh", response_model=Token, response_model_exclude_none=True)
+async def refresh_access_token(refresh_token: str = Form(...), session: AnySession = RequestSession):
+    """
+    Get a new access token for the refresh token of a login, in stateless mode.
+
+    raises HTTPException(401) if the refresh token is invalid or expired.  
+    raises HTTPException(401) if the user has been deleted, disabled or has changed the password since the login.  
+    """
+    user = await aauthenticate_refresh_token(session=session, refresh_token=refresh_token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token, log in again.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return issue_tokens(user, refresh_token=refresh_token)
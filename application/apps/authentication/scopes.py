@@ -0,0 +1,82 @@
+"""
+Scopes compiled into bit masks.
+
+Every scope in settings.VALID_SCOPES gets a bit, by its position in the list. Users store their scopes
+as `scope_mask` (next to the readable `scopes` string), tokens carry the mask as `scm` claim,
+and checking the permissions of a request is a single bitwise AND.
+
+    scope_registry.mask("users/whoami,logs/read")  # -> 0b110
+    scope_registry.mask(["users/*"])  # all scopes below users/
+    scope_registry.grants(mask, scope_registry.required(["users/whoami"]))
+
+Only append new scopes to VALID_SCOPES: reordering or removing them changes the meaning of the stored masks
+and of the tokens out there (rebuild the masks from the `scopes` strings then, see the scope_mask migration).
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from ...config import settings
+from ...config import validators
+
+
+WILDCARD = "*"
+
+
+class ScopeRegistry:
+
+    def __init__(self, scopes: Iterable[str]):
+        self.bits: Dict[str, int] = {}
+        for scope in scopes:
+            if scope in self.bits or scope.endswith(WILDCARD):
+                raise ValueError(f"Invalid or duplicated scope: {scope}")
+            self.bits[scope] = 1 << len(self.bits)
+        self.all = (1 << len(self.bits)) - 1
+        self._required: Dict[Tuple[str, ...], int] = {}
+
+    def bit(self, scope: str) -> int:
+        """
+        The bits of a scope: "users/whoami" is one bit, "users/*" those of all scopes below users/
+        and "*" all of them. Raises ValueError on unknown scopes.
+        """
+        if scope.endswith(WILDCARD):
+            prefix = scope[:-len(WILDCARD)]
+            bits = 0
+            for name, bit in self.bits.items():
+                if name.startswith(prefix):
+                    bits |= bit
+            if bits:
+                return bits
+        elif scope in self.bits:
+            return self.bits[scope]
+        raise ValueError(f"Scope {scope} not in VALID_SCOPES")
+
+    def mask(self, scopes: Iterable[str] | str | None) -> int:
+        """The mask of a list of scopes, or of a comma-seperated string of them."""
+        if isinstance(scopes, str):
+            scopes = validators.dissassemble_comma_seperated_lists_of_strings(scopes)
+        mask = 0
+        for scope in scopes or ():
+            mask |= self.bit(scope)
+        return mask
+
+    def names(self, mask: int) -> List[str]:
+        """The scopes in the mask."""
+        return [scope for scope, bit in self.bits.items() if mask & bit]
+
+    def is_valid(self, mask: int) -> bool:
+        """False, if the mask has bits of no known scope."""
+        return mask >= 0 and mask & ~self.all == 0
+
+    def required(self, scopes: Iterable[str]) -> int:
+        """The mask of the scopes a route requires, compiled once per route."""
+        key = tuple(scopes)
+        mask = self._required.get(key)
+        if mask is None:
+            mask = self._required[key] = self.mask(key)
+        return mask
+
+    @staticmethod
+    def grants(mask: int, required: int) -> bool:
+        return mask & required == required
+
+
+scope_registry = ScopeRegistry(settings.VALID_SCOPES)
@@ -6,6 +6,7 @@ from sqlmodel import SQLModel
 
 from ....main import app
 from ....database.dependencies import get_session, ENGINE
+from ....database.query_tracker import assert_max_queries, track_queries
 
 from ..cryptography import verify_password
 
@@ -121,9 +122,24 @@ class TestAuthentication:
             "uid": True,
             "disabled": True,
             "superuser": True,
-            "scopes": True
+            "scopes": True,
+            "scope_mask": True,
+            "token_version": True,
         })
 
+    @pytest.mark.asyncio
+    async def test_authentication_query_count(self, password, async_client: httpx.AsyncClient):
+        with assert_max_queries(1):  # the user by email
+            response = await async_client.post("/api/token", data={"username": "foo@bar.baz", "password": password})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        with track_queries() as queries:  # a cache miss: the user by email
+            response = await async_client.get("/api/whoami", headers=headers)
+        assert queries.count == 1
+        assert response.headers["X-Query-Count"] == "1"
+        with assert_max_queries(0):  # served by the token cache
+            response = await async_client.get("/api/whoami", headers=headers)
+        assert response.headers["X-Query-Count"] == "0"
+
     def test_password_matches_hash_from_test_db(self, user, password):
         assert verify_password(plain_password=password, hashed_password=user.password)
 
@@ -194,3 +210,35 @@ class TestAuthentication:
         response = await async_client.post("/api/token", data={"username": "foo@bar.baz", "password": new_password})
         assert response.status_code == 200
         assert response.json().get("access_token")
+
+
+def test_login_attempts_are_limited_before_hashing(monkeypatch):
+    from ....config import settings
+    from ....common.ratelimit import TokenBucket
+    from .. import dependencies
+
+    SQLModel.metadata.create_all(ENGINE)
+    verified = []
+
+    async def dummy_verify(*args, **kwargs):
+        verified.append(args)
+        return False
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(dependencies, "adummy_verify", dummy_verify)
+    monkeypatch.setattr(dependencies.login_ip_rate_limit, "_limiter", TokenBucket(limit=3, window=60))
+    monkeypatch.setattr(dependencies.login_username_rate_limit, "_limiter", TokenBucket(limit=2, window=60))
+
+    client = TestClient(app, base_url="http://127.0.0.1:8000")  # a trusted host
+
+    def login(username: str):
+        return client.post("/api/token", data={"username": username, "password": "guess"})
+
+    # per username, however the username is spelled
+    assert [login(username).status_code for username in ("eve@acid.net", "EVE@acid.net")] == [401, 401]
+    response = login("eve@acid.net")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    # per client, for all usernames
+    assert login("mallory@acid.net").status_code == 429
+    assert len(verified) == 2
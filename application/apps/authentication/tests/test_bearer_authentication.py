@@ -0,0 +1,103 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+from ....main import app
+from ....database.dependencies import get_session, ENGINE
+
+from ..dependencies import BearerAuthentication, oauth2_scheme
+from ..models import UserCreate
+from .. import crud
+
+
+EMAIL = "bearer@acid.net"
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    existing = crud.get_user_by_email(session, EMAIL)
+    if existing is not None:
+        crud.delete_user(session, existing)
+    crud.create_user(
+        session, UserCreate(email=EMAIL, name="Bearer", password="bar", disabled=False, scopes="users/whoami"),
+    )
+    yield session
+    user = crud.get_user_by_email(session, EMAIL)
+    if user is not None:
+        crud.delete_user(session, user)
+
+
+@pytest.fixture
+def client(session) -> TestClient:
+    return TestClient(app, base_url="http://127.0.0.1:8000")
+
+
+def login(client: TestClient) -> dict:
+    response = client.post("/api/token", data={"username": EMAIL, "password": "bar"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def authentications(monkeypatch) -> list:
+    """The tokens authenticated, once per request."""
+    calls = []
+    authenticate = BearerAuthentication.authenticate
+
+    async def counted(self, request, **kwargs):
+        calls.append(request.headers["Authorization"])
+        return await authenticate(self, request, **kwargs)
+
+    monkeypatch.setattr(BearerAuthentication, "authenticate", counted)
+    return calls
+
+
+def test_a_single_pass_per_request(client, authentications):
+    tokens = login(client)
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 200
+    assert client.post("/api/token/revoke", headers=bearer(tokens["access_token"])).status_code == 204
+    assert authentications == [f"Bearer {tokens['access_token']}"] * 2
+
+
+def test_superusers(client, session):
+    tokens = login(client)
+    assert client.get("/api/users", headers=bearer(tokens["access_token"])).status_code == 403
+    user = crud.get_user_by_email(session, EMAIL)
+    user.superuser = True
+    session.add(user)
+    session.commit()
+    tokens = login(client)  # the token cache keeps the user of the previous token
+    assert client.get("/api/users", headers=bearer(tokens["access_token"])).status_code == 200
+
+
+def test_the_openapi_security_scheme_is_unchanged():
+    """
+    The security scheme and the operations' security are unchanged. The `authorization` header parameter
+    of the protected operations is gone (it was valid_authentication_header's), the scheme sends the header.
+    """
+    response = TestClient(app, base_url="http://127.0.0.1:8000").get("/openapi.json")
+    assert response.status_code == 200
+    schema = response.json()
+    assert schema["components"]["securitySchemes"] == {
+        "OAuth2PasswordBearer": {
+            "type": "oauth2",
+            "flows": {
+                "password": {
+                    "scopes": {"users/whoami": "Read information about the current user."},
+                    "tokenUrl": "api/token",
+                },
+            },
+        },
+    }
+    assert oauth2_scheme.scheme_name == "OAuth2PasswordBearer"
+    for path in ("/api/whoami", "/api/users"):
+        operation = schema["paths"][path]["get"]
+        assert operation["security"] == [{"OAuth2PasswordBearer": []}]
+        assert "authorization" not in [parameter["name"] for parameter in operation.get("parameters", [])]
+    assert "security" not in schema["paths"]["/api/token"]["post"]
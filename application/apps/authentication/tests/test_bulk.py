@@ -0,0 +1,146 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+from ....main import app
+from ....database.dependencies import get_session, ENGINE
+from ....database.query_tracker import assert_max_queries
+
+from ..cryptography import verify_password, hash_password
+from ..models import UserCreate
+from .. import bulk, crud
+
+client = TestClient(app, base_url="http://localhost")
+
+CSV = """email,name,password,scopes,disabled
+bulk-1@example.com,Bulk One,secret,users/whoami,false
+bulk-2@example.com,Bulk Two,secret,,
+not-an-email,Invalid,secret,,
+bulk-1@example.com,Duplicate,secret,,
+bulk-3@example.com,Bad Scope,secret,root,
+"""
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    yield session
+    for user in crud.get_users(session):
+        if user.email.startswith("bulk-"):
+            crud.delete_user(session, user)
+
+
+def test_import_csv(session):
+    reports = []
+    with ThreadPoolExecutor(2) as executor:
+        report = bulk.import_users(
+            session, bulk.read_rows(io.StringIO(CSV), "csv"), chunk_size=2, executor=executor, progress=reports.append,
+        )
+    assert report.processed == 5
+    assert report.created == 2
+    assert len(reports) == 3  # one call per chunk
+    assert [(error["line"], error["email"]) for error in report.errors] == [
+        (4, "not-an-email"), (5, "bulk-1@example.com"), (6, "bulk-3@example.com"),
+    ]
+    one = crud.get_user_by_email(session, "bulk-1@example.com")
+    assert one.name == "Bulk One"
+    assert one.scopes == "users/whoami"
+    assert one.disabled is False
+    assert verify_password("secret", one.password)
+    assert crud.get_user_by_email(session, "bulk-2@example.com").disabled is True
+
+    # the existing emails are rejected on the next import
+    report = bulk.import_users(session, bulk.read_rows(io.StringIO(CSV), "csv"))
+    assert report.created == 0
+    assert len(report.errors) == 5
+
+
+def test_export_and_import_hashed_passwords(session):
+    hashed = hash_password("secret")
+    lines = [
+        json.dumps({"email": "bulk-4@example.com", "name": "Bulk Four", "hashed_password": hashed}),
+        "",
+        "{not json",
+        json.dumps({"email": "bulk-5@example.com", "hashed_password": "plaintext"}),
+    ]
+    with assert_max_queries(3):  # existing emails, insert, commit
+        report = bulk.import_users(session, bulk.read_rows(io.StringIO("\n".join(lines)), "jsonl"))
+    assert report.created == 1
+    assert [error["line"] for error in report.errors] == [3, 4]
+    assert crud.get_user_by_email(session, "bulk-4@example.com").password == hashed
+
+    exported = [json.loads(line) for line in bulk.export_users(session, "jsonl", chunk_size=1, hashed_passwords=True)]
+    assert [user["email"] for user in exported] == sorted(user.email for user in crud.get_users(session))
+    assert {"email": "bulk-4@example.com", "hashed_password": hashed}.items() <= exported[
+        [user["email"] for user in exported].index("bulk-4@example.com")
+    ].items()
+
+    csv_lines = list(bulk.export_users(session, "csv"))
+    assert csv_lines[0] == "uid,email,name,scopes,disabled,superuser\n"
+    assert len(csv_lines) == len(exported) + 1
+    assert "hashed_password" not in "".join(csv_lines)
+
+
+@pytest.fixture(name="headers")
+def admin_headers(session):
+    admin = UserCreate(
+        email="bulk-admin@example.com", name="Admin", password="admin", scopes="users/whoami",
+        disabled=False, superuser=True,
+    )
+    crud.create_user(session, admin)
+    response = client.post("/api/token", data={"username": admin.email, "password": "admin"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_admin_api(session, headers):
+    files = {"file": ("users.csv", CSV.encode(), "text/csv")}
+    response = client.post("/api/users/import", files=files, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    assert response.json()["failed"] == 3
+
+    response = client.get("/api/users/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "bulk-2@example.com" in response.text
+
+    # not for the other users, the demotion revokes the admin's tokens
+    crud.update_user(session, crud.UserUpdate(email="bulk-admin@example.com", superuser=False))
+    assert client.get("/api/users/export", headers=headers).status_code == 401
+    response = client.post("/api/token", data={"username": "bulk-admin@example.com", "password": "admin"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/users/export", headers=headers).status_code == 403
+    assert client.get("/api/users", headers=headers).status_code == 403
+
+
+def test_list_users(session, headers):
+    bulk.import_users(session, bulk.read_rows(io.StringIO(CSV), "csv"))
+    emails, params = [], {"q": "bulk-", "limit": 1}
+    while True:
+        with assert_max_queries(2):  # the page, maybe the user of the token, no matter how deep
+            response = client.get("/api/users", params=params, headers=headers)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 1
+        emails.extend(user["email"] for user in page["items"])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert emails == ["bulk-1@example.com", "bulk-2@example.com", "bulk-admin@example.com"]
+    assert set(page["items"][0]) == {"email", "name"}  # UserRead only
+
+    response = client.get("/api/users/all", headers=headers)
+    assert response.status_code == 200
+    streamed = [user["email"] for user in response.json()]
+    assert streamed == sorted(streamed)
+    assert set(emails) <= set(streamed)
+    assert set(response.json()[0]) == {"email", "name"}
+
+    params["order"] = "uid"  # a cursor of the ordering by email
+    assert client.get("/api/users", params=params, headers=headers).status_code == 400
+    assert client.get("/api/users", params={"limit": 0}, headers=headers).status_code == 422
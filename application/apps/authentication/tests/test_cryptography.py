@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from passlib.context import CryptContext
+
+from ..cryptography import (
+    PasswordHashingExecutor,
+    averify_password,
+    ahash_password,
+    adummy_verify,
+    password_hashing_options,
+    password_hashing_parameters,
+    verify_and_update_password,
+    verify_password,
+)
+from ..exceptions import PasswordHashingUnavailable
+
+
+@pytest.mark.asyncio
+async def test_async_hashing_wrappers():
+    hashed = await ahash_password("bar")
+    assert verify_password("bar", hashed)
+    assert await averify_password("bar", hashed)
+    assert not await averify_password("baz", hashed)
+    assert not await adummy_verify()
+
+
+@pytest.mark.asyncio
+async def test_saturated_executor_rejects_jobs():
+    executor = PasswordHashingExecutor(workers=1, max_pending=2)
+    release = threading.Event()
+    try:
+        jobs = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.pending == 2
+        with pytest.raises(PasswordHashingUnavailable):
+            await executor.run(release.wait)
+        release.set()
+        assert await asyncio.gather(*jobs) == [True, True]
+        assert executor.pending == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_bulk_jobs_leave_room_for_the_requests():
+    executor = PasswordHashingExecutor(workers=2, max_pending=8)
+    pending = []
+
+    def job(item):
+        pending.append(executor.pending)
+        time.sleep(0.01)
+        return item * 2
+
+    try:
+        assert list(executor.map(job, range(10), chunksize=5)) == [item * 2 for item in range(10)]
+        assert max(pending) <= 2  # one job per worker, the rest is left to the requests
+    finally:
+        executor.shutdown()
+
+
+def test_unknown_executor_kind():
+    with pytest.raises(ValueError):
+        PasswordHashingExecutor(workers=1, kind="fiber")
+
+
+def test_password_hashing_profiles():
+    assert password_hashing_parameters("bcrypt", "strong") == {"rounds": 13}
+    assert password_hashing_parameters("argon2", "minimum", rounds=3, memory_cost=None) == {
+        "rounds": 3, "memory_cost": 19_456, "parallelism": 1,
+    }
+    with pytest.raises(ValueError):
+        password_hashing_parameters("md5", "strong")
+    with pytest.raises(ValueError):
+        password_hashing_parameters("bcrypt", "fastest")
+
+
+def test_hashes_with_other_costs_are_updated():
+    """Lower and higher costs than configured are both updated, as are other schemes' hashes."""
+    context = CryptContext(**password_hashing_options("bcrypt", "minimum", rounds=5))
+    for rounds in (4, 6):
+        outdated = CryptContext(**password_hashing_options("bcrypt", "minimum", rounds=rounds)).hash("bar")
+        assert context.needs_update(outdated)
+        verified, new_hash = context.verify_and_update("bar", outdated)
+        assert verified and context.identify(new_hash) == "bcrypt" and not context.needs_update(new_hash)
+    assert not context.needs_update(context.hash("bar"))
+    assert CryptContext(**password_hashing_options("argon2", "minimum")).needs_update(context.hash("bar"))
+
+
+def test_verify_and_update_password():
+    outdated = CryptContext(**password_hashing_options("bcrypt", "minimum", rounds=4)).hash("bar")
+    verified, new_hash = verify_and_update_password("bar", outdated)
+    assert verified and verify_password("bar", new_hash)
+    assert verify_and_update_password("baz", outdated) == (False, None)
+    assert verify_and_update_password("bar", "not a hash") == (False, None)
@@ -0,0 +1,64 @@
+import pytest
+from sqlmodel import SQLModel, select
+
+from ....database.dependencies import get_session, ENGINE
+from ....database.query_plans import capture_statements, full_scan, full_scans
+
+from ..models import User, UserUpdate
+from .. import crud
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    session.add(User(email="plans@example.com", name="Plans", password="-", scopes=""))
+    session.commit()
+    yield session
+    for user in crud.get_users(session):
+        if user.email == "plans@example.com":
+            crud.delete_user(session, user)
+
+
+def test_only_the_queried_columns_are_indexed():
+    indexes = {index.name: [column.name for column in index.columns] for index in User.__table__.indexes}
+    assert indexes == {"ix_user_email": ["email"]}
+    assert [column.name for column in User.__table__.primary_key] == ["uid"]
+
+
+def test_crud_lookups_use_the_indexes(session):
+    email = "plans@example.com"
+    with capture_statements(ENGINE) as statements:
+        user = crud.get_user_by_email(session, email)
+        crud.get_user_by_uid(session, user.uid)
+        crud.email_exists(session, email)
+        crud.update_user(session, UserUpdate(email=email, name="Plans Updated"))
+        crud.update_user_password_hash(session, user, "-")
+        crud.get_users_page(session, limit=10, q="plans")
+        crud.get_users_page(session, limit=10, after=user.uid, order="uid")
+        list(crud.iterate_users(session))
+    assert len(statements) > 8
+    assert full_scans(ENGINE, statements) == []
+
+
+def test_unindexed_lookups_are_flagged(session):
+    with capture_statements(ENGINE) as statements:
+        session.exec(select(User).where(User.name == "Plans")).all()
+    [(statement, line)] = full_scans(ENGINE, statements)
+    assert "WHERE user.name" in statement
+
+
+@pytest.mark.parametrize("line, table", [
+    ("SCAN user", "user"),
+    ("SCAN TABLE user", "user"),
+    ("SCAN user USING INDEX ix_user_email", None),
+    ("SEARCH user USING INDEX ix_user_email (email=?)", None),
+    ("SCAN CONSTANT ROW", None),
+])
+def test_sqlite_full_scan(line, table):
+    assert full_scan("sqlite", line) == table
+
+
+def test_postgresql_full_scan():
+    assert full_scan("postgresql", 'Seq Scan on "user"  (cost=0.00..1.01 rows=1 width=200)') == "user"
+    assert full_scan("postgresql", "Index Scan using ix_user_email on \"user\"") is None
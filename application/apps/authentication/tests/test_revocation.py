@@ -0,0 +1,138 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel, select
+
+from ....config import settings
+from ....main import app
+from ....database.dependencies import get_session, ENGINE
+from ....database.query_tracker import assert_max_queries
+
+from ..models import RevokedToken, UserCreate
+from ..revocation import BloomFilter, RevocationList, revocation_list
+from .. import crud
+
+
+EMAIL = "revoked@acid.net"
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    existing = crud.get_user_by_email(session, EMAIL)
+    if existing is not None:
+        crud.delete_user(session, existing)
+    crud.create_user(
+        session, UserCreate(email=EMAIL, name="Revoked", password="bar", disabled=False, scopes="users/whoami"),
+    )
+    yield session
+    user = crud.get_user_by_email(session, EMAIL)
+    if user is not None:
+        crud.delete_user(session, user)
+
+
+@pytest.fixture
+def client(session) -> TestClient:
+    return TestClient(app, base_url="http://127.0.0.1:8000")
+
+
+def login(client: TestClient, password: str = "bar") -> dict:
+    response = client.post("/api/token", data={"username": EMAIL, "password": password})
+    assert response.status_code == 200
+    return response.json()
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"token-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert len(bloom) == 1000
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300  # ~1%
+
+
+def test_tokens_that_are_not_revoked_cost_no_query(client):
+    tokens = login(client)
+    client.get("/api/whoami", headers=bearer(tokens["access_token"]))  # cached
+    with assert_max_queries(0):
+        assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 200
+
+
+def test_logout(client):
+    tokens, other = login(client), login(client)
+    response = client.post("/api/token/revoke", headers=bearer(tokens["access_token"]))
+    assert response.status_code == 204
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 401
+    # other logins of the user stay valid
+    assert client.get("/api/whoami", headers=bearer(other["access_token"])).status_code == 200
+
+
+def test_new_passwords_revoke_stateless_access_tokens(monkeypatch, client):
+    monkeypatch.setattr(settings, "AUTH_STATELESS", True)
+    tokens = login(client)
+    response = client.patch(
+        "/api/whoami/password",
+        headers=bearer(tokens["access_token"]),
+        json={"password": "baz", "confirmation": "baz"},
+    )
+    assert response.status_code == 200
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 401
+    assert client.get("/api/whoami", headers=bearer(login(client, password="baz")["access_token"])).status_code == 200
+
+
+@pytest.mark.parametrize("change", [{"disabled": True}, {"scopes": ""}, {"superuser": True}])
+def test_changed_rights_revoke_the_cached_tokens_of_all_workers(monkeypatch, client, session, change):
+    tokens = login(client)
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 200  # cached
+    # the cache of another worker (with CACHE_BACKEND=memory) isn't invalidated
+    monkeypatch.setattr(crud.token_cache, "invalidate_user", lambda email: None)
+    crud.update_user(session, crud.UserUpdate(email=EMAIL, name="Renamed"))
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 200
+    crud.update_user(session, crud.UserUpdate(email=EMAIL, **change))
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 401
+
+
+def test_deleted_users_are_revoked(client, session):
+    tokens = login(client)
+    crud.delete_user(session, crud.get_user_by_email(session, EMAIL))
+    assert revocation_list.subject_revoked(EMAIL, issued_at=time.time() - 1)
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 401
+
+
+def test_revocations_take_effect_once_committed(session):
+    revocation_list.revoke_token(session, jti="rolled-back", expires_at=time.time() + 60)
+    assert "rolled-back" not in revocation_list.filter
+    session.rollback()
+    revocation_list.revoke_token(session, jti="committed", expires_at=time.time() + 60)
+    session.commit()
+    assert "committed" in revocation_list.filter
+    assert "rolled-back" not in revocation_list.filter
+
+
+def test_refresh_loads_the_revocations_of_other_workers(session):
+    worker = RevocationList(capacity=100, error_rate=0.01)
+    worker.refresh(session)  # the initial load
+
+    revocation_list.revoke_token(session, jti="revoked-elsewhere", expires_at=time.time() + 60)
+    revocation_list.revoke_token(session, jti="expired", expires_at=time.time() - 60)
+    session.commit()
+    assert "revoked-elsewhere" not in worker.filter
+
+    worker.refresh(session)
+    assert "revoked-elsewhere" in worker.filter
+    assert len(worker.filter) == len(set(session.exec(select(RevokedToken.jti)).all()) - {None})
+
+    # the purge deletes the expired rows and rebuilds the filter without them
+    worker.next_purge = 0
+    worker.refresh(session)
+    assert session.exec(select(RevokedToken).where(RevokedToken.jti == "expired")).first() is None
+    assert "revoked-elsewhere" in worker.filter
+    assert len(worker.filter) == len(set(session.exec(select(RevokedToken.jti)).all()) - {None})
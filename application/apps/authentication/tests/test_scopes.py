@@ -0,0 +1,70 @@
+import pytest
+from sqlmodel import SQLModel
+
+from ....database.dependencies import get_session, ENGINE
+
+from ..models import TokenPayload, UserCreate, UserUpdate
+from ..scopes import ScopeRegistry, scope_registry
+from .. import crud
+
+
+@pytest.fixture
+def registry() -> ScopeRegistry:
+    return ScopeRegistry(["unauthorized", "users/whoami", "users/list", "logs/read"])
+
+
+def test_masks(registry):
+    assert registry.mask("users/whoami") == 0b10
+    assert registry.mask("users/whoami, logs/read") == registry.mask(["logs/read", "users/whoami"]) == 0b1010
+    assert registry.mask("") == registry.mask(None) == 0
+    assert registry.names(0b1010) == ["users/whoami", "logs/read"]
+    with pytest.raises(ValueError):
+        registry.mask("users/delete")
+
+
+def test_wildcards(registry):
+    assert registry.mask("users/*") == 0b110
+    assert registry.mask("*") == registry.all == 0b1111
+    with pytest.raises(ValueError):
+        registry.mask("admin/*")
+
+
+def test_grants(registry):
+    required = registry.required(["users/whoami", "logs/read"])
+    assert registry.grants(registry.mask("users/*,logs/read"), required)
+    assert not registry.grants(registry.mask("users/*"), required)
+    assert registry.grants(0, registry.required([]))
+    assert registry.required(["users/whoami", "logs/read"]) is required
+
+
+def test_invalid_registries():
+    with pytest.raises(ValueError):
+        ScopeRegistry(["users/whoami", "users/whoami"])
+    with pytest.raises(ValueError):
+        ScopeRegistry(["users/*"])
+
+
+def test_token_payload_masks():
+    whoami = scope_registry.mask("users/whoami")
+    assert TokenPayload(email="alice@acid.net", scope_mask=whoami).scope_mask == whoami
+    # tokens issued without the scm claim
+    assert TokenPayload(email="alice@acid.net", scopes=["users/whoami"]).scope_mask == whoami
+    with pytest.raises(ValueError):
+        TokenPayload(email="alice@acid.net", scope_mask=scope_registry.all + 1)
+    with pytest.raises(ValueError):
+        TokenPayload(email="alice@acid.net", scopes=["users/delete"])
+
+
+def test_user_scope_mask_follows_the_scopes():
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    email = "scoped@acid.net"
+    existing = crud.get_user_by_email(session, email)
+    if existing is not None:
+        crud.delete_user(session, existing)
+
+    user = crud.create_user(session, UserCreate(email=email, name="Scoped", password="-", scopes="users/whoami"))
+    assert user.scope_mask == scope_registry.mask("users/whoami")
+    user = crud.update_user(session, UserUpdate(email=email, scopes="users/*,logs/read"))
+    assert scope_registry.names(user.scope_mask) == ["users/whoami", "logs/read"]
+    crud.delete_user(session, user)
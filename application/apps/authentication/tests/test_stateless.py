@@ -0,0 +1,107 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+from ....config import settings
+from ....main import app
+from ....database.dependencies import get_session, ENGINE
+from ....database.query_tracker import assert_max_queries
+
+from ..cryptography import token_codec
+from ..models import UserCreate, UserUpdate
+from .. import crud
+
+
+EMAIL = "stateless@acid.net"
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    existing = crud.get_user_by_email(session, EMAIL)
+    if existing is not None:
+        crud.delete_user(session, existing)
+    crud.create_user(
+        session, UserCreate(email=EMAIL, name="Stateless", password="bar", disabled=False, scopes="users/whoami"),
+    )
+    yield session
+    user = crud.get_user_by_email(session, EMAIL)
+    if user is not None:
+        crud.delete_user(session, user)
+
+
+@pytest.fixture
+def client(monkeypatch, session) -> TestClient:
+    monkeypatch.setattr(settings, "AUTH_STATELESS", True)
+    return TestClient(app, base_url="http://127.0.0.1:8000")
+
+
+def login(client: TestClient, password: str = "bar") -> dict:
+    response = client.post("/api/token", data={"username": EMAIL, "password": password})
+    assert response.status_code == 200
+    return response.json()
+
+
+def refresh(client: TestClient, refresh_token: str):
+    return client.post("/api/token/refresh", data={"refresh_token": refresh_token})
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_protected_routes_without_queries(client):
+    tokens = login(client)
+    claims = token_codec.decode(tokens["access_token"])
+    assert {"uid", "name", "dis", "su", "ver"} <= claims.keys()
+    with assert_max_queries(0):
+        response = client.get("/api/whoami", headers=bearer(tokens["access_token"]))
+    assert response.status_code == 200
+    assert response.json() == {"email": EMAIL, "name": "Stateless"}
+    # a refresh token is no access token
+    assert client.get("/api/whoami", headers=bearer(tokens["refresh_token"])).status_code == 401
+
+
+def test_refresh(client):
+    tokens = login(client)
+    with assert_max_queries(1):  # the user by uid
+        response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200
+    assert response.json()["refresh_token"] == tokens["refresh_token"]
+    assert client.get("/api/whoami", headers=bearer(response.json()["access_token"])).status_code == 200
+
+    assert refresh(client, tokens["access_token"]).status_code == 401
+    assert refresh(client, "wrongtoken").status_code == 401
+
+
+def test_changes_revoke_the_refresh_tokens(client, session):
+    tokens = login(client)
+    # the user of the claims is stored like a loaded one
+    response = client.patch(
+        "/api/whoami/password",
+        headers=bearer(tokens["access_token"]),
+        json={"password": "baz", "confirmation": "baz"},
+    )
+    assert response.status_code == 200
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    assert refresh(client, login(client, password="baz")["refresh_token"]).status_code == 200
+
+    tokens = login(client, password="baz")
+    crud.update_user(session, UserUpdate(email=EMAIL, disabled=True))
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_name_changes_keep_the_tokens(client, session):
+    tokens = login(client)
+    crud.update_user(session, UserUpdate(email=EMAIL, name="Renamed"))
+    assert refresh(client, tokens["refresh_token"]).status_code == 200
+
+
+def test_stateful_tokens_are_checked_against_the_version(monkeypatch, session):
+    client = TestClient(app, base_url="http://127.0.0.1:8000")
+    tokens = login(client)
+    assert "refresh_token" not in tokens
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 200
+    crud.update_user_password(session, crud.get_user_by_email(session, EMAIL), "baz")
+    assert client.get("/api/whoami", headers=bearer(tokens["access_token"])).status_code == 401
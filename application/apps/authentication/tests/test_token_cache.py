@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from pymemcache.test.utils import MockMemcacheClient
+
+from ....common.cache import MemoryCache, MemcachedCache, get_serde
+
+from ..cache import TokenCache, user_from_snapshot, user_snapshot
+from ..models import TokenPayload, User
+
+
+@pytest.fixture(params=["memory", "memcached"])
+def cache(request) -> TokenCache:
+    if request.param == "memory":
+        return TokenCache(ttl=60, backend=MemoryCache())
+    return TokenCache(ttl=60, backend=MemcachedCache(client=MockMemcacheClient(serde=get_serde("json"))))
+
+
+@pytest.fixture
+def user() -> User:
+    return user_from_snapshot({
+        "uid": "f6b1c0a4-4a5e-4f0e-9a5c-0d6c1b7f2e11",
+        "email": "alice@acid.net",
+        "name": "Alice Wonderson",
+        "password": "$2b$13$notarealhashnotarealhashnotarealhashnotarealhashnot",
+        "scopes": "users/whoami",
+        "scope_mask": 0b10,
+        "disabled": False,
+        "superuser": False,
+        "token_version": 0,
+    })
+
+
+@pytest.fixture
+def payload() -> TokenPayload:
+    return TokenPayload(email="alice@acid.net", scopes=["users/whoami"])
+
+
+def test_hit_and_miss(cache, user, payload):
+    assert cache.get("token") is None
+    generation = cache.generation(payload.email)
+    cache.set("token", payload=payload, user=user, exp=time.time() + 60, generation=generation)
+    cached = cache.get("token")
+    assert cached.payload == payload
+    assert user_snapshot(cached.user) == user_snapshot(user)
+    assert cached.user is not cached.user
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_the_password_hash_is_not_cached(cache, user, payload):
+    cache.set("token", payload=payload, user=user, exp=time.time() + 60, generation=cache.generation(payload.email))
+    assert "password" not in cache.backend.get(cache.key("token"))["user"]
+
+
+def test_entries_expire_with_the_token(cache, user, payload):
+    generation = cache.generation(payload.email)
+    cache.set("token", payload=payload, user=user, exp=time.time() - 1, generation=generation)
+    assert cache.get("token") is None
+
+
+def test_invalidate_user(cache, user, payload):
+    generation = cache.generation(payload.email)
+    cache.set("token", payload=payload, user=user, exp=time.time() + 60, generation=generation)
+    cache.invalidate_user(payload.email)
+    assert cache.get("token") is None
+    # a user loaded before the invalidation is never served
+    cache.set("token", payload=payload, user=user, exp=time.time() + 60, generation=generation)
+    assert cache.get("token") is None
+    cache.set("token", payload=payload, user=user, exp=time.time() + 60, generation=cache.generation(payload.email))
+    assert cache.get("token") is not None
+
+
+def test_disabled(user, payload):
+    cache = TokenCache(ttl=0, backend=MemoryCache())
+    cache.set("token", payload=payload, user=user, exp=time.time() + 60, generation=cache.generation(payload.email))
+    assert cache.get("token") is None
+
+
+@pytest.mark.asyncio
+async def test_failing_memcached_is_a_miss(user, payload):
+    cache = TokenCache(ttl=60, backend=MemcachedCache(client=MockMemcacheClient(serde=get_serde("json"))))
+    generation = await cache.ageneration(payload.email)
+    await cache.aset("token", payload=payload, user=user, exp=time.time() + 60, generation=generation)
+    assert await cache.aget("token") is not None
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionRefusedError(111, "Connection refused")
+
+    for command in ("get", "set", "add", "incr"):
+        setattr(cache.backend.client, command, unavailable)
+    assert await cache.aget("token") is None
+    assert await cache.ageneration(payload.email) is None
+    await cache.ainvalidate_user(payload.email)  # after the commit, must not fail the request
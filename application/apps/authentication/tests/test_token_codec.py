@@ -0,0 +1,98 @@
+import base64
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from ..cryptography import TOKEN_CODECS, JoseTokenCodec, NativeTokenCodec, create_token_codec
+from ..exceptions import InvalidToken
+
+
+SECRET = "not-so-secret"
+
+
+def pem(private_key) -> dict:
+    private = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ).decode()
+    public = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return {"private_key": private, "public_key": public}
+
+
+KEYS = {
+    "HS256": {},
+    "ES256": pem(ec.generate_private_key(ec.SECP256R1())),
+    "EdDSA": pem(ed25519.Ed25519PrivateKey.generate()),
+}
+
+
+def codec(backend: str, algorithm: str, **keys):
+    if backend == "pyjwt":
+        pytest.importorskip("jwt")
+    if backend == "jose" and algorithm == "EdDSA":
+        pytest.skip("python-jose supports no EdDSA")
+    return create_token_codec(backend, algorithm, **{"secret_key": SECRET, **KEYS[algorithm], **keys})
+
+
+def claims(**extra) -> dict:
+    return {"sub": "alice@acid.net", "scopes": ["users/whoami"], "exp": int(time.time()) + 60, **extra}
+
+
+@pytest.mark.parametrize("algorithm", KEYS)
+@pytest.mark.parametrize("backend", TOKEN_CODECS)
+def test_round_trip(backend, algorithm):
+    token_codec = codec(backend, algorithm)
+    assert token_codec.decode(token_codec.encode(claims())) == claims()
+
+
+@pytest.mark.parametrize("algorithm", ["HS256", "ES256"])
+def test_backends_read_each_others_tokens(algorithm):
+    native, jose = codec("native", algorithm), codec("jose", algorithm)
+    assert jose.decode(native.encode(claims())) == claims()
+    assert native.decode(jose.encode(claims())) == claims()
+
+
+@pytest.mark.parametrize("backend", TOKEN_CODECS)
+def test_invalid_tokens(backend):
+    token_codec = codec(backend, "HS256")
+    header, payload, signature = token_codec.encode(claims()).split(".")
+    forged = base64.urlsafe_b64encode(json.dumps(claims(scopes=["logs/read"])).encode()).rstrip(b"=").decode()
+    unsigned = base64.urlsafe_b64encode(b'{"alg":"none","typ":"JWT"}').rstrip(b"=").decode()
+    invalid = [
+        f"{header}.{forged}.{signature}",
+        f"{unsigned}.{payload}.",
+        token_codec.encode(claims(exp=int(time.time()) - 1)),
+        token_codec.encode({"sub": "alice@acid.net"}),  # no exp
+        token_codec.encode(claims(nbf=int(time.time()) + 60)),
+        codec(backend, "HS256", secret_key="another secret").encode(claims()),
+        "wrongtoken",
+        "",
+    ]
+    for token in invalid:
+        with pytest.raises(InvalidToken):
+            token_codec.decode(token)
+
+
+def test_verifying_only():
+    token = codec("native", "ES256").encode(claims())
+    verifier = NativeTokenCodec("ES256", SECRET, public_key=KEYS["ES256"]["public_key"])
+    assert verifier.decode(token) == claims()
+    with pytest.raises(ValueError):
+        verifier.encode(claims())
+
+
+def test_invalid_configurations():
+    with pytest.raises(ValueError):
+        create_token_codec("fastest", "HS256")
+    with pytest.raises(ValueError):
+        NativeTokenCodec("none", SECRET)
+    with pytest.raises(ValueError):
+        NativeTokenCodec("ES256", SECRET)  # no keys
+    with pytest.raises(ValueError):
+        NativeTokenCodec("ES256", SECRET, **KEYS["EdDSA"])
+    with pytest.raises(ValueError):
+        JoseTokenCodec("EdDSA", SECRET, **KEYS["EdDSA"])
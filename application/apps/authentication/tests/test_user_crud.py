@@ -1,11 +1,21 @@
 import pytest
 
+from pydantic.error_wrappers import ValidationError
 from sqlmodel import SQLModel
+from sqlmodel.pool import StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 
 from ....database.dependencies import get_session, ENGINE
+from ....database.sqlmodel import get_async_database_url
+from ....common.pagination import decode_cursor
 
-from ..cryptography import verify_password
-from ..models import UserCreate, UserUpdate
+from passlib.context import CryptContext
+
+from ..cryptography import password_hashing_options, pwd_context, verify_password
+from ..dependencies import aauthenticate_user
+from ..models import User, UserCreate, UserUpdate
+from ..exceptions import bypass_email_validation_error
 from .. import crud
 
 
@@ -40,6 +50,14 @@ class TestUserCRUD:
         assert user_db_alice.scopes == user_data_alice["scopes"]
         assert verify_password(user_data_alice["password"], user_db_alice.password)
 
+    def test_create_user_with_existing_email(self, session, user_db_alice, user_data_alice):
+        # the unique index on email rejects the duplicate
+        with pytest.raises(ValidationError) as error:
+            crud.create_user(session=session, user=UserCreate(**user_data_alice))
+        bypass_email_validation_error(error.value)
+        assert crud.email_exists(session=session, email=user_data_alice["email"])
+        assert crud.get_users(session) == [user_db_alice]
+
     def test_read_user(self, session, user_db_alice, user_data_alice):
         # read user alice
         users = crud.get_users(session)
@@ -60,3 +78,82 @@ class TestUserCRUD:
         assert success
         users = crud.get_users(session)
         assert users == []
+
+    def test_get_users_page(self, session, clean_db):
+        # the passwords don't matter here, skip hashing them
+        for number in range(5):
+            session.add(User(email=f"page-{number}@example.com", password="-", scopes=""))
+        session.add(User(email="other@example.com", password="-", scopes=""))
+        session.commit()
+
+        emails, cursor = [], None
+        while True:
+            after = decode_cursor(cursor, "email") if cursor else None
+            users, cursor = crud.get_users_page(session, limit=2, after=after, q="page-")
+            emails.extend(user.email for user in users)
+            if cursor is None:
+                break
+        assert emails == [f"page-{number}@example.com" for number in range(5)]
+
+        assert [user.email for user in crud.iterate_users(session, yield_per=2)] == ["other@example.com"] + emails
+
+        by_uid, cursor = crud.get_users_page(session, limit=6, order="uid")
+        assert [user.uid for user in by_uid] == sorted(user.uid for user in crud.get_users(session))
+        assert cursor is None
+
+        for user in crud.get_users(session):
+            crud.delete_user(session, user)
+
+
+@pytest.mark.usefixtures("user_data_alice")
+class TestAsyncUserCRUD:
+
+    @pytest.fixture(name="async_session")
+    async def async_session_fixture(self):
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+        await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_async_crud(self, async_session, user_data_alice):
+        alice = await crud.acreate_user(session=async_session, user=UserCreate(**user_data_alice))
+        assert alice.email == user_data_alice["email"]
+        assert await crud.aemail_exists(session=async_session, email=user_data_alice["email"])
+
+        with pytest.raises(ValidationError) as error:
+            await crud.acreate_user(session=async_session, user=UserCreate(**user_data_alice))
+        bypass_email_validation_error(error.value)
+
+        assert await crud.aget_user_by_uid(session=async_session, uid=alice.uid) == alice
+        assert [user async for user in crud.aiterate_users(session=async_session, yield_per=1)] == [alice]
+        updated = await crud.aupdate_user(session=async_session, user=UserUpdate(email=alice.email, name="Alice W."))
+        assert updated.name == "Alice W."
+        updated = await crud.aupdate_user_password(session=async_session, user=alice, new_password="baz")
+        assert verify_password("baz", updated.password)
+
+        assert await crud.adelete_user(session=async_session, user=alice)
+        assert await crud.aget_users(session=async_session) == []
+        assert await crud.aget_user_by_email(session=async_session, email=user_data_alice["email"]) is None
+
+    @pytest.mark.asyncio
+    async def test_outdated_password_hash_is_updated_on_login(self, async_session, user_data_alice):
+        alice = await crud.acreate_user(session=async_session, user=UserCreate(**user_data_alice))
+        password = user_data_alice["password"]
+        outdated = CryptContext(**password_hashing_options("bcrypt", "minimum", rounds=4)).hash(password)
+        await crud.aupdate_user_password_hash(session=async_session, user=alice, hashed_password=outdated)
+
+        assert await aauthenticate_user(session=async_session, username=alice.email, password="wrong") is False
+        assert (await crud.aget_user_by_email(session=async_session, email=alice.email)).password == outdated
+        user = await aauthenticate_user(session=async_session, username=alice.email, password=password)
+        assert user.password != outdated and not pwd_context.needs_update(user.password)
+        assert (await crud.aget_user_by_email(session=async_session, email=alice.email)).password == user.password
+
+    def test_async_database_url(self):
+        assert get_async_database_url("sqlite:///./production.db") == "sqlite+aiosqlite:///./production.db"
+        assert get_async_database_url("postgresql://user@host/db") == "postgresql+asyncpg://user@host/db"
+        assert get_async_database_url("postgresql+asyncpg://user@host/db") == "postgresql+asyncpg://user@host/db"
+        with pytest.raises(ValueError):
+            get_async_database_url("mysql://user@host/db")
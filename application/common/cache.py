@@ -0,0 +1,343 @@
+"""
+Pluggable cache tier.
+
+    cache = get_cache()  # configured by settings.CACHE_BACKEND
+    cache.set("key", {"some": "value"}, ttl=60)
+    cache.get_many(["key", "other"])
+
+MemoryCache lives in the worker's memory, MemcachedCache is shared by all workers (and hosts).
+The memcached calls are network round trips: from async code, call `blocking` backends in the threadpool.
+A failing memcached server is treated like a miss (and logged), the cache is never the reason a request fails.
+"""
+import json
+import logging
+import pickle
+import threading
+import time
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..config import validators
+
+
+log = logging.getLogger('application')
+
+# a failing memcached server is logged at most once per interval, not on every request
+ERROR_LOG_INTERVAL = 60
+
+
+class CacheBackend:
+    """
+    Interface of all cache backends.
+
+    ttl: seconds until an entry expires, 0 for no expiry, None for the backend's default_ttl.
+    blocking: the calls do network round trips, async code runs them in the threadpool.
+    """
+    blocking = False
+
+    def __init__(self, default_ttl: int = 300):
+        self.default_ttl = default_ttl
+
+    def _ttl(self, ttl: Optional[int]) -> int:
+        return self.default_ttl if ttl is None else ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return the found entries only."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        raise NotImplementedError
+
+    def set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        """Set the entry only if it does not exist yet, return True if it has been set."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_many(self, keys: Iterable[str]):
+        for key in keys:
+            self.delete(key)
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        """Increment an integer entry, return None if it does not exist."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """
+    Per-worker LRU cache with expiring entries.
+
+    Values are stored as they are (not serialized), don't mutate them after setting or getting.
+    """
+
+    def __init__(self, max_entries: int = 10_000, default_ttl: int = 300):
+        super().__init__(default_ttl=default_ttl)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires_at(self, ttl: Optional[int]) -> float:
+        ttl = self._ttl(ttl)
+        return time.monotonic() + ttl if ttl else float("inf")
+
+    def _get(self, key: str) -> Tuple[Any, bool]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None, False
+        self._entries.move_to_end(key)
+        return value, True
+
+    def _set(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            value, found = self._get(key)
+        return value if found else default
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                value, exists = self._get(key)
+                if exists:
+                    found[key] = value
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        expires_at = self._expires_at(ttl)
+        with self._lock:
+            self._set(key, value, expires_at)
+
+    def set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None):
+        expires_at = self._expires_at(ttl)
+        with self._lock:
+            for key, value in mapping.items():
+                self._set(key, value, expires_at)
+
+    def add(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        expires_at = self._expires_at(ttl)
+        with self._lock:
+            _, exists = self._get(key)
+            if exists:
+                return False
+            self._set(key, value, expires_at)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        with self._lock:
+            value, exists = self._get(key)
+            if not exists:
+                return None
+            _, expires_at = self._entries[key]
+            value = int(value) + delta
+            self._entries[key] = (value, expires_at)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# -- memcached ----------------------------------------------------------------
+FLAG_BYTES = 0
+FLAG_TEXT = 1 << 0
+FLAG_INTEGER = 1 << 1
+FLAG_SERIALIZED = 1 << 2
+
+
+class Serde:
+    """
+    pymemcache serializer: bytes, text and integers are stored plain (memcached's incr works on them),
+    everything else is serialized with `dumps` and `loads`.
+    """
+
+    def __init__(self, dumps, loads):
+        self.dumps = dumps
+        self.loads = loads
+
+    def serialize(self, key, value) -> Tuple[bytes, int]:
+        if isinstance(value, bytes):
+            return value, FLAG_BYTES
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode(), FLAG_INTEGER
+        if isinstance(value, str):
+            return value.encode(), FLAG_TEXT
+        return self.dumps(value), FLAG_SERIALIZED
+
+    def deserialize(self, key, value: bytes, flags: int) -> Any:
+        if flags == FLAG_BYTES:
+            return value
+        if flags == FLAG_INTEGER:
+            return int(value)
+        if flags == FLAG_TEXT:
+            return value.decode()
+        return self.loads(value)
+
+
+def get_serde(name: str) -> Serde:
+    """
+    Serializers by name: json (the default), pickle or dill.
+    pickle and dill load what the server returns as code, use them with memcached servers no one else can write to.
+    """
+    if name == "pickle":
+        return Serde(dumps=lambda value: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), loads=pickle.loads)
+    if name == "json":
+        return Serde(dumps=lambda value: json.dumps(value, separators=(",", ":")).encode(), loads=json.loads)
+    if name == "dill":
+        import dill  # lazy import, only needed for this serializer
+        return Serde(dumps=dill.dumps, loads=dill.loads)
+    raise ValueError(f"Unknown cache serializer: {name}")
+
+
+def parse_servers(servers: str) -> List[Tuple[str, int]]:
+    """'host:port,host' -> [('host', port), ('host', 11211)]"""
+    parsed = []
+    for server in validators.dissassemble_comma_seperated_lists_of_strings(servers):
+        host, _, port = server.partition(":")
+        parsed.append((host, int(port or 11211)))
+    return parsed
+
+
+class MemcachedCache(CacheBackend):
+    """
+    Cache shared by all workers, through pooled connections to one or more memcached servers.
+
+    Pass a `client` (e.g. pymemcache.test.utils.MockMemcacheClient) to run without a memcached server.
+    Errors of the servers are logged and answered like misses: get returns the default, add False, incr None.
+    """
+    blocking = True
+
+    def __init__(
+        self,
+        servers: List[Tuple[str, int]] = None,
+        pool_size: int = 8,
+        serializer: str = "json",
+        key_prefix: str = "",
+        default_ttl: int = 300,
+        timeout: float = 0.5,
+        client=None,
+    ):
+        from pymemcache.exceptions import MemcacheError
+        super().__init__(default_ttl=default_ttl)
+        self.key_prefix = key_prefix
+        if client is None:
+            client = self._create_client(servers or [("127.0.0.1", 11211)], pool_size, get_serde(serializer), timeout)
+        self.client = client
+        self.errors = (MemcacheError, OSError)  # socket.timeout is an OSError
+        self._error_logged_at = float("-inf")
+
+    @staticmethod
+    def _create_client(servers, pool_size: int, serde: Serde, timeout: float):
+        from pymemcache.client.base import PooledClient
+        from pymemcache.client.hash import HashClient
+        options = dict(serde=serde, connect_timeout=timeout, timeout=timeout, max_pool_size=pool_size)
+        if len(servers) == 1:
+            return PooledClient(servers[0], **options)
+        return HashClient(servers, use_pooling=True, **options)
+
+    def make_key(self, key: str) -> str:
+        """Memcached keys are limited to 250 printable characters, longer keys are hashed."""
+        key = f"{self.key_prefix}:{key}" if self.key_prefix else key
+        if len(key) > 200 or any(c.isspace() or not c.isprintable() for c in key):
+            key = hashlib.sha256(key.encode()).hexdigest()
+        return key
+
+    def _call(self, command: str, *args, miss: Any = None, **kwargs) -> Any:
+        """Run a client command, return `miss` if the server fails."""
+        try:
+            return getattr(self.client, command)(*args, **kwargs)
+        except self.errors as error:
+            now = time.monotonic()
+            if now - self._error_logged_at >= ERROR_LOG_INTERVAL:
+                self._error_logged_at = now
+                log.warning(f"Memcached {command} failed, treated as a cache miss: {error!r}")
+            return miss
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._call("get", self.make_key(key), default, miss=default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = {self.make_key(key): key for key in keys}
+        if not keys:
+            return {}
+        found = self._call("get_many", list(keys), miss={})
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self._call("set", self.make_key(key), value, expire=self._ttl(ttl))
+
+    def set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None):
+        if mapping:
+            mapping = {self.make_key(key): value for key, value in mapping.items()}
+            self._call("set_many", mapping, expire=self._ttl(ttl))
+
+    def add(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        return self._call("add", self.make_key(key), value, expire=self._ttl(ttl), noreply=False, miss=False)
+
+    def delete(self, key: str):
+        self._call("delete", self.make_key(key))
+
+    def delete_many(self, keys: Iterable[str]):
+        keys = [self.make_key(key) for key in keys]
+        if keys:
+            self._call("delete_many", keys)
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        value = self._call("incr", self.make_key(key), delta, noreply=False)
+        return None if value is None else int(value)
+
+    def clear(self):
+        self.client.flush_all()
+
+
+async def off_the_event_loop(backend: CacheBackend, function: Callable, *args, **kwargs) -> Any:
+    """Call a function using the backend, in the threadpool if the backend is blocking."""
+    if backend.blocking:
+        return await run_in_threadpool(function, *args, **kwargs)
+    return function(*args, **kwargs)
+
+
+@lru_cache
+def get_cache() -> CacheBackend:
+    """
+    The cache backend configured in the settings, one instance per worker.
+    """
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryCache(max_entries=settings.CACHE_MAX_ENTRIES, default_ttl=settings.CACHE_DEFAULT_TTL)
+    if settings.CACHE_BACKEND == "memcached":
+        return MemcachedCache(
+            servers=parse_servers(settings.CACHE_SERVERS),
+            pool_size=settings.CACHE_POOL_SIZE,
+            serializer=settings.CACHE_SERIALIZER,
+            key_prefix=settings.CACHE_KEY_PREFIX,
+            default_ttl=settings.CACHE_DEFAULT_TTL,
+            timeout=settings.CACHE_TIMEOUT,
+        )
+    raise ValueError(f"Unknown cache backend: {settings.CACHE_BACKEND}")
@@ -1,15 +1,41 @@
 from typing import Optional
 
-from fastapi import HTTPException
+from fastapi import HTTPException, Query
 
 from ..config import settings
 
+from .pagination import InvalidCursor, decode_cursor
+
 
 class CommonQueryParams:
     def __init__(self, q: Optional[str] = None, offset: int = 0, limit: int = 100):
         self.q = q
         self.offset = offset
-        self.limit = offset
+        self.limit = limit
+
+
+class PageQueryParams(CommonQueryParams):
+    """
+    Query parameters of a keyset paginated list: `q`, `limit` and the `cursor` of the next page.
+    Pass the cursor with the same `order` as the page it came from.
+    """
+    def __init__(
+        self,
+        q: Optional[str] = Query(None, min_length=1, max_length=254),
+        cursor: Optional[str] = None,
+        limit: int = Query(100, gt=0, le=1000),
+    ):
+        super().__init__(q=q, offset=0, limit=limit)
+        self.cursor = cursor
+
+    def after(self, order: str):
+        """The last key of the previous page (None on the first page)."""
+        if self.cursor is None:
+            return None
+        try:
+            return decode_cursor(self.cursor, order)
+        except InvalidCursor as error:
+            raise HTTPException(status_code=400, detail=str(error))
 
 
 async def block_request_when_in_production(_settings=None):
@@ -1,5 +1,4 @@
-import inspect
-import re
+from types import ModuleType
 from typing import List
 
 from pathlib import Path
@@ -7,38 +6,66 @@ from importlib import import_module
 
 
 ROOT_DIR = Path(__file__).parent.parent.parent
+APPS_DIR = ROOT_DIR / 'application' / 'apps'
+# "application", or "package.application" when pytest imports the repository (it has an __init__.py) as a package
+APPLICATION_PACKAGE = __package__.rpartition(".")[0]
 
 
 def get_all_app_names() -> List[str]:
     """
     Return all apps that should be migrated with alembic revisions.
     """
-    return [p.name for p in (ROOT_DIR / 'application' / 'apps').iterdir() if p.is_dir() and not p.name.startswith('__')]
+    return [p.name for p in APPS_DIR.iterdir() if p.is_dir() and not p.name.startswith('__')]
+
+
+def import_models(module_path: str) -> ModuleType | None:
+    """
+    Import a models module, its tables register themselves in `SQLModel.metadata`.
+    Returns None, if the app has no models, errors inside the module are raised.
+    """
+    try:
+        return import_module(module_path)
+    except ModuleNotFoundError as error:
+        if error.name != module_path:
+            raise
+        return None
+
+
+def models_module_path(app: str) -> str:
+    """The models module of an app, in the package the application has been imported as."""
+    return f"{APPLICATION_PACKAGE}.apps.{app}.models"
+
+
+def import_all_models() -> List[ModuleType]:
+    """
+    Import the models of all apps.
+    """
+    modules = [import_models(models_module_path(app)) for app in get_all_app_names()]
+    return [module for module in modules if module is not None]
 
 
 def get_table_paths_for_module(module_path: str) -> list:
     """
     For one module_path return all dotnotated import paths for classes that should be migrated with alembic revisions.
+
+    Table models (`class User(SQLModel, table=True)`) get their own `__table__`, subclasses of them would inherit it.
     """
-    try:
-        module = import_module(module_path)
-    except ModuleNotFoundError:
+    module = import_models(module_path)
+    if module is None:
         return []
 
     return [
         f"{klass.__module__}.{name}"
-        for name, klass in inspect.getmembers(module, inspect.isclass)
-        if module_path == klass.__module__ and
-            re.match(f"\Aclass\s{name}\((.*)table(.*)=(.*)True(.*)\)\:", inspect.getsource(klass))
+        for name, klass in vars(module).items()
+        if isinstance(klass, type) and klass.__module__ == module_path and "__table__" in klass.__dict__
     ]
 
 
-
 def get_all_revision_paths() -> List[str]:
     """
     Return all dotnotated import paths for classes that should be migrated with alembic revisions.
     """
     matches = []
     for app in get_all_app_names():
-        matches.extend(get_table_paths_for_module(f"application.apps.{app}.models"))
+        matches.extend(get_table_paths_for_module(models_module_path(app)))
     return matches
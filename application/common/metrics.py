@@ -0,0 +1,206 @@
+"""
+Prometheus metrics, served at /metrics.
+
+- http requests per route template (`/api/token`, not the requested url): count, latency, in progress
+- database queries: count and duration, through SQLAlchemy events (see `instrument_engine`)
+- database connection pools: wait for a connection, timeouts, connections in use and capacity (see `database.pool`)
+- password hashing: duration of bcrypt's hash and verify
+- rate limiting: rejected requests by limit (see `common.ratelimit`)
+
+Gunicorn's workers are separate processes: set the environment variable PROMETHEUS_MULTIPROC_DIR
+to an empty directory before starting, the workers write their metrics into mmap-backed files there,
+/metrics aggregates them (see compose/gunicorn.conf.py).
+
+/metrics is for the scrapers only: with METRICS_TOKEN set, they send it as bearer token,
+without one the endpoint is blocked in production.
+"""
+import hmac
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from ..config import settings
+from .dependencies import block_request_when_in_production
+
+
+# requests that did not match any route share one label, so scans can't blow up the label cardinality
+UNMATCHED_PATH = "<unmatched>"
+
+REQUESTS = Counter(
+    "http_requests_total", "Requests by method, route template and status code.", ["method", "path", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by method and route template.", ["method", "path"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests in progress.", ["method"], multiprocess_mode="livesum",
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of the database queries (the count is the number of queries).",
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+DB_POOL_CHECKOUT_DURATION = Histogram(
+    "db_pool_checkout_duration_seconds", "Time spent getting a connection from the pool (waiting or connecting).",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 10, 30),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total", "Checkouts that timed out, the pool was exhausted.",
+)
+# saturation: db_pool_connections_in_use / db_pool_capacity
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Connections checked out of the pools.", multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity", "Connections the pools may open (size + overflow).", multiprocess_mode="livesum",
+)
+PASSWORD_HASHING_DURATION = Histogram(
+    "password_hashing_duration_seconds", "Duration of hashing and verifying passwords.", ["operation"],
+    buckets=(.05, .1, .25, .5, .75, 1, 1.5, 2, 3, 5),
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total", "Requests rejected with 429 by the rate limits.", ["scope"],
+)
+
+
+# -- http ---------------------------------------------------------------------
+class PrometheusMiddleware:
+    """
+    Pure ASGI middleware recording the http metrics.
+
+    The route template is looked up by the endpoint the router put into the scope.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._paths: Dict[Callable, str] = {}
+        # labelled metrics, cached to skip the label lookups
+        self._children: Dict[Tuple[str, str], Tuple[Histogram, Dict[int, Counter]]] = {}
+
+    def route_template(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_PATH
+        path = self._paths.get(endpoint)
+        if path is None:
+            for route in scope["app"].router.routes:
+                if getattr(route, "endpoint", None) is not None:
+                    self._paths.setdefault(route.endpoint, route.path)
+            path = self._paths.setdefault(endpoint, UNMATCHED_PATH)
+        return path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            self.record(method, self.route_template(scope), status_code, duration)
+
+    def record(self, method: str, path: str, status_code: int, duration: float):
+        children = self._children.get((method, path))
+        if children is None:
+            children = self._children[(method, path)] = (REQUEST_DURATION.labels(method, path), {})
+        histogram, counters = children
+        counter = counters.get(status_code)
+        if counter is None:
+            counter = counters[status_code] = REQUESTS.labels(method, path, status_code)
+        histogram.observe(duration)
+        counter.inc()
+
+
+# -- database -----------------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_DURATION.observe(time.perf_counter() - conn.info["query_start"].pop())
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        DB_QUERY_DURATION.observe(time.perf_counter() - starts.pop())
+
+
+def instrument_engine(engine: Engine):
+    """Record the queries of the engine (pass an AsyncEngine's `sync_engine`)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+# -- password hashing ---------------------------------------------------------
+@contextmanager
+def password_hashing_timer(operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PASSWORD_HASHING_DURATION.labels(operation).observe(time.perf_counter() - start)
+
+
+# -- endpoint -----------------------------------------------------------------
+def collect_metrics() -> bytes:
+    """The metrics in the prometheus text format, aggregated over all workers in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+async def scraper_access(authorization: Optional[str] = Header(None)):
+    """Requires `Authorization: Bearer <METRICS_TOKEN>` if a token is set, blocks production without one."""
+    if settings.METRICS_TOKEN is None:
+        await block_request_when_in_production()
+        return
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(scraper_access)])
+def metrics():
+    """prometheus-metrics"""
+    return Response(content=collect_metrics(), media_type=CONTENT_TYPE_LATEST)
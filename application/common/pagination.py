@@ -0,0 +1,102 @@
+"""
+Keyset (seek) pagination with opaque cursors.
+
+A page is selected by the last key of the previous page (`WHERE key > :last ORDER BY key LIMIT :limit`),
+so deep pages cost the same as the first one, unlike an OFFSET that scans all the skipped rows.
+The cursor wraps the ordering and the last key into an url-safe string, clients just pass it back.
+"""
+import base64
+import binascii
+import json
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from sqlalchemy.types import Boolean
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order: str, last: Any) -> str:
+    data = json.dumps([order, last], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, order: str) -> str:
+    """
+    The last key of the previous page, raises InvalidCursor for garbage or a cursor of another ordering.
+    The keys are strings, a cursor is decoded from the client's input, a number or a list would reach the query.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order, last = json.loads(data)
+    except (binascii.Error, ValueError, TypeError) as error:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from error
+    if cursor_order != order:
+        raise InvalidCursor(f"The cursor belongs to the ordering by {cursor_order}, not by {order}")
+    if not isinstance(last, str):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return last
+
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """
+    The bounds for `lower <= column < upper`, matching all strings starting with the prefix in code point order.
+    Unlike LIKE 'prefix%', the range is served by a plain index on the column.
+    """
+    return prefix, prefix + "\U0010ffff"
+
+
+def like_prefix(prefix: str, escape: str = "/") -> str:
+    """The LIKE pattern of the strings starting with the prefix, its wildcards escaped."""
+    for character in (escape, "%", "_"):
+        prefix = prefix.replace(character, escape + character)
+    return prefix + "%"
+
+
+class StartsWith(ColumnElement):
+    """
+    `column` starts with `prefix`, whatever the database's collation.
+
+    sqlite compares text in code point order (the BINARY collation): a `prefix_range`, served by the column's index.
+    Other databases may order by a language's rules (PostgreSQL's default collations), where the range misses rows:
+    LIKE 'prefix%', an index serves it there with the C collation or `text_pattern_ops`.
+    """
+    type = Boolean()
+    _traverse_internals = [
+        ("column", InternalTraversal.dp_clauseelement),
+        ("lower", InternalTraversal.dp_clauseelement),
+        ("upper", InternalTraversal.dp_clauseelement),
+        ("pattern", InternalTraversal.dp_clauseelement),
+    ]
+
+    def __init__(self, column, prefix: str):
+        self.column = column
+        lower, upper = prefix_range(prefix)
+        self.lower = bindparam(None, lower, type_=column.type)
+        self.upper = bindparam(None, upper, type_=column.type)
+        self.pattern = bindparam(None, like_prefix(prefix), type_=column.type)
+
+
+@compiles(StartsWith)
+def _compile_like(element: StartsWith, compiler, **kwargs) -> str:
+    return compiler.process(element.column.like(element.pattern, escape="/"), **kwargs)
+
+
+@compiles(StartsWith, "sqlite")
+def _compile_range(element: StartsWith, compiler, **kwargs) -> str:
+    return compiler.process(and_(element.column >= element.lower, element.column < element.upper), **kwargs)
+
+
+def next_cursor(rows: list, limit: int, order: str) -> Tuple[list, Optional[str]]:
+    """
+    Split the `limit + 1` rows of a query into the page and the cursor of the next page (None on the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(order, getattr(rows[-1], order))
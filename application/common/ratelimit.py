@@ -0,0 +1,166 @@
+"""
+Rate limiting for the public routes.
+
+    limit = RateLimit("login-ip", "20/minute")  # a dependency, keyed by the client's ip
+    router = APIRouter(dependencies=[Depends(limit)])
+    await limit.acheck(username)  # or with any other key, `limit.check` outside of the event loop
+
+Requests over the rate get a 429 with a Retry-After header, before the route does any work.
+Algorithms (settings.RATE_LIMIT_ALGORITHM):
+- "sliding-window": the counts of the current and the previous fixed window, the previous one weighted by its
+  overlap with the sliding window. The counters live in the cache tier (`common.cache`), with the memcached
+  backend all workers share them. The dependency counts in the threadpool then, a failing memcached lets
+  the requests through.
+- "token-bucket": allows bursts up to the rate's count and refills steadily, in the worker's memory only,
+  a limit per worker then.
+Rejected requests count too, clients hammering on never get through.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from ..config import settings
+from .cache import CacheBackend, get_cache, off_the_event_loop
+from .metrics import RATE_LIMITED
+
+
+UNITS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'5/minute' -> (5, 60): the count allowed per window (seconds)."""
+    count, _, unit = rate.partition("/")
+    unit = unit.strip().lower().removesuffix("s")
+    if unit not in UNITS or not count.strip().isdigit() or int(count) < 1:
+        raise ValueError(f"Invalid rate '{rate}', expected <count>/<{'|'.join(UNITS)}>")
+    return int(count), UNITS[unit]
+
+
+class SlidingWindow:
+    """Sliding window counter in a (shared) cache backend, see the module docstring."""
+
+    def __init__(self, limit: int, window: int, backend: Optional[CacheBackend] = None, clock: Callable = time.time):
+        self.limit = limit
+        self.window = window
+        self.clock = clock  # wall clock, the windows are shared by all workers (and hosts)
+        self._backend = backend
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = get_cache()
+        return self._backend
+
+    async def ahit(self, key: str) -> float:
+        return await off_the_event_loop(self.backend, self.hit, key)
+
+    def _incr(self, key: str) -> int:
+        count = self.backend.incr(key)
+        if count is None:
+            # both windows must still be there during the next window
+            if self.backend.add(key, 1, ttl=2 * self.window):
+                return 1
+            count = self.backend.incr(key) or 1
+        return count
+
+    def hit(self, key: str) -> float:
+        """Count a request, return the seconds to wait if it is over the limit, else 0."""
+        index, elapsed = divmod(self.clock(), self.window)
+        current = self._incr(f"ratelimit:{key}:{int(index)}")
+        previous = self.backend.get(f"ratelimit:{key}:{int(index) - 1}") or 0
+        if previous * (1 - elapsed / self.window) + current <= self.limit:
+            return 0
+        if current > self.limit:
+            # the next window, until the weight of this one has decreased enough
+            return self.window - elapsed + self.window * (1 - self.limit / current)
+        return self.window * (1 - (self.limit - current) / previous) - elapsed
+
+
+class TokenBucket:
+    """Token buckets in the worker's memory, the least recently used keys are dropped beyond `max_keys`."""
+
+    def __init__(self, limit: int, window: int, max_keys: int = 100_000, clock: Callable = time.monotonic):
+        self.capacity = limit
+        self.refill_rate = limit / window  # tokens per second
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()  # key: (tokens, updated)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> float:
+        """Take a token, return the seconds to wait if there is none, else 0."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate) - 1
+            tokens = max(tokens, -self.capacity)  # clients hammering on wait one window at most
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if tokens >= 0 else -tokens / self.refill_rate
+
+    async def ahit(self, key: str) -> float:
+        return self.hit(key)
+
+
+def create_limiter(rate: str):
+    """The limiter of the configured algorithm for the rate."""
+    limit, window = parse_rate(rate)
+    if settings.RATE_LIMIT_ALGORITHM == "sliding-window":
+        return SlidingWindow(limit, window)
+    if settings.RATE_LIMIT_ALGORITHM == "token-bucket":
+        return TokenBucket(limit, window)
+    raise ValueError(f"Unknown rate limit algorithm: {settings.RATE_LIMIT_ALGORITHM}")
+
+
+def client_ip(request: Request) -> str:
+    """
+    The client's address. Behind a reverse proxy that's the proxy's, unless the server trusts its
+    X-Forwarded-For header (uvicorn --proxy-headers --forwarded-allow-ips, gunicorn forwarded_allow_ips).
+    """
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """
+    Dependency limiting the requests per client ip to the rate (e.g. "60/minute"),
+    `check` limits by any other key. Disabled with settings.RATE_LIMIT_ENABLED.
+    """
+
+    def __init__(self, scope: str, rate: str, limiter=None):
+        self.scope = scope
+        self.rate = rate
+        parse_rate(rate)  # fail at startup on invalid rates
+        self._limiter = limiter
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = create_limiter(self.rate)
+        return self._limiter
+
+    def check(self, key: str):
+        """Count a request by the key, raises HTTPException(429) over the rate."""
+        if settings.RATE_LIMIT_ENABLED:
+            self.reject(self.limiter.hit(f"{self.scope}:{key}"))
+
+    async def acheck(self, key: str):
+        """`check` for async code, the limiter's cache round trips run off the event loop."""
+        if settings.RATE_LIMIT_ENABLED:
+            self.reject(await self.limiter.ahit(f"{self.scope}:{key}"))
+
+    def reject(self, wait: float):
+        if wait:
+            RATE_LIMITED.labels(self.scope).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    async def __call__(self, request: Request):
+        await self.acheck(client_ip(request))
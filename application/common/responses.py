@@ -0,0 +1,99 @@
+"""
+Streaming JSON responses for large collections.
+
+    @router.get("/users/all")
+    async def all_users(session: Session = ActiveSession):
+        return StreamingJSONResponse(crud.iterate_users(session), model=UserRead)
+
+FastAPI's default response runs `jsonable_encoder` over the whole result and serializes it at once,
+holding several copies of the payload. StreamingJSONResponse serializes one row at a time
+into a json array and sends it in chunks (chunked transfer encoding, no content-length),
+so the memory doesn't grow with the result and the first bytes go out with the first row.
+
+orjson serializes the rows, when installed (`poetry install -E orjson`), else the json module.
+"""
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Type
+
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+
+# rows are collected to chunks of about this size (bytes), sync iterators run one chunk per threadpool call
+CHUNK_SIZE = 64 * 1024
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=pydantic_encoder)
+    return json.dumps(value, default=pydantic_encoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class StreamingJSONResponse(StreamingResponse):
+    """
+    Stream the rows of a (sync or async) iterator as a json array.
+
+    model: a pydantic model the rows are converted to first (`model.from_orm(row)`), like a route's response_model,
+    it decides which fields are revealed. Without it, pydantic models are serialized as they are.
+    """
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Iterable | AsyncIterable,
+        model: Optional[Type[BaseModel]] = None,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        background: Optional[BackgroundTask] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.model = model
+        self.chunk_size = chunk_size
+        if isinstance(content, AsyncIterable):
+            encoded = self.aencode(content)
+        else:
+            encoded = self.encode(content)
+        super().__init__(encoded, status_code=status_code, headers=headers, background=background)
+
+    def serialize(self, row: Any) -> bytes:
+        if self.model is not None:
+            row = self.model.from_orm(row)
+        if isinstance(row, BaseModel):
+            row = row.dict()
+        return dumps(row)
+
+    def encode(self, rows: Iterable) -> Iterator[bytes]:
+        chunk = bytearray(b"[")
+        first = True
+        for row in rows:
+            if not first:
+                chunk += b","
+            chunk += self.serialize(row)
+            if first or len(chunk) >= self.chunk_size:
+                # the first row right away, for an early first byte
+                yield bytes(chunk)
+                chunk.clear()
+            first = False
+        chunk += b"]"
+        yield bytes(chunk)
+
+    async def aencode(self, rows: AsyncIterable) -> AsyncIterator[bytes]:
+        chunk = bytearray(b"[")
+        first = True
+        async for row in rows:
+            if not first:
+                chunk += b","
+            chunk += self.serialize(row)
+            if first or len(chunk) >= self.chunk_size:
+                yield bytes(chunk)
+                chunk.clear()
+            first = False
+        chunk += b"]"
+        yield bytes(chunk)
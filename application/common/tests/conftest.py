@@ -0,0 +1,21 @@
+import socket
+
+import pytest
+
+from ..cache import MemcachedCache
+from .fake_memcached import FakeMemcachedServer
+
+
+@pytest.fixture(scope="session")
+def memcached_server():
+    with FakeMemcachedServer() as server:
+        yield server.server_address
+
+
+@pytest.fixture
+def unavailable_memcached() -> MemcachedCache:
+    """A cache of a memcached server that is down: nothing listens on the port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return MemcachedCache(servers=[("127.0.0.1", port)], timeout=0.1)
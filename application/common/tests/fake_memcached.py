@@ -0,0 +1,88 @@
+"""
+Minimal memcached stand-in speaking the text protocol, enough for `common.cache.MemcachedCache`.
+"""
+import socketserver
+import threading
+import time
+
+
+class FakeMemcachedHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, *args = line.decode().split()
+            noreply = bool(args) and args[-1] == "noreply"
+            if noreply:
+                args = args[:-1]
+            reply = getattr(self, f"do_{command}")(*args)
+            if not noreply:
+                self.wfile.write(reply)
+
+    @property
+    def contents(self) -> dict:
+        return self.server.contents
+
+    def _find(self, key: str):
+        entry = self.contents.get(key)
+        if entry is not None and entry[2] and entry[2] < time.time():
+            del self.contents[key]
+            entry = None
+        return entry
+
+    def _store(self, command: str, key: str, flags: str, exptime: str, size: str) -> bytes:
+        data = self.rfile.read(int(size) + 2)[:-2]
+        if command == "add" and self._find(key) is not None:
+            return b"NOT_STORED\r\n"
+        self.contents[key] = (data, int(flags), time.time() + int(exptime) if int(exptime) else 0)
+        return b"STORED\r\n"
+
+    def do_set(self, *args) -> bytes:
+        return self._store("set", *args)
+
+    def do_add(self, *args) -> bytes:
+        return self._store("add", *args)
+
+    def do_get(self, *keys) -> bytes:
+        reply = b""
+        for key in keys:
+            entry = self._find(key)
+            if entry is not None:
+                data, flags, _ = entry
+                reply += f"VALUE {key} {flags} {len(data)}\r\n".encode() + data + b"\r\n"
+        return reply + b"END\r\n"
+
+    def do_delete(self, key: str) -> bytes:
+        return b"DELETED\r\n" if self.contents.pop(key, None) else b"NOT_FOUND\r\n"
+
+    def do_incr(self, key: str, delta: str) -> bytes:
+        entry = self._find(key)
+        if entry is None:
+            return b"NOT_FOUND\r\n"
+        data, flags, expires_at = entry
+        value = int(data) + int(delta)
+        self.contents[key] = (str(value).encode(), flags, expires_at)
+        return f"{value}\r\n".encode()
+
+    def do_flush_all(self, *args) -> bytes:
+        self.contents.clear()
+        return b"OK\r\n"
+
+
+class FakeMemcachedServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeMemcachedHandler)
+        self.contents = {}
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
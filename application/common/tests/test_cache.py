@@ -0,0 +1,84 @@
+import pytest
+
+from ..cache import MemoryCache, MemcachedCache, get_serde, parse_servers
+
+
+@pytest.fixture(params=["memory", "memcached-pickle", "memcached-json"])
+def cache(request):
+    if request.param == "memory":
+        yield MemoryCache(max_entries=100)
+        return
+    serializer = request.param.split("-")[1]
+    # pooled connections to a local stand-in for the memcached server
+    server = request.getfixturevalue("memcached_server")
+    cache = MemcachedCache(servers=[server], pool_size=2, serializer=serializer, key_prefix="test")
+    yield cache
+    cache.clear()
+
+
+def test_get_and_set(cache):
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+    cache.set("dict", {"email": "alice@acid.net", "scopes": ["users/whoami"]})
+    assert cache.get("dict") == {"email": "alice@acid.net", "scopes": ["users/whoami"]}
+    cache.set("text", "value")
+    assert cache.get("text") == "value"
+    cache.delete("text")
+    assert cache.get("text") is None
+
+
+def test_batching(cache):
+    cache.set_many({"a": 1, "b": "two", "c": [3]})
+    assert cache.get_many(["a", "b", "c", "missing"]) == {"a": 1, "b": "two", "c": [3]}
+    cache.delete_many(["a", "b"])
+    assert cache.get_many(["a", "b", "c"]) == {"c": [3]}
+    cache.clear()
+    assert cache.get_many(["c"]) == {}
+
+
+def test_add_and_incr(cache):
+    assert cache.incr("counter") is None
+    assert cache.add("counter", 1)
+    assert not cache.add("counter", 10)
+    assert cache.incr("counter") == 2
+    assert cache.incr("counter", 5) == 7
+    assert cache.get("counter") == 7
+
+
+def test_memory_cache_expires_and_evicts():
+    cache = MemoryCache(max_entries=2)
+    cache.set("expired", "value", ttl=-1)
+    assert cache.get("expired") is None
+    cache.set("first", 1)
+    cache.set("second", 2)
+    cache.get("first")
+    cache.set("third", 3)
+    assert cache.get_many(["first", "second", "third"]) == {"first": 1, "third": 3}
+
+
+def test_memcached_spreads_keys_over_servers(memcached_server):
+    cache = MemcachedCache(servers=[memcached_server, memcached_server], key_prefix="test")
+    cache.set_many({"a": 1, "b": {"two": 2}})
+    assert cache.get_many(["a", "b"]) == {"a": 1, "b": {"two": 2}}
+    cache.clear()
+
+
+def test_failing_memcached_is_a_miss(unavailable_memcached):
+    cache = unavailable_memcached
+    assert cache.get("key", "default") == "default"
+    assert cache.get_many(["key"]) == {}
+    cache.set("key", 1)
+    cache.set_many({"key": 1})
+    assert cache.add("key", 1) is False
+    assert cache.incr("key") is None
+    cache.delete("key")
+
+
+def test_memcached_keys():
+    cache = MemcachedCache(key_prefix="test", client=object())
+    assert cache.make_key("token:abc") == "test:token:abc"
+    assert len(cache.make_key("a" * 300)) == 64
+    assert " " not in cache.make_key("with whitespace")
+    assert parse_servers("memcached-1:11212, memcached-2") == [("memcached-1", 11212), ("memcached-2", 11211)]
+    with pytest.raises(ValueError):
+        get_serde("marshal")
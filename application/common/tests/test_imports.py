@@ -0,0 +1,55 @@
+import subprocess
+import sys
+
+import pytest
+
+from ..imports import (
+    ROOT_DIR,
+    get_all_app_names,
+    get_all_revision_paths,
+    get_table_paths_for_module,
+    import_models,
+    models_module_path,
+)
+
+
+def test_table_models_are_found():
+    assert {"authentication", "public"} <= set(get_all_app_names())
+    assert get_all_revision_paths() == [
+        f"{models_module_path('authentication')}.User",
+        f"{models_module_path('authentication')}.RevokedToken",
+    ]
+
+
+def test_apps_without_models():
+    assert get_table_paths_for_module(models_module_path("public")) == []
+    assert import_models(models_module_path("public")) is None
+
+
+def test_errors_inside_models_are_raised(tmp_path, monkeypatch):
+    (tmp_path / "broken_models.py").write_text("import not_installed_dependency\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    with pytest.raises(ModuleNotFoundError):
+        import_models("broken_models")
+
+
+def test_suite_runs_like_cc_test(tmp_path):
+    """
+    `cc test` runs plain `pytest` in the repository: the application is only importable through the package
+    pytest makes of the repository (it has an __init__.py), never as the top-level `application`.
+    """
+    tests_dir = ROOT_DIR / "application" / "common" / "tests"
+    tests = [f"{tests_dir / 'test_imports.py'}::test_table_models_are_found", str(tests_dir / "test_pagination.py")]
+    code = "import sys, pytest; sys.exit(pytest.main(sys.argv[1:]))"
+    command = [sys.executable, "-c", code, "-q", "-p", "no:cacheprovider", "--rootdir", str(ROOT_DIR), *tests]
+    # run from elsewhere, like the pytest script (python -c would add the repository to sys.path)
+    result = subprocess.run(command, cwd=tmp_path, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_cli_imports_stay_lazy():
+    """`cc --help` and the simple commands must not load the application (engine, logging, models)."""
+    heavy = ("application", "sqlalchemy", "sqlmodel", "fastapi", "uvicorn", "rich")
+    code = f"import sys, commands; print([m for m in sys.modules if m.split('.')[0] in {heavy!r}])"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
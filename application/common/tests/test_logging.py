@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import time
+
+from ...config.log_handlers import BatchingRotatingFileHandler, JSONFormatter, QueueLogging
+
+
+class CollectingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.flushed = 0
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        self.flushed += 1
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def test_json_formatter():
+    logger = make_logger("test.json", CollectingHandler())
+    logger.info("Hello %s", "Alice", extra={"user": "alice@acid.net", "markup": True})
+    entry = json.loads(JSONFormatter().format(logger.handlers[0].records[0]))
+    assert entry["message"] == "Hello Alice"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "test.json"
+    assert entry["user"] == "alice@acid.net"
+    assert "markup" not in entry
+
+
+def test_batching_rotating_file_handler(tmp_path):
+    filename = tmp_path / "application.log"
+    handler = BatchingRotatingFileHandler(filename, maxBytes=100, backupCount=2, batch_size=3)
+    logger = make_logger("test.file", handler)
+    logger.info("first")
+    logger.info("second")
+    assert not filename.exists()  # buffered
+    logger.info("third")
+    assert filename.read_text() == "first\nsecond\nthird\n"
+    logger.info("x" * 100)
+    handler.flush()
+    assert (tmp_path / "application.log.1").read_text() == "first\nsecond\nthird\n"
+    assert filename.read_text() == "x" * 100 + "\n"
+    handler.close()
+
+
+def test_log_file_per_process(tmp_path, monkeypatch):
+    handler = BatchingRotatingFileHandler(tmp_path / "application.log", batch_size=1, per_process=True)
+    logger = make_logger("test.process", handler)
+    logger.info("parent")
+    assert (tmp_path / f"application.{os.getpid()}.log").read_text() == "parent\n"
+
+    # a forked worker writes its own file
+    monkeypatch.setattr(os, "getpid", lambda: 4242)
+    handler._reopen_in_child()
+    logger.info("child")
+    assert (tmp_path / "application.4242.log").read_text() == "child\n"
+    assert not (tmp_path / "application.log").exists()
+    handler.close()
+
+
+def test_queue_logging_routes_records_to_their_loggers_handlers():
+    application, event = CollectingHandler(), CollectingHandler()
+    make_logger("test.application", application)
+    make_logger("test.event", event)
+    queue_logging = QueueLogging(loggers=["test.application", "test.event"])
+    queue_logging.start()
+    try:
+        logging.getLogger("test.application").info("application")
+        logging.getLogger("test.event").warning("event")
+        deadline = time.monotonic() + 5
+        while not (application.records and event.records) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue_logging.stop()
+    assert [record.getMessage() for record in application.records] == ["application"]
+    assert [record.getMessage() for record in event.records] == ["event"]
+    assert application.flushed and event.flushed  # flushed when the queue ran empty
+
+
+def test_queue_logging_never_blocks():
+    handler = CollectingHandler()
+    logger = make_logger("test.full", handler)
+    queue_logging = QueueLogging(loggers=["test.full"], maxsize=1)  # not started, nobody empties the queue
+    logger.info("queued")
+    logger.info("dropped")
+    assert queue_logging.dropped == 1
+    assert queue_logging.queue.qsize() == 1
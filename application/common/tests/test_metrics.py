@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from ...config import settings
+from ...database.sqlmodel import ENGINE
+from ...main import app
+
+from ..metrics import UNMATCHED_PATH
+
+client = TestClient(app, base_url="http://localhost")
+
+
+def requests_total(path: str, status: str) -> float:
+    value = REGISTRY.get_sample_value("http_requests_total", {"method": "GET", "path": path, "status": status})
+    return value or 0
+
+
+def test_requests_are_recorded_by_route_template():
+    before = requests_total("/api/public/", "200")
+    unmatched = requests_total(UNMATCHED_PATH, "404")
+    assert client.get("/api/public/").status_code == 200
+    assert client.get("/api/does/not/exist/42").status_code == 404
+    assert requests_total("/api/public/", "200") == before + 1
+    assert requests_total(UNMATCHED_PATH, "404") == unmatched + 1
+    assert REGISTRY.get_sample_value("http_requests_in_progress", {"method": "GET"}) == 0
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",path="/api/public/"}' in response.text
+
+
+def test_metrics_are_for_the_scrapers_only(monkeypatch):
+    monkeypatch.setattr(settings, "PRODUCTION", True)
+    assert client.get("/metrics").status_code == 400
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scraper-token")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer not-the-token"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scraper-token"}).status_code == 200
+
+
+def test_database_queries_are_recorded():
+    before = REGISTRY.get_sample_value("db_query_duration_seconds_count") or 0
+    with ENGINE.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert REGISTRY.get_sample_value("db_query_duration_seconds_count") == before + 1
+
+
+def test_metrics_aggregate_across_processes(tmp_path):
+    root = Path(__file__).parents[3]
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    worker = (
+        "from application.common.metrics import PrometheusMiddleware;"
+        "PrometheusMiddleware(app=None).record('POST', '/api/token', 200, 0.1)"
+    )
+    for _ in range(2):  # two workers
+        subprocess.run([sys.executable, "-c", worker], cwd=root, env=env, check=True)
+    scrape = (
+        "import sys; from application.common.metrics import collect_metrics;"
+        "sys.stdout.write(collect_metrics().decode())"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", scrape], cwd=root, env=env, check=True, capture_output=True, text=True,
+    )
+    assert 'http_requests_total{method="POST",path="/api/token",status="200"} 2.0' in output.stdout
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import Column, MetaData, String, Table, create_engine, select
+from sqlalchemy.dialects import postgresql
+
+from ..pagination import (
+    InvalidCursor, StartsWith, decode_cursor, encode_cursor, like_prefix, next_cursor, prefix_range,
+)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("email", "alice@acid.net")
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "email") == "alice@acid.net"
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor("uid", "1234"),
+    encode_cursor("email", 1234),
+    encode_cursor("email", ["alice@acid.net"]),
+    encode_cursor("email", None),
+])
+def test_invalid_cursors(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "email")
+
+
+def test_prefix_range():
+    lower, upper = prefix_range("ali")
+    assert all(lower <= email < upper for email in ("ali", "alice@acid.net", "alié", "ali\U0001f600"))
+    assert not any(lower <= email < upper for email in ("al", "alj", "bob"))
+
+
+def test_like_prefix():
+    assert like_prefix("ali") == "ali%"
+    assert like_prefix("a_b%c/d") == "a/_b/%c//d%"
+
+
+EMAILS = ["a_b@acid.net", "ab@acid.net", "alice@acid.net", "alié@acid.net", "ali\U0001f600@acid.net", "bob@acid.net"]
+
+
+@pytest.fixture
+def emails():
+    engine = create_engine("sqlite://")
+    table = Table("user", MetaData(), Column("email", String, index=True))
+    table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [{"email": email} for email in EMAILS])
+    return engine, table
+
+
+@pytest.mark.parametrize("prefix, expected", [
+    ("ali", ["alice@acid.net", "alié@acid.net", "ali\U0001f600@acid.net"]),
+    ("a_", ["a_b@acid.net"]),
+    ("", EMAILS),
+    ("carol", []),
+])
+def test_starts_with(emails, prefix, expected):
+    engine, table = emails
+    statement = select(table.c.email).where(StartsWith(table.c.email, prefix)).order_by(table.c.email)
+    with engine.connect() as connection:
+        assert connection.execute(statement).scalars().all() == expected
+        # the LIKE of the other databases matches the same rows
+        like = select(table.c.email).where(table.c.email.like(like_prefix(prefix), escape="/")).order_by(table.c.email)
+        assert connection.execute(like).scalars().all() == expected
+
+
+def test_starts_with_is_compiled_once(emails):
+    engine, table = emails
+    compiled = set()
+    with engine.connect() as connection:
+        for prefix, count in (("ali", 3), ("b", 1), ("a_", 1)):
+            result = connection.execute(select(table.c.email).where(StartsWith(table.c.email, prefix)))
+            assert len(result.scalars().all()) == count
+            compiled.add(result.context.compiled)
+    assert len(compiled) == 1  # the prefixes are parameters of a cached statement
+
+
+def test_starts_with_compiles_to_like_on_postgresql():
+    table = Table("user", MetaData(), Column("email", String))
+    compiled = select(table.c.email).where(StartsWith(table.c.email, "a_")).compile(dialect=postgresql.dialect())
+    assert 'WHERE "user".email LIKE %(param_1)s ESCAPE \'/\'' in str(compiled)
+    assert list(compiled.params.values()) == ["a/_%"]
+
+
+def test_next_cursor():
+    class Row:
+        def __init__(self, email):
+            self.email = email
+
+    rows = [Row("a"), Row("b"), Row("c")]
+    assert next_cursor(rows, limit=3, order="email") == (rows, None)
+    page, cursor = next_cursor(rows, limit=2, order="email")
+    assert page == rows[:2]
+    assert decode_cursor(cursor, "email") == "b"
@@ -0,0 +1,103 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from ...config import settings
+from ..cache import MemoryCache, MemcachedCache
+from ..ratelimit import RateLimit, SlidingWindow, TokenBucket, parse_rate
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_040.0):  # 20s into a minute
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(params=["memory", "memcached"])
+def backend(request):
+    if request.param == "memory":
+        yield MemoryCache()
+        return
+    cache = MemcachedCache(servers=[request.getfixturevalue("memcached_server")], pool_size=2, key_prefix="ratelimit")
+    yield cache
+    cache.clear()
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+
+
+def test_parse_rate():
+    assert parse_rate("5/minute") == (5, 60)
+    assert parse_rate("100/hours") == (100, 3600)
+    for invalid in ("5", "five/minute", "0/second", "5/fortnight"):
+        with pytest.raises(ValueError):
+            parse_rate(invalid)
+
+
+def test_sliding_window(backend):
+    clock = Clock()
+    limiter = SlidingWindow(limit=3, window=60, backend=backend, clock=clock)
+    assert [limiter.hit("alice") for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit("alice") == pytest.approx(60 - 20 + 60 * (1 - 3 / 4))
+    assert limiter.hit("bob") == 0
+
+    # 45s into the next window, the previous window counts for a quarter: 4 * 0.25 + 1 <= 3
+    clock.now += 85
+    assert limiter.hit("alice") == 0
+    assert limiter.hit("alice") == 0
+    assert limiter.hit("alice") > 0
+
+
+def test_sliding_window_is_shared_by_the_workers(backend):
+    clock = Clock()
+    workers = [SlidingWindow(limit=2, window=60, backend=backend, clock=clock) for _ in range(2)]
+    assert workers[0].hit("alice") == 0
+    assert workers[1].hit("alice") == 0
+    assert workers[0].hit("alice") > 0
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_lets_requests_through_without_memcached(unavailable_memcached):
+    limiter = SlidingWindow(limit=1, window=60, backend=unavailable_memcached, clock=Clock())
+    assert [await limiter.ahit("alice") for _ in range(3)] == [0, 0, 0]
+
+
+def test_token_bucket():
+    clock = Clock()
+    limiter = TokenBucket(limit=2, window=60, max_keys=2, clock=clock)
+    assert [limiter.hit("alice") for _ in range(2)] == [0, 0]
+    assert limiter.hit("alice") == pytest.approx(30)  # a token refills every 30s
+    clock.now += 90  # refilled 3 tokens, the rejected hit took one too
+    assert limiter.hit("alice") == 0
+    assert limiter.hit("alice") == 0
+    assert limiter.hit("alice") == pytest.approx(30)
+
+    # the least recently used buckets are dropped
+    limiter.hit("bob")
+    limiter.hit("carol")
+    assert "alice" not in limiter._buckets
+
+
+def test_rate_limit_dependency(enabled):
+    app = FastAPI()
+    limit = RateLimit("test", "2/minute", limiter=TokenBucket(limit=2, window=60))
+
+    @app.get("/", dependencies=[Depends(limit)])
+    async def root():
+        return {}
+
+    client = TestClient(app)
+    assert [client.get("/").status_code for _ in range(2)] == [200, 200]
+    response = client.get("/")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+
+
+def test_rate_limit_disabled():
+    limit = RateLimit("test", "1/minute", limiter=TokenBucket(limit=1, window=60))
+    for _ in range(3):
+        limit.check("alice")
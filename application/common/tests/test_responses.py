@@ -0,0 +1,70 @@
+import json
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+from starlette.testclient import TestClient
+
+from .. import responses
+from ..responses import StreamingJSONResponse
+
+
+class Row:
+    def __init__(self, email: str, secret: str):
+        self.email = email
+        self.secret = secret
+
+
+class Public(BaseModel):
+    email: str
+    name: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+def rows(count: int):
+    for number in range(count):
+        yield Row(email=f"user-{number}@example.com", secret="hidden")
+
+
+async def arows(count: int):
+    for row in rows(count):
+        yield row
+
+
+def serve(response):
+    async def app(scope, receive, send):
+        await response(scope, receive, send)
+    return TestClient(app).get("/")
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(responses, "orjson", None)
+    elif responses.orjson is None:
+        pytest.skip("orjson is not installed")
+
+
+@pytest.mark.parametrize("content", [rows, arows])
+def test_streams_a_json_array(backend, content):
+    response = serve(StreamingJSONResponse(content(1000), model=Public, chunk_size=1024))
+    assert response.headers["content-type"] == "application/json"
+    assert "content-length" not in response.headers
+    body = response.json()
+    assert len(body) == 1000
+    assert body[0] == {"email": "user-0@example.com", "name": None}  # only the model's fields
+
+
+def test_chunks():
+    response = StreamingJSONResponse(rows(100), model=Public, chunk_size=1024)
+    chunks = list(response.encode(rows(100)))
+    assert chunks[0] == b'[{"email":"user-0@example.com","name":null}'  # the first row right away
+    assert all(len(chunk) < 1024 + 100 for chunk in chunks)
+    assert json.loads(b"".join(chunks))[-1]["email"] == "user-99@example.com"
+
+
+@pytest.mark.parametrize("content", [[], [{"a": 1}]])
+def test_small_arrays(content):
+    assert json.loads(b"".join(StreamingJSONResponse([]).encode(content))) == content
@@ -0,0 +1,65 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from ..timing import ServerTimingMiddleware, phase, timed
+
+
+@timed("db")
+def query():
+    time.sleep(0.01)
+
+
+@timed("db")
+async def aquery():
+    query()  # nested phases of the same name count once
+
+
+def create_app(sample_rate: float = 1.0) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware, sample_rate=sample_rate)
+
+    @app.get("/")
+    async def index():
+        with phase("auth"):
+            time.sleep(0.01)
+            await aquery()  # counts for db, not for auth
+        return {"message": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a", b"b"]))
+
+    return app
+
+
+def parse(header: str) -> dict:
+    durations = {}
+    for metric in header.split(", "):
+        name, duration = metric.split(";dur=")
+        durations[name] = float(duration)
+    return durations
+
+
+def test_server_timing_phases():
+    response = TestClient(create_app()).get("/")
+    assert response.status_code == 200
+    durations = parse(response.headers["server-timing"])
+    assert list(durations) == ["auth", "db", "handler", "total"]
+    assert 10 <= durations["auth"] < 20
+    assert 10 <= durations["db"] < 20
+    assert durations["total"] >= durations["auth"] + durations["db"]
+
+
+def test_streaming_responses_pass():
+    response = TestClient(create_app()).get("/stream")
+    assert response.content == b"ab"
+    assert list(parse(response.headers["server-timing"])) == ["handler", "total"]
+
+
+def test_sampling():
+    assert "server-timing" not in TestClient(create_app(sample_rate=0)).get("/").headers
+    # phases outside of a measured request are no-ops
+    query()
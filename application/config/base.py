@@ -4,7 +4,7 @@ import secrets
 import logging
 
 from functools import lru_cache
-from typing import List
+from typing import List, Optional
 from pathlib import Path
 from distutils.util import strtobool
 
@@ -56,7 +56,22 @@ class Settings(BaseSettings):
     # -> https://blog.miguelgrinberg.com/post/the-new-way-to-generate-secure-tokens-in-python
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 60 minutes * 24 hours * 7 days = 7 days
-    JWT_ALGORITHM: str = "HS256"
+    JWT_ALGORITHM: str = "HS256"  # HS256, HS384, HS512 (with the SECRET_KEY), RS256, ES256 or EdDSA (with the keys)
+    JWT_BACKEND: str = "native"  # "native", "jose" or "pyjwt" (the pyjwt extra), see `cryptography.TokenCodec`
+    JWT_PRIVATE_KEY: Optional[str] = None  # PEM, e.g. in .envs/.secrets/JWT_PRIVATE_KEY, signs the tokens
+    JWT_PUBLIC_KEY: Optional[str] = None  # PEM, verifies the tokens, derived from the private key if not set
+    JWT_LEEWAY: int = 0  # seconds of clock skew accepted for exp and nbf
+    # stateless: access tokens carry the user's claims, protected routes don't query the user,
+    # the tokens expire after STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES and are renewed at /api/token/refresh
+    AUTH_STATELESS: bool = False
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES: int = 5
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days, the session ends then, however often it was refreshed
+    # revoked tokens, checked in memory, see `authentication.revocation`
+    REVOCATION_ENABLED: bool = True
+    REVOCATION_REFRESH_SECONDS: int = 5  # revocations of other workers take effect after up to this delay
+    REVOCATION_PURGE_SECONDS: int = 60 * 60  # delete the expired revocations and rebuild the bloom filter
+    REVOCATION_BLOOM_CAPACITY: int = 100_000  # revoked tokens, the filter grows at the purge when there are more
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.001  # false positives, each costs a query
 
     ROOT_PATH: str = '/'
     SERVER_HOST: AnyHttpUrl
@@ -65,8 +80,27 @@ class Settings(BaseSettings):
     if TESTING:
         DATABASE_URL = "sqlite:///:memory:?cache=shared"
 
-    DATABASE_ARGS: dict = {"check_same_thread": False}  # sqlite specific
+    # connect_args of the driver, merged into the dialect's defaults (sqlite: check_same_thread=False)
+    DATABASE_ARGS: dict = {}
+    # connection pool of the server databases (postgresql ...),
+    # sqlite keeps SQLAlchemy's pools, see `database.sqlmodel`
+    # per worker: up to POOL_SIZE + MAX_OVERFLOW connections, waiting POOL_TIMEOUT seconds for a free one
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30
+    # seconds, replace connections before the server or a proxy drops them (-1: never)
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = True  # test connections on checkout, reconnect after a database restart
+    # sqlite performance profile for file databases (see `database.sqlite`): WAL, pragmas, a single writer connection
+    SQLITE_TUNING: bool = False
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # safe with WAL, a power loss may only lose the last commits
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # bytes
+    SQLITE_CACHE_SIZE: int = -64_000  # negative: KiB per connection
+    SQLITE_BUSY_TIMEOUT: int = 5000  # ms, waiting for the lock of another process' writer
+    SQLITE_TEMP_STORE: str = "MEMORY"
     DATABASE_ECHO: bool = False  # print raw SQL-statements to stdout, shouldn't be used in production
+    # serve the routes through the asyncio engine (aiosqlite for sqlite, asyncpg for postgresql)
+    DATABASE_ASYNC: bool = False
 
     # CORS_ORIGINS is a comma-seperated list of origins.
     # No brackets '[' and ']', no quotation-marks.
@@ -84,11 +118,65 @@ class Settings(BaseSettings):
     def dissassemble_trusted_hosts(cls, v: str) -> List[str]:
         return validators.dissassemble_comma_seperated_lists_of_strings(v)
 
+    # prometheus metrics at /metrics, see `common.metrics`
+    METRICS_ENABLED: bool = True
+    # the scrapers send it as bearer token (e.g. in .envs/.secrets/METRICS_TOKEN), without one
+    # /metrics is blocked in production
+    METRICS_TOKEN: Optional[str] = None
+
+    # share of the requests measured for the Server-Timing header, 0 disables it, see `common.timing`
+    SERVER_TIMING_SAMPLE_RATE: float = 1.0
+
+    # cache tier, see `common.cache`
+    # "memory" is per worker, "memcached" is shared by all workers
+    CACHE_BACKEND: str = "memory"
+    CACHE_SERVERS: str = "127.0.0.1:11211"  # comma-seperated list of memcached servers (host:port)
+    CACHE_POOL_SIZE: int = 8  # pooled connections per memcached server and worker
+    # "json", "pickle" or "dill": unpickling what an unauthenticated memcached returns can execute code
+    CACHE_SERIALIZER: str = "json"
+    CACHE_KEY_PREFIX: str = "skeleton"
+    CACHE_TIMEOUT: float = 0.5  # seconds, for connecting to and reading from memcached
+    CACHE_DEFAULT_TTL: int = 300  # seconds
+    CACHE_MAX_ENTRIES: int = 10_000  # "memory" only
+
+    # verified tokens are cached, skipping the jwt decoding and the user lookup
+    # with CACHE_BACKEND=memory the other workers keep a changed user for up to the ttl,
+    # changes of its password or rights revoke its tokens in all workers (see crud.REVOKING_FIELDS)
+    TOKEN_CACHE_TTL: int = 60  # seconds, entries never outlive the token's exp, 0 disables the cache
+
+    # password hashing runs in a bounded pool, off the event loop
+    PASSWORD_HASHING_EXECUTOR: str = "thread"  # "thread" (bcrypt releases the GIL) or "process"
+    PASSWORD_HASHING_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASHING_MAX_PENDING: int = 32  # more concurrent hashing requests get a 503
+    # costs, see `cryptography.PASSWORD_HASHING_PROFILES` and `cc calibrate-hashing`
+    # hashes with another scheme or other costs are rehashed on the next successful login
+    PASSWORD_HASHING_SCHEME: str = "bcrypt"  # "bcrypt" or "argon2" (the argon2 extra, argon2-cffi)
+    PASSWORD_HASHING_PROFILE: str = "strong"  # "minimum", "moderate" or "strong"
+    PASSWORD_BCRYPT_ROUNDS: Optional[int] = None  # overrides of the profile's costs
+    PASSWORD_ARGON2_TIME_COST: Optional[int] = None
+    PASSWORD_ARGON2_MEMORY_COST: Optional[int] = None  # KiB
+    PASSWORD_ARGON2_PARALLELISM: Optional[int] = None
+
+    # rate limits of the public routes, "<count>/<second|minute|hour|day>", see `common.ratelimit`
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_ALGORITHM: str = "sliding-window"  # "sliding-window" (in the cache tier) or "token-bucket" (per worker)
+    RATE_LIMIT_PUBLIC: str = "120/minute"  # per client ip, all public routes
+    RATE_LIMIT_LOGIN_IP: str = "20/minute"  # login attempts per client ip
+    RATE_LIMIT_LOGIN_USERNAME: str = "10/minute"  # login attempts per username, from all clients
+
     # permissions
     VALID_SCOPES: List[str] = ["unauthorized", "users/whoami", "logs/read"]
 
     # logging
     LOG_LEVEL = logging.DEBUG if DEBUG else logging.INFO
+    LOG_QUEUE: bool = PRODUCTION  # loggers only enqueue, a listener thread formats and writes (see `config.logging`)
+    LOG_QUEUE_SIZE: int = 10_000  # records are dropped when the queue is full, logging never blocks
+    LOG_BATCH_SIZE: int = 100  # records written at once (or when the queue runs empty)
+    LOG_RICH: bool = not PRODUCTION  # rich console rendering
+    LOG_JSON: bool = PRODUCTION  # structured logs, one json object per line
+    LOG_FILE_MAX_BYTES: int = 10 * 1024 * 1024  # rotate the log files at 10 MiB
+    LOG_FILE_BACKUP_COUNT: int = 5
+    LOG_FILE_PER_PROCESS: bool = PRODUCTION  # a log file per worker (logs/application.<pid>.log), they rotate apart
 
 
     class Config:
@@ -0,0 +1,224 @@
+"""
+Logging handlers and formatters used by `config.logging`.
+
+In queue mode (settings.LOG_QUEUE) the loggers only put their records into a queue,
+a single listener thread formats them and writes them to the handlers of their logger:
+
+    logger -> RoutingQueueHandler (target=logger) -> queue -> RoutingQueueListener -> handlers of the target
+"""
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List
+
+
+# attributes of every LogRecord, the others are `extra`s
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "log_target"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Structured logs, one json object per line.
+
+    {"time": "2021-10-10T12:00:00.000000+00:00", "level": "INFO", "logger": "application", "message": "...", ...}
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "process": record.process,
+            "thread": record.thread,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key != "markup" and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler collecting the formatted records in memory,
+    writing them with one call per `batch_size` records or on `flush`.
+
+    The rollover is checked per batch, not per record.
+    Processes must not share a rotating file, the rollover of one renames the file under the others' feet:
+    with `per_process`, every process writes its own file, the pid in its name (logs/application.<pid>.log),
+    forked children (gunicorn's workers) switch to theirs.
+    """
+
+    def __init__(
+        self, filename, mode="a", maxBytes=0, backupCount=0, encoding=None, batch_size: int = 100,
+        per_process: bool = False,
+    ):
+        self.filename = os.fspath(filename)
+        self.per_process = per_process
+        super().__init__(
+            self.process_filename(), mode=mode, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding,
+            delay=True,
+        )
+        self.batch_size = batch_size
+        self.buffer: List[str] = []
+        if per_process and hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reopen_in_child)
+
+    def process_filename(self) -> str:
+        """The file of this process: logs/application.log -> logs/application.1234.log"""
+        if not self.per_process:
+            return self.filename
+        root, extension = os.path.splitext(self.filename)
+        return f"{root}.{os.getpid()}{extension}"
+
+    def _reopen_in_child(self):
+        # the buffered records and the file are the parent's, it writes them
+        self.buffer.clear()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self.process_filename())
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                data = "".join(self.buffer)
+                self.buffer.clear()
+                if self.stream is None:
+                    self.stream = self._open()
+                if self.maxBytes > 0 and self.stream.tell() and self.stream.tell() + len(data) >= self.maxBytes:
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+                self.stream.write(data)
+            super().flush()
+        except Exception:
+            self.handleError(None)
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class RoutingQueueHandler(QueueHandler):
+    """
+    Puts the records of its logger into the queue, tagged with the logger (`target`) they belong to.
+
+    Never blocks the caller: when the queue is full, the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue, target: str):
+        super().__init__(log_queue)
+        self.target = target
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.log_target = self.target
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RoutingQueueListener(QueueListener):
+    """
+    The single listener thread for all loggers, handing each record to the handlers of its target.
+
+    Whenever the queue runs empty, the handlers are flushed: the batches are written while idle.
+    """
+
+    def __init__(self, log_queue: queue.Queue, routes: Dict[str, List[logging.Handler]]):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.routes = routes
+        self.handlers = tuple({id(handler): handler for handlers in routes.values() for handler in handlers}.values())
+
+    def dequeue(self, block: bool):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            if not block:
+                raise
+        self.flush()
+        return self.queue.get()
+
+    def handle(self, record: logging.LogRecord):
+        for handler in self.routes.get(getattr(record, "log_target", None), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+        self.flush()
+
+
+class QueueLogging:
+    """
+    Routes the configured loggers through a queue to a listener thread.
+
+    The listener is restarted (with a fresh queue) in forked children, e.g. gunicorn's preloaded workers.
+    """
+
+    def __init__(self, loggers: List[str], maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.routes: Dict[str, List[logging.Handler]] = {}
+        self.queue_handlers: List[RoutingQueueHandler] = []
+        for name in loggers:
+            logger = logging.getLogger(name)
+            self.routes[name] = list(logger.handlers)
+            queue_handler = RoutingQueueHandler(self.queue, target=name)
+            logger.handlers = [queue_handler]
+            self.queue_handlers.append(queue_handler)
+        self.listener = RoutingQueueListener(self.queue, self.routes)
+
+    @property
+    def dropped(self) -> int:
+        return sum(handler.dropped for handler in self.queue_handlers)
+
+    def start(self):
+        self.listener.start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def stop(self):
+        self.listener.stop()
+
+    def _restart_in_child(self):
+        # the listener thread did not survive the fork, the queue's locks might be held by it
+        self.queue = queue.Queue(self.maxsize)
+        for queue_handler in self.queue_handlers:
+            queue_handler.queue = self.queue
+        self.listener = RoutingQueueListener(self.queue, self.routes)
+        for handler in self.listener.handlers:
+            if isinstance(handler, BatchingRotatingFileHandler):
+                handler.buffer.clear()  # the parent writes them
+        self.listener.start()
@@ -1,7 +1,9 @@
+import atexit
 import logging
 import logging.config
 
 from . import settings, ROOT_DIR
+from .log_handlers import BatchingRotatingFileHandler, JSONFormatter, QueueLogging
 
 logs_path = ROOT_DIR / "logs"
 logs_path.mkdir(exist_ok=True)
@@ -45,7 +47,10 @@ LOGGING = {
             'format': "{message} \nLogger: {name} | Process: {process:d} | Thread: {thread:d}",
             'style': '{',
             "datefmt": "[%X]",
-        }
+        },
+        "json": {
+            "()": JSONFormatter,
+        },
     },
     "handlers": {
         "rich_console": {
@@ -59,16 +64,26 @@ LOGGING = {
             "formatter": "rich_with_loggername",
         },
         "file": {
-            "class": "logging.FileHandler",
+            # a factory, not a dotted path: the package is `package.application` when pytest imports it
+            "()": BatchingRotatingFileHandler,
             "level": settings.LOG_LEVEL,
-            "formatter": "default",
+            "formatter": "json" if settings.LOG_JSON else "default",
             "filename": str(logs_path / "application.log"),
+            "per_process": settings.LOG_FILE_PER_PROCESS,
+            "maxBytes": settings.LOG_FILE_MAX_BYTES,
+            "backupCount": settings.LOG_FILE_BACKUP_COUNT,
+            # without the queue the records are written by the logging thread, one by one
+            "batch_size": settings.LOG_BATCH_SIZE if settings.LOG_QUEUE else 1,
         },
         "event_file": {
-            "class": "logging.FileHandler",
+            "()": BatchingRotatingFileHandler,
             "level": settings.LOG_LEVEL,
-            "formatter": "verbose",
+            "formatter": "json" if settings.LOG_JSON else "verbose",
             "filename": str(logs_path / "events.log"),
+            "per_process": settings.LOG_FILE_PER_PROCESS,
+            "maxBytes": settings.LOG_FILE_MAX_BYTES,
+            "backupCount": settings.LOG_FILE_BACKUP_COUNT,
+            "batch_size": settings.LOG_BATCH_SIZE if settings.LOG_QUEUE else 1,
         }
     },
     'loggers': {
@@ -94,5 +109,21 @@ LOGGING = {
         },
     }
 }
+if not settings.LOG_RICH:
+    # plain console output, rich's rendering is costly
+    for name, formatter in (("rich_console", "default"), ("rich_console_with_loggername", "verbose")):
+        LOGGING["handlers"][name] = {
+            "class": "logging.StreamHandler",
+            "level": settings.LOG_LEVEL,
+            "formatter": "json" if settings.LOG_JSON else formatter,
+        }
+
 # apply the config
 logging.config.dictConfig(LOGGING)
+
+# queue mode: the loggers return immediately, a listener thread formats and writes the records
+queue_logging = None
+if settings.LOG_QUEUE:
+    queue_logging = QueueLogging(loggers=list(LOGGING["loggers"]), maxsize=settings.LOG_QUEUE_SIZE)
+    queue_logging.start()
+    atexit.register(queue_logging.stop)
@@ -1,14 +1,58 @@
-from typing import Generator
+from contextlib import asynccontextmanager
+from typing import Generator, AsyncGenerator, AsyncIterator
 
 from sqlmodel import Session
-from .sqlmodel import ENGINE
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .sqlmodel import ENGINE, WRITER_ENGINE, get_async_engine
+from .sqlite import RoutingSession
 
 from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+
+from ..config import settings
+
+
+# any session the crud functions accept
+AnySession = Session | AsyncSession
+
+
+def create_session() -> Session:
+    if WRITER_ENGINE is not None:
+        return RoutingSession(reader=ENGINE, writer=WRITER_ENGINE)
+    return Session(ENGINE)
 
 
 def get_session() -> Generator:
-    with Session(ENGINE) as session:
+    with create_session() as session:
+        yield session
+
+
+async def get_async_session() -> AsyncGenerator:
+    # objects stay loaded after commit, lazy refreshs are not possible without an await
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator:
+    """
+    A session of its own, for the queries a dependency only runs now and then (e.g. on a cache miss):
+    requests that don't need it don't pay for a session dependency.
+    """
+    if settings.DATABASE_ASYNC:
+        async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+            yield session
+        return
+    session = create_session()
+    try:
         yield session
+    finally:
+        await run_in_threadpool(session.close)
 
 
 ActiveSession = Depends(get_session)
+AsyncActiveSession = Depends(get_async_session)
+
+# The session used by the routes.
+# The async crud functions await an AsyncSession or run a blocking Session in the threadpool.
+RequestSession = AsyncActiveSession if settings.DATABASE_ASYNC else ActiveSession
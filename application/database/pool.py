@@ -0,0 +1,154 @@
+"""
+Connection pools of the engines.
+
+- `pool_kwargs`: dialect-aware pool settings, server databases get a sized, pre-pinged and recycled QueuePool,
+  sqlite keeps SQLAlchemy's pools (a StaticPool in memory, under test), unless tuned (SQLITE_TUNING)
+- `make_fork_safe`: gunicorn preloads the app and forks the workers, connections opened before the fork
+  would be shared by all workers, each worker drops the inherited ones and connects on its own
+- the pools record the wait for a connection and their saturation, see `common.metrics`
+"""
+import os
+import time
+import weakref
+from typing import Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+from ..common.metrics import DB_POOL_CAPACITY, DB_POOL_CHECKOUT_DURATION, DB_POOL_CHECKOUT_TIMEOUTS, DB_POOL_IN_USE
+from ..config import settings
+
+from .sqlite import tuning_enabled
+
+
+# connect_args by dialect, Settings.DATABASE_ARGS are merged into them
+DIALECT_CONNECT_ARGS = {
+    "sqlite": {"check_same_thread": False},  # the sessions are used by the threadpool's threads
+}
+
+
+class TimedCheckout:
+    """Records the time spent waiting for a connection, and the timeouts (the pool is exhausted)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def dialect(database_url: str) -> str:
+    return make_url(database_url).get_backend_name()
+
+
+def connect_args(database_url: str) -> dict:
+    return {**DIALECT_CONNECT_ARGS.get(dialect(database_url), {}), **settings.DATABASE_ARGS}
+
+
+def pool_kwargs(database_url: str, asynchronous: bool = False) -> dict:
+    if dialect(database_url) == "sqlite":
+        if settings.TESTING:
+            return {"poolclass": StaticPool}
+        if not tuning_enabled(database_url):
+            return {}
+    if settings.METRICS_ENABLED:
+        poolclass = TimedAsyncAdaptedQueuePool if asynchronous else TimedQueuePool
+    else:
+        poolclass = AsyncAdaptedQueuePool if asynchronous else QueuePool
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+
+
+def writer_pool_kwargs() -> dict:
+    """The sqlite writer (see `database.sqlite`): a single connection, the threads waiting for it queue in the pool."""
+    return {
+        "poolclass": TimedQueuePool if settings.METRICS_ENABLED else QueuePool,
+        "pool_size": 1,
+        "max_overflow": 0,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+    }
+
+
+# -- fork safety --------------------------------------------------------------
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+def _drop_inherited_connection(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get("pid", os.getpid()) != os.getpid():
+        # opened by the parent process: forget it without closing it (the parent still uses it),
+        # the pool connects anew
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError(
+            f"Connection opened by process {connection_record.info['pid']}, checked out by {os.getpid()}"
+        )
+
+
+def make_fork_safe(engine: Engine):
+    """
+    Don't share the connections with forked processes (pass an AsyncEngine's `sync_engine`).
+
+    `engine.dispose(close=False)` after the fork would do the same, but needs SQLAlchemy >= 1.4.33.
+    """
+    if not event.contains(engine, "connect", _remember_pid):
+        event.listen(engine, "connect", _remember_pid)
+        event.listen(engine, "checkout", _drop_inherited_connection)
+
+
+# -- metrics ------------------------------------------------------------------
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_IN_USE.inc()
+
+
+def _checkin(dbapi_connection, connection_record):
+    DB_POOL_IN_USE.dec()
+
+
+# the capacity of each engine's pool, and the process that counted it
+_capacities: "weakref.WeakKeyDictionary[Engine, Tuple[int, int]]" = weakref.WeakKeyDictionary()
+
+
+def _capacity_counter(engine: Engine):
+    def count_capacity(dbapi_connection, connection_record):
+        pid = os.getpid()
+        if _capacities.get(engine, (None, 0))[0] == pid:
+            return
+        # QueuePool has no public accessor of its overflow limit
+        _capacities[engine] = (pid, engine.pool.size() + max(engine.pool._max_overflow, 0))
+        DB_POOL_CAPACITY.set(sum(capacity for counted_by, capacity in _capacities.values() if counted_by == pid))
+    return count_capacity
+
+
+def instrument_pool(engine: Engine):
+    """
+    Record the connections in use and the capacity of the pool (pass an AsyncEngine's `sync_engine`),
+    their ratio is the pool's saturation.
+
+    The capacity is counted on the first connection of every process, not at import: gunicorn's master
+    preloads the app, the workers' pools are summed (livesum, like the connections in use) once they connect.
+    """
+    if event.contains(engine, "checkout", _checkout):
+        return
+    event.listen(engine, "checkout", _checkout)
+    event.listen(engine, "checkin", _checkin)
+    if isinstance(engine.pool, QueuePool):
+        event.listen(engine, "connect", _capacity_counter(engine))
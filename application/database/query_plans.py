@@ -0,0 +1,71 @@
+"""
+Query plans of executed statements, flagging lookups that scan a whole table instead of using an index.
+
+    with capture_statements(ENGINE) as statements:
+        crud.get_user_by_email(session, email)
+    assert full_scans(ENGINE, statements) == []
+
+Supports sqlite (EXPLAIN QUERY PLAN) and postgresql (EXPLAIN).
+Mind that postgresql prefers sequential scans on small tables, explain against realistic data there.
+"""
+import re
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+
+Statement = Tuple[str, Any]  # (sql, parameters) as sent to the driver
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+# sqlite: "SCAN user" (>= 3.36) or "SCAN TABLE user", an index scan reads "SCAN user USING INDEX ..."
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(?P<table>\S+)(?!.* USING )")
+POSTGRESQL_FULL_SCAN = re.compile(r"Seq Scan on (?P<table>\S+)")
+
+
+@contextmanager
+def capture_statements(engine: Engine) -> Iterator[List[Statement]]:
+    """Collect the statements executed through the engine (pass an AsyncEngine's `sync_engine`)."""
+    statements: List[Statement] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(connection: Connection, statement: str, parameters: Any = ()) -> List[str]:
+    """The lines of the statement's query plan."""
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows]  # (id, parent, notused, detail)
+    if connection.dialect.name == "postgresql":
+        return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+    raise NotImplementedError(f"Query plans of {connection.dialect.name} are not supported")
+
+
+def full_scan(dialect: str, line: str) -> str | None:
+    """The table scanned by this line of a query plan, None if it uses an index."""
+    pattern = SQLITE_FULL_SCAN if dialect == "sqlite" else POSTGRESQL_FULL_SCAN
+    match = pattern.search(line)
+    if match is None or match["table"] in ("CONSTANT", "SUBQUERY"):
+        return None
+    return match["table"].strip('"')
+
+
+def full_scans(engine: Engine, statements: List[Statement]) -> List[Tuple[str, str]]:
+    """(statement, plan line) of every full table scan in the statements' plans."""
+    found = []
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(EXPLAINED):
+                continue
+            for line in explain(connection, statement, parameters):
+                if full_scan(engine.dialect.name, line):
+                    found.append((statement, line))
+    return found
@@ -0,0 +1,139 @@
+"""
+Query tracking: how many statements a request (or any block of code) runs, how long they take,
+and which statements repeat (N+1 queries).
+
+    with track_queries() as queries:
+        crud.get_users(session)
+    queries.count, queries.duration, queries.duplicates
+
+    with assert_max_queries(2):  # in tests: fails with the statements, if there are more
+        client.get("/api/whoami", headers=headers)
+
+With DEBUG, QueryCountMiddleware tracks every request and adds the headers
+`X-Query-Count`, `X-Query-Duration` (ms) and `X-Query-Duplicates`, and logs the repeated statements.
+Statements run after the response started (e.g. by streaming responses) are not in the headers.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+log = logging.getLogger('application')
+
+# "IN (?, ?, ?)" -> "IN (?)", batches of different sizes are one shape
+IN_PARAMETERS = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def shape(statement: str) -> str:
+    """The statement without its parameters' values and layout."""
+    return IN_PARAMETERS.sub("(?)", WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """The statements of a tracked block, nested blocks count for their parents too."""
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0  # seconds
+        self.shapes: Counter = Counter()
+        self.statements: List[str] = []
+
+    def add(self, statement: str, duration: float):
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats.shapes[shape(statement)] += 1
+            stats.statements.append(statement)
+            stats = stats.parent
+
+    @property
+    def duplicates(self) -> Dict[str, int]:
+        """The statements run more than once, by shape."""
+        return {statement: count for statement, count in self.shapes.items() if count > 1}
+
+    def report(self) -> str:
+        return "\n".join(f"{count}x {statement}" for statement, count in self.shapes.most_common())
+
+
+_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Track the statements of the block, of all engines passed to `track_engine`."""
+    stats = QueryStats(parent=_stats.get())
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+@contextmanager
+def assert_max_queries(maximum: int, allow_duplicates: bool = False) -> Iterator[QueryStats]:
+    """Fail, if the block runs more than `maximum` statements, or a statement twice."""
+    with track_queries() as stats:
+        yield stats
+    if stats.count > maximum:
+        raise AssertionError(f"{stats.count} queries, expected at most {maximum}:\n{stats.report()}")
+    if stats.duplicates and not allow_duplicates:
+        raise AssertionError(f"Duplicated queries:\n{stats.report()}")
+
+
+# -- engine -------------------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _stats.get() is not None:
+        context._query_tracker_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats.get()
+    start = getattr(context, "_query_tracker_start", None)
+    if stats is not None and start is not None:
+        stats.add(statement, time.perf_counter() - start)
+
+
+def track_engine(engine: Engine):
+    """Track the statements of the engine (pass an AsyncEngine's `sync_engine`), nothing is recorded untracked."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# -- middleware ---------------------------------------------------------------
+class QueryCountMiddleware:
+    """Pure ASGI middleware adding the query headers to every response, use it for development only."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_query_headers(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", []))
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Query-Count", str(stats.count))
+                headers.append("X-Query-Duration", f"{stats.duration * 1000:.3f}")
+                headers.append("X-Query-Duplicates", str(len(stats.duplicates)))
+                if stats.duplicates:
+                    log.warning(f"{scope['method']} {scope['path']} repeated queries:\n{stats.report()}")
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_with_query_headers)
@@ -1,13 +1,10 @@
 """
 All database tables get automaticlly registered here, that should be migrated with alembic revisions.
 Run `alembic upgrade head` or `cc makemigrations` after registering new models.
+
+Importing the apps' models modules registers their tables in `SQLModel.metadata`.
 """
 
-from importlib import import_module
-from ..common.imports import get_all_revision_paths
+from ..common.imports import import_all_models
 
-for rp in get_all_revision_paths():
-    try:
-        import_module(rp)
-    except ImportError:
-        pass
+import_all_models()
@@ -0,0 +1,93 @@
+"""
+SQLite performance profile, enabled by SQLITE_TUNING (file databases only).
+
+- pragmas on connect: WAL (readers don't block the writer and vice versa), synchronous=NORMAL
+  (no fsync per commit, only at checkpoints), mmap, a larger page cache, busy_timeout and temp_store
+- the reader engine pools its connections (SQLAlchemy's default for sqlite files opens one per checkout),
+  so the page cache survives between requests
+- writes go through a separate writer engine with a single connection: the threads of a worker queue for it,
+  its transactions start with BEGIN IMMEDIATE, so writers of other workers wait for the lock (busy_timeout)
+  instead of failing with `database is locked` on the upgrade from a read to a write lock
+
+    session = RoutingSession(reader=ENGINE, writer=WRITER_ENGINE)
+"""
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlmodel import Session
+
+from ..config import settings
+
+
+def pragmas() -> Dict[str, str | int]:
+    return {
+        "journal_mode": "WAL",
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+
+
+def is_file_database(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def tuning_enabled(database_url: str) -> bool:
+    return settings.SQLITE_TUNING and is_file_database(database_url)
+
+
+def set_pragmas(engine: Engine, values: Optional[Dict[str, str | int]] = None):
+    """Set the pragmas on every new connection of the engine (pass an AsyncEngine's `sync_engine`)."""
+    values = pragmas() if values is None else values
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in values.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def begin_immediate(engine: Engine):
+    """
+    Start the engine's transactions with BEGIN IMMEDIATE, taking the write lock right away.
+    pysqlite's own (deferred) BEGIN is turned off, see the SQLAlchemy docs on "Serializable isolation / Savepoints".
+    """
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class RoutingSession(Session):
+    """
+    Reads through the reader engine, flushes and insert/update/delete statements through the writer engine.
+
+    Once a transaction wrote, it stays on the writer until it ends, so it reads its own uncommitted writes.
+    Raw sql (`text(...)`) is read, pass `bind_arguments={"bind": session.writer}` to write with it.
+    """
+
+    def __init__(self, reader: Engine, writer: Engine, **kwargs):
+        super().__init__(bind=reader, **kwargs)
+        self.writer = writer
+        self.writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.writing or self._flushing or isinstance(clause, UpdateBase):
+            self.writing = True
+            return self.writer
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _back_to_the_reader(session: RoutingSession, transaction):
+    if transaction.parent is None:
+        session.writing = False
@@ -1,24 +1,81 @@
 from functools import lru_cache
 
 from sqlmodel import create_engine, SQLModel
-from sqlmodel.pool import StaticPool
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 
 from ..config import settings
+from ..common.metrics import instrument_engine
+
+from .pool import connect_args, instrument_pool, make_fork_safe, pool_kwargs, writer_pool_kwargs
+from .sqlite import begin_immediate, set_pragmas, tuning_enabled
+from .query_tracker import track_engine
 
 # import all models here, so they are available in the metadata
 from .revisions import *  # NOSONAR, noqa
 METADATA = SQLModel.metadata
 
 
-@lru_cache
-def get_engine_kwargs() -> dict:
-    kwargs = {
-        "connect_args": settings.DATABASE_ARGS,
+def get_engine_kwargs(database_url: str, asynchronous: bool = False) -> dict:
+    return {
+        "connect_args": connect_args(database_url),
         "echo" : settings.DATABASE_ECHO,
+        **pool_kwargs(database_url, asynchronous=asynchronous),
     }
-    if settings.TESTING:
-        kwargs.update({"poolclass": StaticPool})
-    return kwargs
+
+
+def prepare_engine(engine: Engine):
+    """Fork safety, sqlite pragmas, query tracking and metrics of an engine (pass an AsyncEngine's `sync_engine`)."""
+    make_fork_safe(engine)
+    if tuning_enabled(engine.url):
+        set_pragmas(engine)
+    track_engine(engine)
+    if settings.METRICS_ENABLED:
+        instrument_engine(engine)
+        instrument_pool(engine)
+
+
+# asyncio drivers used by the async engine, chosen by the DATABASE_URL's dialect
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Swap the blocking driver of the database_url for its asyncio counterpart.
+
+    sqlite:///./production.db -> sqlite+aiosqlite:///./production.db
+    postgresql://user@host/db -> postgresql+asyncpg://user@host/db
+    """
+    scheme, separator, rest = database_url.partition("://")
+    if scheme in ASYNC_DRIVERS.values():
+        return database_url
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for the database scheme '{scheme}'")
+    return f"{ASYNC_DRIVERS[dialect]}{separator}{rest}"
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    """
+    The async engine is created on first use, so the asyncio drivers are only required in async mode.
+    """
+    database_url = get_async_database_url(settings.DATABASE_URL)
+    engine = create_async_engine(database_url, **get_engine_kwargs(database_url, asynchronous=True))
+    prepare_engine(engine.sync_engine)
+    return engine
+
+
+async def dispose_async_engine():
+    """
+    Close the connections of the async engine, if it has been created.
+    """
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
 
 
 def manually_create_all_tables():
@@ -32,4 +89,17 @@ def manually_create_all_tables():
         pass
     raise MigrationsShouldBeUsed("Alembic is used to create tables. (with migrations)")
 
-ENGINE = create_engine(settings.DATABASE_URL, **get_engine_kwargs())
+ENGINE = create_engine(settings.DATABASE_URL, **get_engine_kwargs(settings.DATABASE_URL))
+prepare_engine(ENGINE)
+
+# with SQLITE_TUNING, the sessions write through a single connection, see `database.sqlite.RoutingSession`
+WRITER_ENGINE: Engine | None = None
+if tuning_enabled(settings.DATABASE_URL):
+    WRITER_ENGINE = create_engine(
+        settings.DATABASE_URL,
+        connect_args=connect_args(settings.DATABASE_URL),
+        echo=settings.DATABASE_ECHO,
+        **writer_pool_kwargs(),
+    )
+    begin_immediate(WRITER_ENGINE)
+    prepare_engine(WRITER_ENGINE)
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+from ...common.imports import ROOT_DIR
+
+
+COMPARE = """
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from application.database.sqlmodel import ENGINE, METADATA
+
+command.upgrade(Config("alembic.ini"), "head")
+with ENGINE.connect() as connection:
+    print(compare_metadata(MigrationContext.configure(connection), METADATA))
+"""
+
+
+def test_the_migrations_match_the_models(tmp_path):
+    """`alembic upgrade head` creates the tables as declared, the next autogenerate finds nothing to do."""
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'migrations.db'}"}
+    result = subprocess.run(
+        [sys.executable, "-c", COMPARE], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.splitlines()[-1] == "[]"
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, exc, text
+
+from ..pool import TimedQueuePool, _capacities, connect_args, instrument_pool, make_fork_safe, pool_kwargs
+
+
+def sample(name: str) -> float:
+    return REGISTRY.get_sample_value(name) or 0
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05,
+    )
+    make_fork_safe(engine)
+    instrument_pool(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_dialect_aware_settings():
+    assert connect_args("sqlite:///./production.db") == {"check_same_thread": False}
+    assert connect_args("postgresql://user@host/db") == {}
+    assert "pool_size" not in pool_kwargs("sqlite:///./production.db")
+    kwargs = pool_kwargs("postgresql://user@host/db")
+    assert kwargs["pool_pre_ping"] is True
+    assert {"pool_size", "max_overflow", "pool_timeout", "pool_recycle"} <= set(kwargs)
+
+
+def test_checkouts_are_recorded(engine):
+    checkouts = sample("db_pool_checkout_duration_seconds_count")
+    timeouts = sample("db_pool_checkout_timeouts_total")
+    in_use = sample("db_pool_connections_in_use")
+    with engine.connect():
+        assert sample("db_pool_connections_in_use") == in_use + 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()  # the only connection is in use
+    assert sample("db_pool_connections_in_use") == in_use
+    assert sample("db_pool_checkout_duration_seconds_count") == checkouts + 2
+    assert sample("db_pool_checkout_timeouts_total") == timeouts + 1
+
+
+def test_the_capacity_is_counted_by_the_connecting_process(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'capacity.db'}", poolclass=TimedQueuePool, pool_size=2, max_overflow=1,
+    )
+    instrument_pool(engine)
+    assert engine not in _capacities  # not at import, before gunicorn forks the workers
+
+    def counted() -> float:
+        return sum(capacity for pid, capacity in _capacities.values() if pid == os.getpid())
+
+    with engine.connect(), engine.connect():
+        assert _capacities[engine] == (os.getpid(), 3)
+        assert sample("db_pool_capacity") == counted()
+    engine.dispose()
+    with engine.connect():
+        assert sample("db_pool_capacity") == counted()  # once per process
+    engine.dispose()
+
+
+def test_connections_of_another_process_are_not_reused(engine):
+    with engine.connect() as connection:
+        inherited = connection.connection.dbapi_connection
+        connection.connection.info["pid"] = -1  # as if opened before a fork
+    with engine.connect() as connection:
+        assert connection.connection.dbapi_connection is not inherited
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+    # not closed, the other process might still use it
+    assert inherited.execute("SELECT 1").fetchone() == (1,)
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from ...main import app
+from ..query_tracker import assert_max_queries, shape, track_queries
+from ..sqlmodel import ENGINE
+
+client = TestClient(app, base_url="http://localhost")
+
+
+def execute(*statements: str):
+    with ENGINE.connect() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+def test_shape():
+    assert shape("SELECT *\n  FROM user WHERE email IN (?, ?, ?)") == "SELECT * FROM user WHERE email IN (?)"
+    assert shape(
+        "SELECT * FROM user WHERE email IN (%(email_1)s, %(email_2)s)"
+    ) == "SELECT * FROM user WHERE email IN (?)"
+
+
+def test_track_queries():
+    execute("SELECT 0")  # untracked
+    with track_queries() as outer:
+        execute("SELECT 1")
+        with track_queries() as inner:
+            execute("SELECT 2", "SELECT 2")
+    assert outer.count == 3
+    assert inner.count == 2
+    assert inner.duration > 0
+    assert outer.duplicates == inner.duplicates == {"SELECT 2": 2}
+    assert outer.report().splitlines() == ["2x SELECT 2", "1x SELECT 1"]
+
+
+def test_assert_max_queries():
+    with assert_max_queries(2):
+        execute("SELECT 1", "SELECT 2")
+    with pytest.raises(AssertionError, match="3 queries, expected at most 2"):
+        with assert_max_queries(2):
+            execute("SELECT 1", "SELECT 2", "SELECT 3")
+    with pytest.raises(AssertionError, match="Duplicated queries"):
+        with assert_max_queries(2):
+            execute("SELECT 1", "SELECT 1")
+    with assert_max_queries(2, allow_duplicates=True):
+        execute("SELECT 1", "SELECT 1")
+
+
+def test_query_headers():
+    response = client.get("/api/public/")
+    assert response.headers["X-Query-Count"] == "0"
+    assert response.headers["X-Query-Duplicates"] == "0"
+    assert float(response.headers["X-Query-Duration"]) == 0
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlmodel import SQLModel, select
+
+from ...apps.authentication.models import User
+from ...config import settings
+from ..pool import pool_kwargs, writer_pool_kwargs
+from ..sqlite import RoutingSession, begin_immediate, set_pragmas, tuning_enabled
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'tuned.db'}"
+
+
+def create_reader(database_url):
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    set_pragmas(engine)
+    return engine
+
+
+def create_writer(database_url):
+    engine = create_engine(database_url, connect_args={"check_same_thread": False}, **writer_pool_kwargs())
+    set_pragmas(engine)
+    begin_immediate(engine)
+    return engine
+
+
+@pytest.fixture
+def engines(database_url):
+    reader, writer = create_reader(database_url), create_writer(database_url)
+    SQLModel.metadata.create_all(writer)
+    yield reader, writer
+    reader.dispose()
+    writer.dispose()
+
+
+def test_tuning_settings(monkeypatch, database_url):
+    monkeypatch.setattr(settings, "SQLITE_TUNING", True)
+    assert tuning_enabled(database_url)
+    assert not tuning_enabled("sqlite:///:memory:")
+    assert not tuning_enabled("postgresql://user@host/db")
+    monkeypatch.setattr(settings, "TESTING", False)
+    assert pool_kwargs(database_url)["pool_size"] == settings.DATABASE_POOL_SIZE
+    assert writer_pool_kwargs()["pool_size"] == 1
+
+
+def test_pragmas(engines):
+    reader, _ = engines
+    with reader.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == settings.SQLITE_BUSY_TIMEOUT
+        assert connection.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+
+
+def test_routing_session(engines):
+    reader, writer = engines
+    used = []
+    for name, engine in (("reader", reader), ("writer", writer)):
+        event.listen(engine, "before_cursor_execute", lambda *args, name=name: used.append(name))
+
+    with RoutingSession(reader=reader, writer=writer) as session:
+        session.exec(select(User)).all()
+        assert used == ["reader"]
+
+        session.add(User(email="alice@acid.net", password="-", scopes=""))
+        session.flush()
+        assert used[-1] == "writer"
+        # the transaction reads its own writes
+        assert session.exec(select(User)).one().email == "alice@acid.net"
+        assert used[-1] == "writer"
+        session.commit()
+
+        used.clear()
+        assert session.exec(select(User)).one().email == "alice@acid.net"
+        assert used == ["reader"]
+
+
+def test_concurrent_writers_wait_for_the_lock(database_url, engines):
+    # two workers, each with its own writer connection
+    writers = [engines[1], create_writer(database_url)]
+    errors = []
+
+    def write(writer, email, hold):
+        try:
+            with RoutingSession(reader=engines[0], writer=writer) as session:
+                session.add(User(email=email, password="-", scopes=""))
+                session.flush()
+                time.sleep(hold)  # holds the write lock
+                session.commit()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [
+        threading.Thread(target=write, args=(writers[0], "first@acid.net", 0.3)),
+        threading.Thread(target=write, args=(writers[1], "second@acid.net", 0)),
+    ]
+    threads[0].start()
+    time.sleep(0.1)
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+    writers[1].dispose()
+    assert errors == []
+    with RoutingSession(reader=engines[0], writer=writers[0]) as session:
+        assert len(session.exec(select(User)).all()) == 2
@@ -1,9 +1,6 @@
-import time
 import logging
 import multiprocessing
-from datetime import timedelta
 
-import humanize
 from devtools import debug
 
 from fastapi import FastAPI, Request, Depends
@@ -15,7 +12,15 @@ from .config import settings, Settings, get_settings
 from .config import logging as logging_config  # noqa, keep this unsued import to load the config once
 
 from .common.exceptions import UnknownTeapotException
+from .apps.authentication.exceptions import PasswordHashingUnavailable
+from .apps.authentication.cryptography import hashing_executor
+from .apps.authentication.cache import token_cache
+from .apps.authentication.revocation import revocation_list
 from .common.dependencies import block_request_when_in_production
+from .common.timing import ServerTimingMiddleware
+from .common.metrics import PrometheusMiddleware, router as metrics_router
+from .database.sqlmodel import dispose_async_engine
+from .database.query_tracker import QueryCountMiddleware
 
 from .api import api_router
 
@@ -26,6 +31,8 @@ app = FastAPI(
     **disable_auto_docs
 )
 app.include_router(api_router, prefix=settings.API_URL_PREFIX)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router)
 
 # -- LOGGING ------------------------------------------------------------------
 log = logging.getLogger('application')
@@ -44,16 +51,18 @@ app.add_middleware(
     TrustedHostMiddleware, allowed_hosts=settings.TRUSTED_HOSTS,
 )
 
-# Time taken
-@app.middleware("http")
-async def request_time_taken(request: Request, call_next):
-    """Adds a middleware to EVERY request response cycle."""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    readable = humanize.precisedelta(timedelta(seconds=process_time), format="%0.4f")
-    response.headers["time-taken"] = f"{readable}"
-    return response
+# Server-Timing header (auth, db, handler and total duration)
+app.add_middleware(
+    ServerTimingMiddleware, sample_rate=settings.SERVER_TIMING_SAMPLE_RATE,
+)
+
+# X-Query-Count, -Duration and -Duplicates headers, N+1 queries are logged
+if settings.DEBUG:
+    app.add_middleware(QueryCountMiddleware)
+
+# Prometheus metrics (outermost, so the latency includes all other middlewares)
+if settings.METRICS_ENABLED:
+    app.add_middleware(PrometheusMiddleware)
 
 # -- STARTUP EVENTS -----------------------------------------------------------
 @app.on_event("startup")
@@ -64,7 +73,18 @@ async def startup_event():
     # work the queue (every 15 seconds)
     # from .event.sheduler import work_the_queue
     # await work_the_queue()
-    pass
+
+    # load the revoked tokens and keep them refreshed
+    revocation_list.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Executes events on shutdown.
+    """
+    await revocation_list.stop()
+    await dispose_async_engine()
+    hashing_executor.shutdown()
 
 # -- EXCEPTION-HANDLERS -------------------------------------------------------
 @app.exception_handler(UnknownTeapotException)
@@ -80,6 +100,18 @@ async def teapot_exception_handler(request: Request, exc: UnknownTeapotException
         content={"message": f"Oops! {exc.name} did something. Liquid spilled..."},
     )
 
+@app.exception_handler(PasswordHashingUnavailable)
+async def password_hashing_unavailable_handler(request: Request, exc: PasswordHashingUnavailable):
+    """
+    Shed load early, when the password hashing executor is saturated.
+    """
+    log.warning(f"Rejected request to {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporarily unavailable, please retry."},
+        headers={"Retry-After": "1"},
+    )
+
 # -- DEBUG INFORMATION - not shown in PRODUCTION ------------------------------
 if settings.DEBUG:
     debug(app)
@@ -92,6 +124,11 @@ async def show_settings_info(
     """debug-settings-info"""
     return {"settings": settings.dict()} if allowed else {"message": "You are not allowed to see this."}
 
+@app.get("/token-cache", include_in_schema=False)
+async def show_token_cache_stats(allowed: bool = Depends(block_request_when_in_production)):
+    """debug-token-cache-hit-rate"""
+    return {"token_cache": token_cache.stats()} if allowed else {"message": "You are not allowed to see this."}
+
 
 # -----------------------------------------------------------------------------
 log.info(
@@ -0,0 +1,28 @@
+"""
+python -m benchmarks --help
+
+Runs the benchmark suite (`benchmarks.auth`) against a temporary sqlite database,
+never against the database configured in .envs.
+"""
+import os
+import secrets
+import tempfile
+from pathlib import Path
+
+import typer
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        # before the settings are loaded (by importing the application)
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'benchmark.db'}"
+        # one key for all workers of the spawned servers, the tokens are valid in every worker
+        os.environ.setdefault("SECRET_KEY", secrets.token_urlsafe(32))
+        # the benchmark logs in and out far more often than the limits allow, the spawned servers inherit it
+        os.environ["RATE_LIMIT_ENABLED"] = "False"
+        from .auth import main as benchmark
+        typer.run(benchmark)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Load test of the authentication endpoints.
+
+    python -m benchmarks                                    # the app in-process, through httpx
+    python -m benchmarks --server uvicorn --workers 1       # a locally spawned uvicorn
+    python -m benchmarks --server gunicorn --workers 4      # ... or gunicorn (as in compose/start.sh)
+    python -m benchmarks --save-baseline                    # store the results as baseline
+
+Scenarios: `/api/public/`, `/api/token`, `/api/whoami`, `/api/whoami/password`,
+and the throughput of `crud.create_user` (always in-process).
+Reports p50/p95/p99 latency and requests per second, saves the results as json
+and compares them with the baseline: regressions beyond the tolerance exit with 1.
+
+Run it through `python -m benchmarks` (or `cc bench`), which points the application to a temporary database.
+Bcrypt rounds are lowered (--bcrypt-rounds), to not only measure the password hashing.
+"""
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import typer
+from rich.console import Console
+from rich.table import Table
+from sqlmodel import SQLModel
+
+from application.apps.authentication import crud
+from application.apps.authentication.cryptography import password_hashing_options, pwd_context
+from application.apps.authentication.models import UserCreate
+from application.database.dependencies import get_session
+from application.database.sqlmodel import ENGINE
+
+from .user_inserts import measure_inserts
+
+
+BENCHMARKS_DIR = Path(__file__).parent
+PASSWORD = "benchmark"
+# compared with the baseline, lower is better for latencies, higher for the throughput
+COMPARED = {"p50_ms": -1, "p95_ms": -1, "p99_ms": -1, "rps": 1}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    """Latencies in ms, elapsed wall time in s."""
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentiles[49],
+        "p95_ms": percentiles[94],
+        "p99_ms": percentiles[98],
+    }
+
+
+# -- setup --------------------------------------------------------------------
+def create_users(count: int) -> List[str]:
+    """Create the (enabled) benchmark users, return their emails."""
+    SQLModel.metadata.create_all(ENGINE)
+    session = next(get_session())
+    emails = []
+    for i in range(count):
+        user = UserCreate(
+            email=f"benchmark-{i}@example.com", name=f"Benchmark {i}", password=PASSWORD,
+            scopes="users/whoami", disabled=False,
+        )
+        emails.append(crud.get_or_create_user(session=session, user=user).email)
+    session.close()
+    return emails
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(server: str, port: int, workers: int, bcrypt_rounds: int) -> subprocess.Popen:
+    if server == "uvicorn":
+        command = ["-m", "uvicorn", "benchmarks.server:app", "--port", str(port), "--workers", str(workers)]
+    elif server == "gunicorn":
+        command = [
+            "-m", "gunicorn", "benchmarks.server:app", "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "--preload",
+        ]
+    else:
+        raise BenchmarkError(f"Unknown server: {server}")
+    env = {**os.environ, "BENCHMARK_BCRYPT_ROUNDS": str(bcrypt_rounds)}
+    process = subprocess.Popen(
+        [sys.executable, *command, "--log-level", "warning"], cwd=BENCHMARKS_DIR.parent, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise BenchmarkError(f"{server} exited with {process.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/public/")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise BenchmarkError(f"{server} did not start within 60s")
+
+
+# -- load ---------------------------------------------------------------------
+async def load(
+    request: Callable[[int], Awaitable[httpx.Response]],
+    requests: int,
+    concurrency: int,
+    prepare: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> dict:
+    """
+    Send `requests` requests from `concurrency` concurrent workers, each calling `request(worker)`.
+
+    prepare: awaited before every request, not part of its latency (but of the wall time, the requests per second).
+    """
+    latencies: List[float] = []
+    remaining = iter(range(requests))
+
+    async def worker(number: int):
+        for _ in remaining:
+            if prepare is not None:
+                await prepare(number)
+            start = time.perf_counter()
+            response = await request(number)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise BenchmarkError(f"{response.request.url} answered {response.status_code}: {response.text}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def run_scenarios(client: httpx.AsyncClient, emails: List[str], requests: int, warmup: int) -> Dict[str, dict]:
+    concurrency = len(emails)
+
+    async def login(number: int) -> httpx.Response:
+        return await client.post("/api/token", data={"username": emails[number], "password": PASSWORD})
+
+    tokens: List[dict] = [{} for _ in range(concurrency)]
+
+    async def relogin(number: int):
+        response = await login(number)
+        if response.status_code != 200:
+            raise BenchmarkError(f"Login failed: {response.status_code} {response.text}")
+        tokens[number] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for number in range(concurrency):
+        await relogin(number)
+
+    async def public(number: int) -> httpx.Response:
+        return await client.get("/api/public/")
+
+    async def whoami(number: int) -> httpx.Response:
+        return await client.get("/api/whoami", headers=tokens[number])
+
+    async def password(number: int) -> httpx.Response:
+        body = {"password": PASSWORD, "confirmation": PASSWORD}
+        return await client.patch("/api/whoami/password", json=body, headers=tokens[number])
+
+    # a new password revokes the user's tokens, every change needs a new login
+    scenarios = (
+        ("public", public, None), ("token", login, None), ("whoami", whoami, None), ("password", password, relogin),
+    )
+    results = {}
+    for name, request, prepare in scenarios:
+        await load(request, requests=warmup, concurrency=concurrency, prepare=prepare)
+        results[name] = await load(request, requests=requests, concurrency=concurrency, prepare=prepare)
+    return results
+
+
+def run_create_user(requests: int) -> dict:
+    session = next(get_session())
+    start = time.perf_counter()
+    latencies = measure_inserts(session, size=0, inserts=requests)
+    elapsed = time.perf_counter() - start
+    session.close()
+    return summarize(latencies, elapsed)
+
+
+def run(server: Optional[str], workers: int, requests: int, concurrency: int, warmup: int, bcrypt_rounds: int) -> dict:
+    pwd_context.load(password_hashing_options("bcrypt", "minimum", rounds=bcrypt_rounds))
+    emails = create_users(concurrency)
+
+    async def in_process():
+        from application.main import app
+        async with httpx.AsyncClient(app=app, base_url="http://localhost") as client:
+            return await run_scenarios(client, emails, requests=requests, warmup=warmup)
+
+    async def against(base_url: str):
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            return await run_scenarios(client, emails, requests=requests, warmup=warmup)
+
+    if server is None:
+        scenarios = asyncio.run(in_process())
+    else:
+        port = free_port()
+        process = spawn_server(server, port=port, workers=workers, bcrypt_rounds=bcrypt_rounds)
+        try:
+            scenarios = asyncio.run(against(f"http://127.0.0.1:{port}"))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    scenarios["create_user"] = run_create_user(requests)
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "target": f"{server} ({workers} workers)" if server else "in-process",
+        "requests": requests,
+        "concurrency": concurrency,
+        "bcrypt_rounds": bcrypt_rounds,
+        "scenarios": scenarios,
+    }
+
+
+# -- report -------------------------------------------------------------------
+def compare(results: dict, baseline: dict) -> Dict[str, Dict[str, float]]:
+    """
+    Relative change per scenario and metric, e.g. {"token": {"p95_ms": 0.25}} is 25% slower.
+    Only the changes beyond the tolerance in the wrong direction are regressions, see `regressions`.
+    """
+    changes = {}
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            metric: (result[metric] - before[metric]) / before[metric] for metric in COMPARED if before.get(metric)
+        }
+    return changes
+
+
+def regressions(changes: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    return [
+        f"{name} {metric} {change:+.0%}"
+        for name, metrics in changes.items()
+        for metric, change in metrics.items()
+        if change * COMPARED[metric] < -tolerance
+    ]
+
+
+def print_results(results: dict, changes: Dict[str, Dict[str, float]], tolerance: float):
+    table = Table(title=f"{results['target']}: {results['requests']} requests, concurrency {results['concurrency']}")
+    table.add_column("scenario")
+    for metric in COMPARED:
+        table.add_column(metric.replace("_ms", " (ms)"), justify="right")
+    for name, result in results["scenarios"].items():
+        cells = []
+        for metric, direction in COMPARED.items():
+            cell = f"{result[metric]:.2f}"
+            change = changes.get(name, {}).get(metric)
+            if change is not None:
+                improvement = change * direction
+                color = "red" if improvement < -tolerance else "green" if improvement > tolerance else "white"
+                cell += f" [{color}]({change:+.0%})[/{color}]"
+            cells.append(cell)
+        table.add_row(name, *cells)
+    Console().print(table)
+
+
+def main(
+    server: Optional[str] = typer.Option(None, help="uvicorn or gunicorn, default: in-process"),
+    workers: int = 1,
+    requests: int = 500,
+    concurrency: int = 8,
+    warmup: int = 50,
+    bcrypt_rounds: int = 4,
+    output: Path = BENCHMARKS_DIR / "results" / "latest.json",
+    baseline: Path = BENCHMARKS_DIR / "baseline.json",
+    save_baseline: bool = False,
+    tolerance: float = typer.Option(0.1, help="relative change accepted before reporting a regression"),
+):
+    results = run(
+        server=server, workers=workers, requests=requests, concurrency=concurrency, warmup=warmup,
+        bcrypt_rounds=bcrypt_rounds,
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=4))
+
+    changes = {}
+    if baseline.exists():
+        stored = json.loads(baseline.read_text())
+        if stored.get("target") != results["target"]:
+            typer.echo(f"The baseline ran {stored.get('target')}, not {results['target']}.", err=True)
+        changes = compare(results, stored)
+    print_results(results, changes, tolerance)
+    typer.echo(f"Saved the results to {output}.")
+
+    if save_baseline:
+        baseline.write_text(json.dumps(results, indent=4))
+        typer.echo(f"Saved the results as baseline to {baseline}.")
+        return
+    regressed = regressions(changes, tolerance)
+    if regressed:
+        typer.echo(f"Regressions against {baseline}: {', '.join(regressed)}", err=True)
+        raise typer.Exit(code=1)
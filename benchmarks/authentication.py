@@ -0,0 +1,184 @@
+"""
+Per-request overhead of the authentication of the protected routes.
+
+    python -m benchmarks.authentication --seconds 2
+
+Calls `/whoami` of two bare applications (no middlewares) directly through ASGI, with a stateless token
+(verified from its claims, no queries):
+- "dependency chain": authenticated like before `dependencies.BearerAuthentication`, the header checked by
+  valid_authentication_header and parsed by OAuth2PasswordBearer on the router, then get_current_active_user and
+  get_current_user (OAuth2PasswordBearer again, the request's session, an HTTPException built per call,
+  the payload validated with its email).
+- "single pass": the protected router's `oauth2_scheme`, then the route's `AuthenticatedUser` only checks
+  the scopes of the principal.
+"""
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, List
+
+import typer
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Security, status
+from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+from pydantic import ValidationError
+from rich.console import Console
+from rich.table import Table
+
+from application.config import settings
+from application.apps.authentication.cryptography import create_access_token, token_codec
+from application.apps.authentication.dependencies import AuthenticatedUser, oauth2_scheme, user_from_claims
+from application.apps.authentication.exceptions import InvalidToken
+from application.apps.authentication.models import TokenPayload, User, UserRead
+from application.apps.authentication.revocation import revocation_list
+from application.apps.authentication.scopes import scope_registry
+from application.database.dependencies import RequestSession
+
+
+# -- before: the dependency chain ---------------------------------------------
+chain_scheme = OAuth2PasswordBearer(
+    tokenUrl="api/token", scopes={"users/whoami": "Read information about the current user."},
+)
+
+
+async def valid_authentication_header(authorization: str = Header(...)):
+    if not "bearer" in authorization.lower():
+        raise HTTPException(status_code=401, detail="Invalid authorization header provided")
+
+
+async def get_current_user(
+    security_scopes: SecurityScopes, token: str = Depends(chain_scheme), session=RequestSession
+):
+    """The stateless path of get_current_user before."""
+    www_authenticate = f'Bearer scope="{security_scopes.scope_str}"' if security_scopes.scopes else "Bearer"
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials.",
+        headers={"WWW-Authenticate": www_authenticate},
+    )
+    try:
+        payload = token_codec.decode(token)
+    except InvalidToken:
+        raise credentials_exception
+    try:
+        token_payload = TokenPayload(
+            email=payload["sub"], scopes=payload.get("scopes", []), scope_mask=payload.get("scm"),
+            token_version=payload.get("ver"), token_id=payload.get("jti"), issued_at=payload.get("iat"),
+        )
+    except ValidationError:
+        raise credentials_exception
+    user = user_from_claims(payload)
+    if await revocation_list.ais_revoked(
+        session, subject=token_payload.email, jti=token_payload.token_id, issued_at=token_payload.issued_at,
+    ):
+        raise credentials_exception
+    if not scope_registry.grants(token_payload.scope_mask, scope_registry.required(security_scopes.scopes)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Insufficient privilege.")
+    return user
+
+
+async def get_current_active_user(current_user: User = Security(get_current_user, scopes=["users/whoami"])):
+    if current_user.disabled:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is inactive.")
+    return current_user
+
+
+def chain_app() -> FastAPI:
+    router = APIRouter(dependencies=[Depends(valid_authentication_header), Depends(chain_scheme)])
+
+    @router.get("/whoami", response_model=UserRead)
+    async def whoami(current_user: User = Depends(get_current_active_user)):
+        return current_user
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+# -- after: a single pass -----------------------------------------------------
+def single_pass_app() -> FastAPI:
+    router = APIRouter(dependencies=[Depends(oauth2_scheme)])
+
+    @router.get("/whoami", response_model=UserRead)
+    async def whoami(current_user: User = AuthenticatedUser):
+        return current_user
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+# -- measurement --------------------------------------------------------------
+def token() -> str:
+    return create_access_token(
+        subject={
+            "sub": "alice@acid.net", "scopes": ["users/whoami"], "scm": scope_registry.mask("users/whoami"), "ver": 0,
+            "uid": str(uuid.uuid4()), "name": "Alice", "dis": False, "su": False,
+        },
+        expires_delta=timedelta(minutes=15),
+    )
+
+
+def asgi_request(app: FastAPI, headers: list) -> Callable:
+    """A GET /whoami straight into the application, without a client or a server."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/whoami", "raw_path": b"/whoami", "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def request():
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await app(dict(scope), receive, send)
+        if statuses != [200]:
+            raise RuntimeError(f"/whoami answered {statuses}")
+
+    return request
+
+
+async def per_request(request: Callable, seconds: float) -> float:
+    """Microseconds per request, in batches until the time is up."""
+    for _ in range(100):  # warm up
+        await request()
+    calls, batch = 0, 10
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        for _ in range(batch):
+            await request()
+        calls += batch
+        batch = min(batch * 2, 1000)
+    return elapsed / calls * 1_000_000
+
+
+def run(seconds: float) -> List[dict]:
+    settings.AUTH_STATELESS = True  # verified from the claims, no database involved
+    headers = [(b"authorization", f"Bearer {token()}".encode())]
+    results = []
+    for name, app in (("dependency chain", chain_app()), ("single pass", single_pass_app())):
+        results.append({"name": name, "us": asyncio.run(per_request(asgi_request(app, headers), seconds))})
+    return results
+
+
+def main(seconds: float = typer.Option(2.0, help="per application")):
+    results = run(seconds)
+    before = results[0]["us"]
+    table = Table(title=f"GET /whoami through ASGI, {seconds:.1f}s per application")
+    for column in ("authentication", "µs/request", "removed"):
+        table.add_column(column, justify="left" if column == "authentication" else "right")
+    for result in results:
+        removed = before - result["us"]
+        saved = f"{removed:.1f} µs ({removed / before:.0%})" if removed else ""
+        table.add_row(result["name"], f"{result['us']:.1f}", saved)
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
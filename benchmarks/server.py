@@ -0,0 +1,15 @@
+"""
+The application served by the benchmarks through uvicorn or gunicorn:
+
+    uvicorn benchmarks.server:app
+    gunicorn benchmarks.server:app --worker-class uvicorn.workers.UvicornWorker
+
+Bcrypt rounds are lowered to BENCHMARK_BCRYPT_ROUNDS, like in the in-process runs.
+"""
+import os
+
+from application.apps.authentication.cryptography import password_hashing_options, pwd_context
+from application.main import app  # noqa
+
+BCRYPT_ROUNDS = int(os.environ.get("BENCHMARK_BCRYPT_ROUNDS", 4))
+pwd_context.load(password_hashing_options("bcrypt", "minimum", rounds=BCRYPT_ROUNDS))
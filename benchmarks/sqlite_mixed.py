@@ -0,0 +1,147 @@
+"""
+Mixed read/write throughput of a sqlite file database, shared by several worker processes.
+
+    python -m benchmarks.sqlite_mixed --workers 4 --threads 4 --writes 0.2 --duration 10
+
+Every worker process (like a gunicorn worker) runs threads (like the threadpool serving the routes)
+calling `crud.get_user_by_email` and `crud.update_user` on random users.
+Profiles:
+- default: SQLAlchemy's sqlite defaults, rollback journal, a new connection per session
+- tuned: SQLITE_TUNING, WAL and pragmas, pooled readers and a single writer connection per worker
+"""
+import multiprocessing
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import typer
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from sqlmodel import SQLModel, Session, create_engine
+
+from application.apps.authentication import crud
+from application.apps.authentication.models import UserUpdate
+from application.database.pool import writer_pool_kwargs
+from application.database.sqlite import RoutingSession, begin_immediate, set_pragmas
+
+from .user_inserts import fill_users
+
+
+PROFILES = ("default", "tuned")
+
+
+def session_factory(profile: str, database_url: str):
+    connect_args = {"check_same_thread": False}
+    if profile == "default":
+        engine = create_engine(database_url, connect_args=connect_args)
+        return lambda: Session(engine)
+    reader = create_engine(database_url, connect_args=connect_args, poolclass=QueuePool, pool_size=8)
+    set_pragmas(reader)
+    writer = create_engine(database_url, connect_args=connect_args, **writer_pool_kwargs())
+    set_pragmas(writer)
+    begin_immediate(writer)
+    return lambda: RoutingSession(reader=reader, writer=writer)
+
+
+def worker(
+    profile: str, database_url: str, users: int, threads: int, writes: float, start: float, deadline: float, results
+):
+    create_session = session_factory(profile, database_url)
+    latencies = {"read": [], "write": []}
+    locked = 0
+    lock = threading.Lock()
+
+    def run():
+        nonlocal locked
+        while time.time() < deadline:
+            email = f"filler-{random.randrange(users)}@example.com"
+            operation = "write" if random.random() < writes else "read"
+            began = time.perf_counter()
+            with create_session() as session:
+                try:
+                    if operation == "write":
+                        crud.update_user(session, UserUpdate(email=email, name=f"Updated {began}"))
+                    else:
+                        crud.get_user_by_email(session, email)
+                except OperationalError:  # database is locked
+                    with lock:
+                        locked += 1
+                    continue
+            with lock:
+                latencies[operation].append((time.perf_counter() - began) * 1000)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    time.sleep(max(0, start - time.time()))  # all workers start together
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, locked))
+
+
+def run_profile(profile: str, workers: int, threads: int, users: int, writes: float, duration: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'mixed.db'}"
+        engine = create_engine(database_url)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            fill_users(session, start=0, stop=users, password="-")
+        engine.dispose()
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        start = time.time() + 3  # spawning the workers takes a moment
+        arguments = (profile, database_url, users, threads, writes, start, start + duration, results)
+        processes = [context.Process(target=worker, args=arguments) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        reads, writes_done, locked = [], [], 0
+        for _ in processes:
+            latencies, errors = results.get()
+            reads += latencies["read"]
+            writes_done += latencies["write"]
+            locked += errors
+        for process in processes:
+            process.join()
+
+    def p95(values: List[float]) -> float:
+        return statistics.quantiles(values, n=20)[-1] if len(values) > 1 else float("nan")
+
+    return {
+        "profile": profile,
+        "reads_per_s": len(reads) / duration,
+        "writes_per_s": len(writes_done) / duration,
+        "read_p95_ms": p95(reads),
+        "write_p95_ms": p95(writes_done),
+        "locked": locked,
+    }
+
+
+def main(
+    workers: int = 4,
+    threads: int = 4,
+    users: int = 10_000,
+    writes: float = typer.Option(0.2, help="share of the operations writing"),
+    duration: float = 10,
+    profiles: List[str] = typer.Option(list(PROFILES)),
+):
+    table = Table(title=f"{workers} workers x {threads} threads, {writes:.0%} writes, {duration:.0f}s")
+    for column in ("profile", "reads/s", "writes/s", "read p95 (ms)", "write p95 (ms)", "database is locked"):
+        table.add_column(column, justify="left" if column == "profile" else "right")
+    for profile in profiles:
+        result = run_profile(profile, workers=workers, threads=threads, users=users, writes=writes, duration=duration)
+        table.add_row(
+            profile, f"{result['reads_per_s']:.0f}", f"{result['writes_per_s']:.0f}",
+            f"{result['read_p95_ms']:.2f}", f"{result['write_p95_ms']:.2f}", str(result["locked"]),
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,152 @@
+"""
+Import time of the application, what every gunicorn worker, `cc` command and alembic run pays at startup.
+
+    python -m benchmarks.startup                        # application.main
+    python -m benchmarks.startup --module commands --top 30
+    python -m benchmarks.startup --save-baseline
+    python -m benchmarks.startup --module commands --budget 150   # `cc profile-startup`
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters (after a warm-up run that compiles the .pyc),
+reports the median cumulative import time and the slowest modules by their own (self) time,
+saves the results as json and compares the total with the baseline: a regression beyond the tolerance exits with 1,
+as does a total above the --budget (ms).
+"""
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+
+BENCHMARKS_DIR = Path(__file__).parent
+# import time:       self [us] |  cumulative | imported package
+IMPORTTIME_LINE = re.compile(
+    r"^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|(?P<indent>\s+)(?P<module>\S+)"
+)
+
+
+def parse_importtime(stderr: str) -> Dict[str, dict]:
+    """The self and cumulative import time (µs) per module, and whether it was imported at top level."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match["module"]] = {
+                "self_us": int(match["self"]),
+                "cumulative_us": int(match["cumulative"]),
+                "top_level": len(match["indent"]) == 1,
+            }
+    return modules
+
+
+def measure(module: str, env: dict) -> Dict[str, dict]:
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BENCHMARKS_DIR.parent, env=env, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise typer.BadParameter(f"Importing {module} failed:\n{process.stderr[-2000:]}")
+    return parse_importtime(process.stderr)
+
+
+def run(module: str, runs: int, top: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{Path(tmp) / 'startup.db'}"}
+        measure(module, env)  # warm-up
+        samples = [measure(module, env) for _ in range(runs)]
+
+    # everything imported by `import <module>`: the sum of the top level imports' cumulative times
+    totals = [sum(entry["cumulative_us"] for entry in sample.values() if entry["top_level"]) for sample in samples]
+    names = samples[0].keys()
+    median = {
+        name: {
+            key: statistics.median(sample[name][key] for sample in samples if name in sample)
+            for key in ("self_us", "cumulative_us")
+        }
+        for name in names
+    }
+    slowest = sorted(median.items(), key=lambda item: item[1]["self_us"], reverse=True)[:top]
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "module": module,
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "total_ms": statistics.median(totals) / 1000,
+        "modules": len(names),
+        "application_ms": {
+            name: entry["cumulative_us"] / 1000 for name, entry in median.items()
+            if name.split(".")[0] == "application" and name.count(".") <= 2
+        },
+        "slowest": [{"module": name, **entry} for name, entry in slowest],
+    }
+
+
+def print_results(results: dict, baseline: dict | None):
+    total = f"{results['total_ms']:.1f} ms"
+    if baseline:
+        change = (results["total_ms"] - baseline["total_ms"]) / baseline["total_ms"]
+        total += f" ({change:+.0%} against the baseline)"
+    console = Console()
+    console.print(
+        f"import {results['module']}: {total}, {results['modules']} modules, median of {results['runs']} runs"
+    )
+
+    table = Table(title="slowest modules (self time)")
+    table.add_column("module")
+    table.add_column("self (ms)", justify="right")
+    table.add_column("cumulative (ms)", justify="right")
+    for entry in results["slowest"]:
+        table.add_row(entry["module"], f"{entry['self_us'] / 1000:.2f}", f"{entry['cumulative_us'] / 1000:.2f}")
+    console.print(table)
+
+    table = Table(title="application packages (cumulative)")
+    table.add_column("module")
+    table.add_column("cumulative (ms)", justify="right")
+    for name, milliseconds in sorted(results["application_ms"].items(), key=lambda item: item[1], reverse=True):
+        table.add_row(name, f"{milliseconds:.2f}")
+    console.print(table)
+
+
+def main(
+    module: str = "application.main",
+    runs: int = 5,
+    top: int = 20,
+    output: Path = BENCHMARKS_DIR / "results" / "startup.json",
+    baseline: Path = BENCHMARKS_DIR / "startup-baseline.json",
+    save_baseline: bool = False,
+    tolerance: float = typer.Option(0.2, help="relative change accepted before reporting a regression"),
+    budget: float = typer.Option(None, help="the import time (ms) not to exceed"),
+):
+    results = run(module, runs=runs, top=top)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=4))
+
+    stored = json.loads(baseline.read_text()) if baseline.exists() else None
+    if stored and stored.get("module") != module:
+        stored = None
+    print_results(results, stored)
+    typer.echo(f"Saved the results to {output}.")
+    if budget is not None and results["total_ms"] > budget:
+        typer.echo(f"Startup over budget: {results['total_ms']:.1f} ms, budget {budget:.1f} ms", err=True)
+        raise typer.Exit(code=1)
+
+    if save_baseline:
+        baseline.write_text(json.dumps(results, indent=4))
+        typer.echo(f"Saved the results as baseline to {baseline}.")
+        return
+    if stored and results["total_ms"] > stored["total_ms"] * (1 + tolerance):
+        typer.echo(f"Startup regressed: {results['total_ms']:.1f} ms, baseline {stored['total_ms']:.1f} ms", err=True)
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
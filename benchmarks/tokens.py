@@ -0,0 +1,114 @@
+"""
+Encode and decode throughput of the jwt backends (`cryptography.TokenCodec`), per algorithm.
+
+    python -m benchmarks.tokens --seconds 1 --algorithms HS256 ES256 EdDSA
+
+"jose (per call)" is python-jose called like before the codecs: the raw key parsed and the algorithm list built
+on every call. Backends that are not installed (pyjwt) or don't support an algorithm (jose: EdDSA) are skipped.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import typer
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jose import jwt as jose_jwt
+from rich.console import Console
+from rich.table import Table
+
+from application.apps.authentication.cryptography import TOKEN_CODECS, create_token_codec
+
+
+SECRET_KEY = "benchmark-secret-key-benchmark-secret-key"
+PRIVATE_KEYS = {
+    "ES256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "EdDSA": ed25519.Ed25519PrivateKey.generate,
+}
+
+
+def pem(algorithm: str) -> dict:
+    if algorithm not in PRIVATE_KEYS:
+        return {}
+    private_key = PRIVATE_KEYS[algorithm]()
+    return {
+        "private_key": private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ).decode(),
+        "public_key": private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode(),
+    }
+
+
+def claims() -> dict:
+    return {
+        "sub": "alice@acid.net",
+        "scopes": ["users/whoami"],
+        "scm": 2,
+        "exp": datetime.utcnow() + timedelta(minutes=15),
+    }
+
+
+def throughput(operation: Callable, seconds: float) -> float:
+    """Calls per second, in batches until the time is up."""
+    calls, batch = 0, 10
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        for _ in range(batch):
+            operation()
+        calls += batch
+        batch = min(batch * 2, 1000)
+    return calls / elapsed
+
+
+def run(algorithms: List[str], seconds: float) -> List[dict]:
+    results = []
+    for algorithm in algorithms:
+        keys = pem(algorithm)
+        candidates = {}
+        for backend in TOKEN_CODECS:
+            try:
+                candidates[backend] = create_token_codec(backend, algorithm, secret_key=SECRET_KEY, **keys)
+            except (ImportError, ValueError) as error:
+                typer.echo(f"Skipping {backend} {algorithm}: {error}", err=True)
+
+        for backend, codec in candidates.items():
+            token = codec.encode(claims())
+            results.append({
+                "backend": backend,
+                "algorithm": algorithm,
+                "encode_per_s": throughput(lambda: codec.encode(claims()), seconds),
+                "decode_per_s": throughput(lambda: codec.decode(token), seconds),
+            })
+
+        if algorithm.startswith("HS") or algorithm == "ES256":
+            key = SECRET_KEY if algorithm.startswith("HS") else keys["private_key"]
+            verifying = SECRET_KEY if algorithm.startswith("HS") else keys["public_key"]
+            token = jose_jwt.encode(claims(), key, algorithm=algorithm)
+            results.append({
+                "backend": "jose (per call)",
+                "algorithm": algorithm,
+                "encode_per_s": throughput(lambda: jose_jwt.encode(claims(), key, algorithm=algorithm), seconds),
+                "decode_per_s": throughput(lambda: jose_jwt.decode(token, verifying, algorithms=[algorithm]), seconds),
+            })
+    return results
+
+
+def main(
+    algorithms: List[str] = typer.Option(["HS256", "ES256", "EdDSA"]),
+    seconds: float = typer.Option(1.0, help="per backend, algorithm and operation"),
+):
+    table = Table(title=f"jwt throughput, {seconds:.1f}s per measurement")
+    for column in ("algorithm", "backend", "encode/s", "decode/s"):
+        table.add_column(column, justify="right" if column.endswith("/s") else "left")
+    for result in run(algorithms, seconds):
+        table.add_row(
+            result["algorithm"], result["backend"],
+            f"{result['encode_per_s']:,.0f}", f"{result['decode_per_s']:,.0f}",
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
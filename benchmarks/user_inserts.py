@@ -0,0 +1,90 @@
+"""
+Insert latency of `crud.create_user` on a growing user table.
+
+    python -m benchmarks.user_inserts --sizes 0 --sizes 10000 --sizes 100000
+
+The email's uniqueness is checked by the unique index on `user.email`,
+so the latency per insert should stay flat, no matter how many users already exist.
+Bcrypt rounds are lowered for the run, to not measure the password hashing.
+"""
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import typer
+from rich.console import Console
+from rich.table import Table
+from sqlmodel import SQLModel, Session, create_engine
+
+from application.apps.authentication import crud
+from application.apps.authentication.cryptography import (
+    password_hashing_options, pwd_context, hash_password, generate_uuid,
+)
+from application.apps.authentication.models import User, UserCreate
+from application.apps.authentication.scopes import scope_registry
+
+
+FILL_BATCH_SIZE = 10_000
+
+
+def fill_users(session: Session, start: int, stop: int, password: str):
+    """Bulk insert dummy users [start, stop) bypassing the ORM."""
+    scope_mask = scope_registry.mask("unauthorized")
+    for offset in range(start, stop, FILL_BATCH_SIZE):
+        rows = [
+            dict(uid=generate_uuid(), email=f"filler-{i}@example.com", name=f"Filler {i}", password=password,
+                 scopes="unauthorized", scope_mask=scope_mask, disabled=True, superuser=False)
+            for i in range(offset, min(offset + FILL_BATCH_SIZE, stop))
+        ]
+        session.execute(User.__table__.insert(), rows)
+        session.commit()
+
+
+def measure_inserts(session: Session, size: int, inserts: int) -> List[float]:
+    """Return the latencies (in ms) of `inserts` calls of `crud.create_user`."""
+    latencies = []
+    for i in range(inserts):
+        user = UserCreate(email=f"bench-{size}-{i}@example.com", name="Bench", password="bench")
+        start = time.perf_counter()
+        crud.create_user(session=session, user=user)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(sizes: List[int], inserts: int = 200) -> List[dict]:
+    """Measure the insert latency for every table size in `sizes`."""
+    pwd_context.load(password_hashing_options("bcrypt", "minimum", rounds=4))
+    password = hash_password("filler")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            filled = 0
+            for size in sorted(sizes):
+                fill_users(session, start=filled, stop=size, password=password)
+                filled = max(filled, size)
+                latencies = measure_inserts(session, size=size, inserts=inserts)
+                results.append({
+                    "size": size,
+                    "mean_ms": statistics.mean(latencies),
+                    "p95_ms": statistics.quantiles(latencies, n=20)[-1],
+                })
+        engine.dispose()
+    return results
+
+
+def main(sizes: List[int] = typer.Option([0, 1_000, 10_000, 100_000]), inserts: int = 200):
+    table = Table(title=f"crud.create_user ({inserts} inserts per size)")
+    table.add_column("users in table", justify="right")
+    table.add_column("mean (ms)", justify="right")
+    table.add_column("p95 (ms)", justify="right")
+    for result in run(sizes=sizes, inserts=inserts):
+        table.add_row(f"{result['size']:,}", f"{result['mean_ms']:.3f}", f"{result['p95_ms']:.3f}")
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -3,27 +3,18 @@
 
 """Typer cli interface to manage the dev-environment"""
 
+import os
 import subprocess
+import sys
 import webbrowser
 from pathlib import Path
 import json
 
-from sqlmodel import Session
 import typer
-import uvicorn
 
-from rich import inspect
-from rich.console import Console
-from rich.markdown import Markdown
-
-from pydantic.error_wrappers import ValidationError
-
-from application.config import settings as app_settings
-from application.apps.authentication import crud
-from application.apps.authentication.models import UserCreate
-from application.database.dependencies import get_session
-from application.database.sqlmodel import manually_create_all_tables
-from application.apps.authentication.exceptions import bypass_email_validation_error
+# Only the standard library and typer are imported here, `cc --help`, `cc readme` or `cc black` stay fast
+# and leave the database, the logging and the application alone.
+# Commands import what they need (the application, uvicorn, rich) themselves, see `cc profile-startup`.
 
 
 #----------CONFIG--------------------------------------------------------------
@@ -192,6 +183,9 @@ def serve(port: int = 8000, host: str = "127.0.0.1", log_level: str = "info", re
 @cli.command()
 def readme():
     """README"""
+    from rich.console import Console
+    from rich.markdown import Markdown
+
     console = Console()
     with open("README.md") as readme:
         markdown = Markdown(readme.read())
@@ -200,6 +194,9 @@ def readme():
 @cli.command()
 def settings():
     """debugging output"""
+    from rich import inspect
+    from application.config import settings as app_settings
+
     inspect(app_settings)
 
 
@@ -352,7 +349,14 @@ def create_user(
         echo(f"{create_user.__doc__}", fg_color=typer.colors.WHITE)
         return
 
-    session: Session = next(get_session())
+    from pydantic.error_wrappers import ValidationError
+    from rich import inspect
+    from application.apps.authentication import crud
+    from application.apps.authentication.exceptions import bypass_email_validation_error
+    from application.apps.authentication.models import UserCreate
+    from application.database.dependencies import get_session
+
+    session = next(get_session())
     new_user = UserCreate(
         email=email,
         password=password,
@@ -371,6 +375,146 @@ def create_user(
     echo(f"Created user: {db_user.email}")
     return db_user
 
+@cli.command()
+def import_users(
+    path: Path,
+    format: str = typer.Option(None, help="csv or jsonl, default: by the file's suffix"),
+    chunk_size: int = 1000,
+    workers: int = os.cpu_count() or 1,
+):
+    """
+    Bulk import users from a csv (with a header) or a json-lines file.
+    Columns: email, name, password (or hashed_password), scopes, disabled, superuser
+
+    Example:
+    cc import-users users.csv --workers 8
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from application.apps.authentication import bulk
+    from application.database.dependencies import get_session
+
+    format = format or bulk.guess_format(path.name)
+    session = next(get_session())
+
+    def progress(report: bulk.ImportReport):
+        echo(f"{report.processed} processed, {report.created} created, {len(report.errors)} failed")
+
+    with open(path, newline="", encoding="utf-8") as file, ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = bulk.read_rows(file, format)
+        report = bulk.import_users(session, rows, chunk_size=chunk_size, executor=executor, progress=progress)
+
+    for error in report.errors[:20]:
+        echo(f"line {error['line']} ({error['email']}): {error['error']}", fg_color=typer.colors.RED)
+    if report.errors:
+        errors_path = path.with_suffix(".errors.jsonl")
+        errors_path.write_text("".join(json.dumps(error) + "\n" for error in report.errors))
+        echo(f"All {len(report.errors)} errors: {errors_path}", fg_color=typer.colors.RED)
+    echo(f"Created {report.created} users.", fg_color=typer.colors.GREEN)
+
+@cli.command()
+def export_users(
+    path: Path,
+    format: str = typer.Option(None, help="csv or jsonl, default: by the file's suffix"),
+    hashed_passwords: bool = typer.Option(False, help="include the password hashes, to import the users elsewhere"),
+):
+    """
+    Export all users to a csv or json-lines file.
+
+    Example:
+    cc export-users users.jsonl
+    """
+    from application.apps.authentication import bulk
+    from application.database.dependencies import get_session
+
+    format = format or bulk.guess_format(path.name)
+    session = next(get_session())
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        file.writelines(bulk.export_users(session, format, hashed_passwords=hashed_passwords))
+    echo(f"Exported the users to {path}.")
+
+@cli.command()
+def calibrate_hashing(
+    scheme: str = typer.Option("bcrypt", help="bcrypt or argon2"),
+    target_ms: float = typer.Option(250, help="the time a hash may take on this host"),
+    samples: int = 3,
+):
+    """
+    Measure the password hashing costs on this host and recommend the strongest within --target-ms.
+    Put the recommendation into the settings, existing hashes are updated on the users' next login.
+
+    Example:
+    cc calibrate-hashing --scheme argon2 --target-ms 100
+    """
+    from passlib.exc import MissingBackendError
+    from rich.console import Console
+    from rich.table import Table
+    from application.config import settings as app_settings
+    from application.apps.authentication.cryptography import calibrate_password_hashing
+
+    try:
+        results = calibrate_password_hashing(scheme, target=target_ms / 1000, samples=samples)
+    except MissingBackendError as error:
+        echo(f"{error}", fg_color=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+    workers = app_settings.PASSWORD_HASHING_WORKERS
+    table = Table(title=f"{scheme}, median of {samples} hashes, {workers} hashing workers")
+    for column in ("parameters", "ms per hash", "logins/s"):
+        table.add_column(column, justify="left" if column == "parameters" else "right")
+    for parameters, duration in results:
+        description = ", ".join(f"{key}={value}" for key, value in parameters.items())
+        style = "green" if duration * 1000 <= target_ms else "red"
+        table.add_row(description, f"{duration * 1000:.1f}", f"{workers / duration:.0f}", style=style)
+    Console().print(table)
+
+    # the most expensive within the target: the most memory (argon2), then the most rounds
+    within = [parameters for parameters, duration in results if duration * 1000 <= target_ms]
+    if not within:
+        echo(f"No {scheme} parameters hash within {target_ms:.0f} ms on this host.", fg_color=typer.colors.RED)
+        raise typer.Exit(code=1)
+    best = max(within, key=lambda parameters: (parameters.get("memory_cost", 0), parameters["rounds"]))
+    echo("Recommended settings:", fg_color=typer.colors.GREEN)
+    echo(f"PASSWORD_HASHING_SCHEME={scheme}")
+    if scheme == "bcrypt":
+        echo(f"PASSWORD_BCRYPT_ROUNDS={best['rounds']}")
+    else:
+        echo(f"PASSWORD_ARGON2_TIME_COST={best['rounds']}")
+        echo(f"PASSWORD_ARGON2_MEMORY_COST={best['memory_cost']}")
+        echo(f"PASSWORD_ARGON2_PARALLELISM={best['parallelism']}")
+
+# ---------- BENCHMARKS --------------------------------------------------------
+@cli.command(context_settings={"allow_extra_args": True, "ignore_unknown_options": True})
+def bench(ctx: typer.Context):
+    """
+    Benchmark the authentication endpoints against a temporary database.
+    Options are passed to `python -m benchmarks` (see --help there).
+
+    Example:
+    cc bench --server gunicorn --workers 4 --requests 1000
+    """
+    command = [sys.executable, "-m", "benchmarks", *ctx.args]
+    if DEBUG:
+        echo(f">>> Running command: {' '.join(command)}")
+    raise typer.Exit(code=subprocess.run(command, cwd=CWD).returncode)
+
+@cli.command(context_settings={"allow_extra_args": True, "ignore_unknown_options": True})
+def profile_startup(
+    ctx: typer.Context,
+    module: str = typer.Option("commands", help="e.g. application.main, what every server worker imports"),
+):
+    """
+    Import-time breakdown of a module: the total, the slowest modules and the application's packages.
+    Options are passed to `python -m benchmarks.startup` (see --help there).
+
+    Example:
+    cc profile-startup --budget 150
+    cc profile-startup --module application.main --top 30
+    """
+    command = [sys.executable, "-m", "benchmarks.startup", "--module", module, *ctx.args]
+    if DEBUG:
+        echo(f">>> Running command: {' '.join(command)}")
+    raise typer.Exit(code=subprocess.run(command, cwd=CWD).returncode)
+
 # ---------- MANAGE THE SERVER -------------------------------------------------
 @cli.command()
 def run(
@@ -392,6 +536,7 @@ def run(
         docs_serve()
         return
 
+    import uvicorn
     uvicorn.run(
         "application.main:app",
         host=host,
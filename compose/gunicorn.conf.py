@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration, used by compose/start.sh.
+
+The workers share their prometheus metrics through the files in PROMETHEUS_MULTIPROC_DIR,
+see `application.common.metrics`. start.sh empties the directory before the app is (pre)loaded.
+"""
+import os
+
+from prometheus_client import multiprocess
+
+
+bind = "0.0.0.0:8000"
+workers = 4
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 300
+preload_app = True
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a dead worker (requests in progress, pool connections in use and capacity)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -21,4 +21,8 @@ cd /app
 # run uvicorn over gunicorn in docker in production
 # https://www.uvicorn.org/#running-with-gunicorn
 # replaces: uvicorn application.main:app --reload
-gunicorn application.main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --timeout 300 --preload
+# the workers share their prometheus metrics through this directory,
+# emptied on start: the files of a previous run would be aggregated
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+gunicorn application.main:app --config compose/gunicorn.conf.py
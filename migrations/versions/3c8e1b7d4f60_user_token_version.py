@@ -0,0 +1,27 @@
+"""'user token version'
+
+Revision ID: 3c8e1b7d4f60
+Revises: 9a3d5f1c7e2b
+Create Date: 2026-10-18 17:02:41.518207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e1b7d4f60'
+down_revision = '9a3d5f1c7e2b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the tokens issued so far carry no version and stay valid until they expire
+    op.add_column('user', sa.Column('token_version', sa.Integer(), nullable=True, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('token_version')
@@ -0,0 +1,31 @@
+"""'lean user indexes'
+
+Revision ID: 5e2b7c9d1a4f
+Revises: c1f6a0e2b9d4
+Create Date: 2026-10-18 14:03:17.482915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2b7c9d1a4f'
+down_revision = 'c1f6a0e2b9d4'
+branch_labels = None
+depends_on = None
+
+
+# nobody looks users up by these, the uid is indexed by its primary key already
+UNUSED_INDEXES = ('uid', 'name', 'password', 'scopes', 'disabled', 'superuser')
+
+
+def upgrade():
+    for column in UNUSED_INDEXES:
+        op.drop_index(op.f(f'ix_user_{column}'), table_name='user')
+
+
+def downgrade():
+    for column in UNUSED_INDEXES:
+        op.create_index(op.f(f'ix_user_{column}'), 'user', [column], unique=False)
@@ -0,0 +1,44 @@
+"""'user scope mask'
+
+Revision ID: 9a3d5f1c7e2b
+Revises: 5e2b7c9d1a4f
+Create Date: 2026-10-18 15:21:09.734410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from application.apps.authentication.scopes import scope_registry
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3d5f1c7e2b'
+down_revision = '5e2b7c9d1a4f'
+branch_labels = None
+depends_on = None
+
+
+user = sa.table(
+    'user', sa.column('uid', sa.String), sa.column('scopes', sa.String), sa.column('scope_mask', sa.Integer),
+)
+
+
+def upgrade():
+    op.add_column('user', sa.Column('scope_mask', sa.Integer(), nullable=True, server_default='0'))
+    # compiles the scopes of every user with the current VALID_SCOPES, run it again to rebuild the masks
+    # (downgrade -1, upgrade +1) after scopes have been reordered or removed
+    connection = op.get_bind()
+    masks = {}
+    for uid, scopes in connection.execute(sa.select(user.c.uid, user.c.scopes)):
+        masks.setdefault(scope_registry.mask(scopes), []).append(uid)
+    for mask, uids in masks.items():
+        for offset in range(0, len(uids), 500):
+            connection.execute(
+                user.update().where(user.c.uid.in_(uids[offset:offset + 500])).values(scope_mask=mask)
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('scope_mask')
@@ -0,0 +1,28 @@
+"""'unique user email'
+
+Revision ID: c1f6a0e2b9d4
+Revises: 78b54447b60e
+Create Date: 2026-10-18 10:12:41.203117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1f6a0e2b9d4'
+down_revision = '78b54447b60e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # replaces the plain email index, fails if the table already holds duplicated emails
+    op.drop_index(op.f('ix_user_email'), table_name='user')
+    op.create_index(op.f('ix_user_email'), 'user', ['email'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_email'), table_name='user')
+    op.create_index(op.f('ix_user_email'), 'user', ['email'], unique=False)
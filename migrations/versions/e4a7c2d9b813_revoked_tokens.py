@@ -0,0 +1,39 @@
+"""'revoked tokens'
+
+Revision ID: e4a7c2d9b813
+Revises: 3c8e1b7d4f60
+Create Date: 2026-10-18 18:11:07.204315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2d9b813'
+down_revision = '3c8e1b7d4f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'revokedtoken',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('subject', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('revoked_at', sa.Float(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_revokedtoken_jti'), 'revokedtoken', ['jti'], unique=False)
+    op.create_index(op.f('ix_revokedtoken_revoked_at'), 'revokedtoken', ['revoked_at'], unique=False)
+    op.create_index(op.f('ix_revokedtoken_expires_at'), 'revokedtoken', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_revokedtoken_expires_at'), table_name='revokedtoken')
+    op.drop_index(op.f('ix_revokedtoken_revoked_at'), table_name='revokedtoken')
+    op.drop_index(op.f('ix_revokedtoken_jti'), table_name='revokedtoken')
+    op.drop_table('revokedtoken')